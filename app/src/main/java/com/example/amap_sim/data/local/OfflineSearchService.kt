@@ -11,6 +11,8 @@ import kotlinx.coroutines.sync.Mutex
 import kotlinx.coroutines.sync.withLock
 import kotlinx.coroutines.withContext
 import java.io.File
+import java.nio.ByteBuffer
+import java.nio.ByteOrder
 
 /**
  * 离线搜索服务
@@ -19,8 +21,10 @@ import java.io.File
  * 
  * 功能：
  * - 关键词搜索（支持模糊匹配）
- * - 附近搜索（基于距离）
+ * - 附近搜索（基于距离，可按密度直方图估算返回约 K 个结果的半径）
+ * - 范围内各分类数量（筛选项计数）
  * - 分类搜索
+ * - 分类排行（评分最高 / 最知名）
  * - 热门推荐
  * 
  * 数据库表结构：
@@ -40,22 +44,98 @@ class OfflineSearchService(
         
         // 地球半径（米），用于距离计算
         private const val EARTH_RADIUS = 6371000.0
+        
+        // 网格范围查询最多扫描的网格行数（与 extract_poi.py 的 GRID_MAX_ROWS 一致）
+        private const val GRID_MAX_ROWS = 16
+        
+        // 分类排行方式（poi_leaderboard.metric，与 extract_poi.py 的 LEADERBOARD_METRICS 一致）
+        const val RANK_BY_RATING = "rating"
+        const val RANK_BY_PROMINENCE = "prominence"
+        
+        // 全城排行榜的单元编号（extract_poi.py 的 LEADERBOARD_CITY）
+        private const val LEADERBOARD_CITY = -1L
+        
+        // 按密度直方图估算半径：从中心单元向外最多扩 DENSITY_BLOCK 格，结果乘以余量系数
+        // （与 poi_query.py 的 DENSITY_BLOCK / KNN_RADIUS_MARGIN 一致）
+        private const val DENSITY_BLOCK = 2
+        private const val RADIUS_MARGIN = 1.3
+        private const val METERS_PER_DEGREE = EARTH_RADIUS * Math.PI / 180.0
+        
+        // 预计算出行时间的出行方式（extract_poi.py --travel-time）
+        const val TRAVEL_MODE_WALK = "walk"
+        const val TRAVEL_MODE_BIKE = "bike"
+        const val TRAVEL_MODE_CAR = "car"
+        
+        // 起点与锚点相距不超过此距离时使用该锚点的预计算结果
+        private const val TRAVEL_ANCHOR_MATCH_METERS = 200.0
+        
+        // 汉字串 / 其他字母数字串，与 extract_poi.py 的 _TOKEN_RE 一致
+        private val TOKEN_REGEX = Regex(
+            "([\\u3400-\\u4dbf\\u4e00-\\u9fff\\uf900-\\ufaff]+)|" +
+                "([\\p{L}\\p{N}_&&[^\\u3400-\\u4dbf\\u4e00-\\u9fff\\uf900-\\ufaff]]+)"
+        )
     }
     
     private var database: SQLiteDatabase? = null
     private val initMutex = Mutex()
     private var isInitialized = false
     
+    // poi_fts 是否带 search_tokens 列（extract_poi.py --fts-tokenizer bigram）
+    private var hasBigramIndex = false
+    
+    // 网格单元分辨率（extract_poi.py 生成的 cell_<level> 列），为空表示旧版数据库
+    private var gridLevels: List<Int> = emptyList()
+    
+    // 自动补全建议表的最大前缀长度，0 表示没有建议表（extract_poi.py --suggest）
+    private var suggestPrefixLen = 0
+    
+    // 分类排行榜每榜条数和网格分辨率，0 表示没有排行榜表（extract_poi.py --leaderboard）
+    private var leaderboardTopN = 0
+    private var leaderboardLevel = 0
+    
+    // 密度直方图的网格分辨率（从粗到细），为空表示没有 poi_density 表
+    private var densityLevels: List<Int> = emptyList()
+    
+    // 预计算出行时间的出行方式，为空表示没有 poi_travel_time 表
+    private var travelModes: List<String> = emptyList()
+    
+    // poi.travel_time 对应的出行方式（extract_poi.py --travel-display-mode），旧数据库为空
+    private var travelDisplayMode: String? = null
+    
+    // 精简输出（extract_poi.py --size-profile compact）的分类 ID → 名称，为空表示分类以名称存储
+    private var categoryNames: Map<Long, String> = emptyMap()
+    private var categoryIds: Map<String, Long> = emptyMap()
+    
+    // 全文索引是否保存词位置（detail=none 时不支持短语查询）
+    private var ftsPhraseQuery = true
+    
+    // poi 表中的主分类列
+    private val categoryColumn: String
+        get() = if (categoryNames.isEmpty()) Columns.MAIN_CATEGORY else Columns.MAIN_CATEGORY_ID
+    
+    // 附近搜索读取的列（默认输出中均包含在网格覆盖索引中）
+    private val nearbyColumns: String
+        get() = "id, name, ${categorySelect()}, lat, lon, address, phone, " +
+            "opening_hours, description, travel_time, rating"
+    
     // 数据库表和列名
     private object Tables {
         const val POI = "poi"
         const val POI_FTS = "poi_fts"
+        const val POI_SUGGEST = "poi_suggest"
+        const val POI_LEADERBOARD = "poi_leaderboard"
+        const val POI_DENSITY = "poi_density"
+        const val POI_TRAVEL_TIME = "poi_travel_time"
+        const val TRAVEL_ANCHORS = "travel_anchors"
+        const val METADATA = "metadata"
+        const val CATEGORY_NAMES = "category_names"
     }
     
     private object Columns {
         const val ID = "id"
         const val NAME = "name"
         const val MAIN_CATEGORY = "main_category"
+        const val MAIN_CATEGORY_ID = "main_category_id"
         const val SUB_CATEGORY = "sub_category"
         const val LAT = "lat"
         const val LON = "lon"
@@ -117,7 +197,64 @@ class OfflineSearchService(
         val tableExists = cursor.use { it.count > 0 }
         require(tableExists) { "POI 表不存在" }
         
-        Log.d(TAG, "数据库验证通过")
+        // 检查是否为二元组全文索引
+        hasBigramIndex = db.rawQuery("PRAGMA table_info(${Tables.POI_FTS})", null).use { c ->
+            val nameIndex = c.getColumnIndex("name")
+            generateSequence { if (c.moveToNext()) c.getString(nameIndex) else null }
+                .any { it == "search_tokens" }
+        }
+        
+        // 检查自动补全建议表
+        suggestPrefixLen = try {
+            db.rawQuery(
+                "SELECT value FROM ${Tables.METADATA} WHERE key = 'suggest_prefix_len'",
+                null
+            ).use { c -> if (c.moveToFirst()) c.getString(0).toIntOrNull() ?: 0 else 0 }
+        } catch (e: Exception) {
+            0
+        }
+        
+        // 检查网格单元列
+        gridLevels = try {
+            db.rawQuery(
+                "SELECT value FROM ${Tables.METADATA} WHERE key = 'grid_levels'",
+                null
+            ).use { c ->
+                if (c.moveToFirst()) c.getString(0).split(",").mapNotNull { it.trim().toIntOrNull() } else emptyList()
+            }
+        } catch (e: Exception) {
+            emptyList()
+        }
+        
+        // 精简输出：分类名称表和 FTS detail 选项
+        val metadata = try {
+            db.rawQuery(
+                "SELECT key, value FROM ${Tables.METADATA} " +
+                    "WHERE key IN ('size_profile', 'fts_detail', 'leaderboard_top_n', 'leaderboard_level', " +
+                    "'density_levels', 'travel_modes', 'travel_display_mode')",
+                null
+            ).use { c ->
+                generateSequence { if (c.moveToNext()) c.getString(0) to c.getString(1) else null }.toMap()
+            }
+        } catch (e: Exception) {
+            emptyMap()
+        }
+        ftsPhraseQuery = metadata["fts_detail"] != "none"
+        leaderboardTopN = metadata["leaderboard_top_n"]?.toIntOrNull() ?: 0
+        leaderboardLevel = metadata["leaderboard_level"]?.toIntOrNull() ?: 0
+        densityLevels = metadata["density_levels"].orEmpty().split(",").mapNotNull { it.trim().toIntOrNull() }.sorted()
+        travelModes = metadata["travel_modes"].orEmpty().split(",").map { it.trim() }.filter { it.isNotEmpty() }
+        travelDisplayMode = metadata["travel_display_mode"]
+        if (metadata["size_profile"] == "compact") {
+            categoryNames = db.rawQuery("SELECT id, name FROM ${Tables.CATEGORY_NAMES}", null).use { c ->
+                generateSequence { if (c.moveToNext()) c.getLong(0) to c.getString(1) else null }.toMap()
+            }
+            categoryIds = categoryNames.entries.associate { (id, name) -> name to id }
+        }
+        
+        Log.d(TAG, "数据库验证通过, bigram 索引: $hasBigramIndex, 建议前缀长度: $suggestPrefixLen, " +
+            "网格: $gridLevels, 分类 ID: ${categoryNames.size}, 短语查询: $ftsPhraseQuery, " +
+            "排行榜: $leaderboardTopN, 密度直方图: $densityLevels, 出行时间: $travelModes")
     }
     
     /**
@@ -125,6 +262,12 @@ class OfflineSearchService(
      */
     fun isReady(): Boolean = isInitialized && database != null
     
+    /**
+     * poi.travel_time（PoiResult.travelTime）对应的出行方式（TRAVEL_MODE_*），
+     * 数据库没有记录时为空
+     */
+    fun getTravelDisplayMode(): String? = travelDisplayMode
+    
     /**
      * 关键词搜索
      * 
@@ -151,8 +294,8 @@ class OfflineSearchService(
             val ftsResults = searchFts(db, keyword, limit * 2)
             results.addAll(ftsResults)
             
-            // 如果 FTS 结果不足，用 LIKE 补充
-            if (results.size < limit) {
+            // 如果 FTS 结果不足，用 LIKE 补充（二元组索引已覆盖任意子串，无需补充）
+            if (!hasBigramIndex && results.size < limit) {
                 val likeResults = searchLike(db, keyword, limit - results.size, results.map { it.id })
                 results.addAll(likeResults)
             }
@@ -175,6 +318,98 @@ class OfflineSearchService(
         }
     }
     
+    /**
+     * 输入联想（每次按键调用）
+     * 
+     * 关键词不超过建议表前缀长度时，在 poi_suggest 主键上做一次点查询取出预先排好序的
+     * POI ID；否则（或数据库没有建议表时）退回关键词搜索。建议表只有名称前缀匹配且每个
+     * 前缀最多保留 suggest_top 条，不足 limit 条时用关键词搜索补上名称中间匹配的结果
+     * （如“酒店”匹配“汉口江滩酒店”），排在建议表结果之后
+     * 
+     * @param keyword 当前输入
+     * @param limit 返回结果数量限制
+     * @param center 中心点（用于计算距离）
+     * @return POI 结果列表（按建议排名，之后为关键词搜索结果）
+     */
+    suspend fun suggest(
+        keyword: String,
+        limit: Int = DEFAULT_LIMIT,
+        center: LatLng? = null
+    ): Result<List<PoiResult>> {
+        // 与 extract_poi.py 的 normalize_suggest_text 一致
+        val prefix = keyword.filterNot { it.isWhitespace() }.lowercase()
+        if (suggestPrefixLen == 0 || prefix.isEmpty() || prefix.length > suggestPrefixLen) {
+            return searchByKeyword(keyword, limit, center)
+        }
+        
+        val suggested = withContext(Dispatchers.IO) {
+            try {
+                val db = database
+                requireNotNull(db) { "搜索服务未初始化" }
+                
+                val ids = db.rawQuery(
+                    "SELECT poi_ids FROM ${Tables.POI_SUGGEST} WHERE prefix = ?",
+                    arrayOf(prefix)
+                ).use { c -> if (c.moveToFirst()) decodePoiIds(c.getBlob(0)) else emptyList() }
+                    .take(limit)
+                
+                // 保持建议表中的排名顺序
+                Result.success(loadPoisByIds(db, ids, center))
+            } catch (e: Exception) {
+                Log.e(TAG, "输入联想失败", e)
+                Result.failure(e)
+            }
+        }.getOrElse { return Result.failure(it) }
+        
+        if (suggested.size >= limit) {
+            return Result.success(suggested)
+        }
+        
+        // 关键词搜索失败时仍返回建议表结果
+        val seen = suggested.mapTo(HashSet()) { it.id }
+        val more = searchByKeyword(keyword, limit, center).getOrNull().orEmpty()
+            .filter { it.id !in seen }
+            .take(limit - suggested.size)
+        return Result.success(suggested + more)
+    }
+    
+    /**
+     * 按 ID 读取 POI，保持 ids 的顺序；给出 center 时计算距离
+     */
+    private fun loadPoisByIds(db: SQLiteDatabase, ids: List<Long>, center: LatLng?): List<PoiResult> {
+        if (ids.isEmpty()) {
+            return emptyList()
+        }
+        
+        val query = """
+            SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
+                   ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
+                   opening_hours, description, travel_time, rating
+            FROM ${Tables.POI}
+            WHERE ${Columns.ID} IN (${ids.joinToString(",")})
+        """.trimIndent()
+        
+        val byId = mutableMapOf<Long, PoiResult>()
+        db.rawQuery(query, null).use { cursor ->
+            while (cursor.moveToNext()) {
+                val poi = cursorToPoi(cursor)
+                byId[poi.id] = poi
+            }
+        }
+        
+        return ids.mapNotNull { byId[it] }.map { poi ->
+            if (center != null) poi.copy(distance = center.distanceTo(poi.location)) else poi
+        }
+    }
+    
+    /**
+     * 解码建议表中的 POI ID 列表（小端 uint32 数组）
+     */
+    private fun decodePoiIds(blob: ByteArray): List<Long> {
+        val buffer = ByteBuffer.wrap(blob).order(ByteOrder.LITTLE_ENDIAN)
+        return List(blob.size / 4) { buffer.int.toLong() and 0xFFFFFFFFL }
+    }
+    
     /**
      * FTS 全文搜索
      */
@@ -196,7 +431,7 @@ class OfflineSearchService(
             
             // FTS 搜索（匹配名称或地址）
             val ftsQuery = """
-                SELECT p.${Columns.ID}, p.${Columns.NAME}, p.${Columns.MAIN_CATEGORY},
+                SELECT p.${Columns.ID}, p.${Columns.NAME}, ${categorySelect("p.")},
                        p.${Columns.LAT}, p.${Columns.LON}, p.${Columns.ADDRESS}, p.${Columns.PHONE},
                        p.opening_hours, p.description, p.travel_time, p.rating
                 FROM ${Tables.POI} p
@@ -206,7 +441,10 @@ class OfflineSearchService(
             """.trimIndent()
             
             // FTS5 搜索语法：使用 * 进行前缀匹配
-            val searchTerm = "${keyword}*"
+            val searchTerm = if (hasBigramIndex) buildBigramQuery(keyword, ftsPhraseQuery) else "${keyword}*"
+            if (searchTerm.isBlank()) {
+                return results
+            }
             
             db.rawQuery(ftsQuery, arrayOf(searchTerm, limit.toString())).use { cursor ->
                 while (cursor.moveToNext()) {
@@ -220,6 +458,25 @@ class OfflineSearchService(
         return results
     }
     
+    /**
+     * 为二元组索引构造 FTS5 查询（与 extract_poi.py 的 cjk_fts_query 一致）
+     * 
+     * 多个汉字组成二元组短语，单个汉字和其他词做前缀匹配，例如
+     * "江滩酒店" -> "江滩 滩酒 酒店"，"店" -> "店"*；
+     * phrase 为 false 时（detail=none 的索引）二元组之间为 AND："江滩" "滩酒" "酒店"
+     */
+    private fun buildBigramQuery(keyword: String, phrase: Boolean): String {
+        return TOKEN_REGEX.findAll(keyword).joinToString(" ") { match ->
+            val cjk = match.groupValues[1]
+            when {
+                cjk.isEmpty() -> "\"${match.value}\"*"
+                cjk.length == 1 -> "\"$cjk\"*"
+                phrase -> cjk.windowed(2).joinToString(" ", prefix = "\"", postfix = "\"")
+                else -> cjk.windowed(2).joinToString(" ") { "\"$it\"" }
+            }
+        }
+    }
+    
     /**
      * LIKE 模糊搜索（作为后备方案）
      */
@@ -238,7 +495,7 @@ class OfflineSearchService(
         }
         
         val query = """
-            SELECT ${Columns.ID}, ${Columns.NAME}, ${Columns.MAIN_CATEGORY},
+            SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
                    ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
                    opening_hours, description, travel_time, rating
             FROM ${Tables.POI}
@@ -290,14 +547,14 @@ class OfflineSearchService(
             val maxLon = center.lon + lonRange
             
             val categoryClause = if (category != null) {
-                "AND ${Columns.MAIN_CATEGORY} = ?"
+                "AND $categoryColumn = ?"
             } else {
                 ""
             }
             
             // 使用 Haversine 公式计算精确距离
             val query = """
-                SELECT ${Columns.ID}, ${Columns.NAME}, ${Columns.MAIN_CATEGORY},
+                SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
                        ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
                        (6371000 * acos(
                            cos(radians(?)) * cos(radians(${Columns.LAT})) *
@@ -324,7 +581,7 @@ class OfflineSearchService(
             )
             
             if (category != null) {
-                args.add(category)
+                args.add(categoryArg(category))
             }
             
             args.add(radius.toString())
@@ -334,7 +591,7 @@ class OfflineSearchService(
             
             // 简化查询（不使用 SQLite 的数学函数，改为在代码中计算距离）
             val simpleQuery = """
-                SELECT ${Columns.ID}, ${Columns.NAME}, ${Columns.MAIN_CATEGORY},
+                SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
                        ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
                        opening_hours, description, travel_time, rating
                 FROM ${Tables.POI}
@@ -350,10 +607,17 @@ class OfflineSearchService(
                 maxLon.toString()
             )
             if (category != null) {
-                simpleArgs.add(category)
+                simpleArgs.add(categoryArg(category))
+            }
+            
+            // 有网格单元列时改用覆盖索引上的范围扫描
+            val (nearbyQuery, nearbyArgs) = if (gridLevels.isNotEmpty()) {
+                buildGridQuery(minLat, maxLat, minLon, maxLon, category)
+            } else {
+                simpleQuery to simpleArgs.toTypedArray()
             }
             
-            db.rawQuery(simpleQuery, simpleArgs.toTypedArray()).use { cursor ->
+            db.rawQuery(nearbyQuery, nearbyArgs).use { cursor ->
                 Log.d(TAG, "数据库查询返回 ${cursor.count} 条记录")
                 while (cursor.moveToNext()) {
                     val poi = cursorToPoi(cursor)
@@ -377,6 +641,191 @@ class OfflineSearchService(
         }
     }
     
+    /**
+     * 估算包含约 k 个 POI 的附近搜索半径（与 poi_query.py 的 estimate_radius 一致）
+     * 
+     * 从密度直方图最细一级的中心单元开始，逐圈扩大到 5 × 5 个单元，再换更粗一级，
+     * 第一个 POI 数达到 k 的范围按平均密度换算半径，且不小于此前不足 k 个的范围的内切圆半径。
+     * 没有密度直方图时返回 defaultRadius
+     * 
+     * @param center 中心点坐标
+     * @param k 期望的结果数量
+     * @param category 分类过滤（可选）
+     * @param defaultRadius 没有密度直方图时的半径（米）
+     * @return 搜索半径（米），不超过 MAX_RADIUS_METERS
+     */
+    suspend fun estimateNearbyRadius(
+        center: LatLng,
+        k: Int = DEFAULT_LIMIT,
+        category: String? = null,
+        defaultRadius: Double = DEFAULT_RADIUS_METERS
+    ): Double = withContext(Dispatchers.IO) {
+        val db = database
+        if (db == null || densityLevels.isEmpty()) {
+            return@withContext defaultRadius
+        }
+        try {
+            val categoryClause = if (category != null) "AND $categoryColumn = ?" else ""
+            val query = "SELECT SUM(count) FROM ${Tables.POI_DENSITY} " +
+                "WHERE level = ? AND cell BETWEEN ? AND ? $categoryClause"
+            val scale = Math.cos(Math.toRadians(center.lat))
+            var lower = 0.0
+            for (level in densityLevels.reversed()) {
+                val n = 1L shl level
+                val y = (center.lat + 90.0) * n
+                val x = (center.lon + 180.0) * n
+                val row = y.toLong()
+                val col = x.toLong()
+                for (b in 0..DENSITY_BLOCK) {
+                    var total = 0L
+                    for (r in row - b..row + b) {
+                        val args = mutableListOf(
+                            level.toString(),
+                            (r * 360L * n + col - b).toString(),
+                            (r * 360L * n + col + b).toString()
+                        )
+                        if (category != null) args.add(categoryArg(category))
+                        total += db.rawQuery(query, args.toTypedArray()).use { c ->
+                            if (c.moveToFirst()) c.getLong(0) else 0L
+                        }
+                    }
+                    if (total >= k) {
+                        val side = (2 * b + 1).toDouble() / n * METERS_PER_DEGREE
+                        val radius = Math.sqrt(k * side * side * scale / (Math.PI * total)) * RADIUS_MARGIN
+                        return@withContext maxOf(radius, lower).coerceAtMost(MAX_RADIUS_METERS)
+                    }
+                    // 不足 k 个：以中心点为圆心、在该范围内的圆里也不足 k 个，第 k 近的点一定更远
+                    val inner = minOf(
+                        minOf(y - (row - b), row + b + 1 - y),
+                        minOf(x - (col - b), col + b + 1 - x) * scale
+                    ) / n * METERS_PER_DEGREE
+                    lower = maxOf(lower, inner)
+                }
+            }
+            MAX_RADIUS_METERS
+        } catch (e: Exception) {
+            Log.e(TAG, "估算搜索半径失败", e)
+            defaultRadius
+        }
+    }
+    
+    /**
+     * 附近各主分类的 POI 数量（用于筛选项计数）
+     * 
+     * 有密度直方图时按与半径矩形相交的单元统计（边缘单元整格计入，为近似值），
+     * 选用覆盖范围不超过 GRID_MAX_ROWS 行的最细一级；否则按坐标现场统计
+     * 
+     * @param center 中心点坐标
+     * @param radiusMeters 半径（米）
+     * @return 分类名称 → POI 数量
+     */
+    suspend fun countCategoriesNearby(
+        center: LatLng,
+        radiusMeters: Double = DEFAULT_RADIUS_METERS
+    ): Result<Map<String, Int>> = withContext(Dispatchers.IO) {
+        try {
+            val db = database
+            requireNotNull(db) { "搜索服务未初始化" }
+            
+            val latRange = radiusMeters / EARTH_RADIUS * (180.0 / Math.PI)
+            val lonRange = radiusMeters / (EARTH_RADIUS * Math.cos(Math.toRadians(center.lat))) * (180.0 / Math.PI)
+            val counts = mutableMapOf<String, Int>()
+            
+            fun collect(cursor: Cursor) = cursor.use { c ->
+                while (c.moveToNext()) {
+                    val category = c.getString(0)?.let { categoryName(it) } ?: continue
+                    counts[category] = (counts[category] ?: 0) + c.getInt(1)
+                }
+            }
+            
+            if (densityLevels.isEmpty()) {
+                val query = """
+                    SELECT $categoryColumn, COUNT(*) FROM ${Tables.POI}
+                    WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+                    GROUP BY $categoryColumn
+                """.trimIndent()
+                val args = listOf(center.lat - latRange, center.lat + latRange, center.lon - lonRange, center.lon + lonRange)
+                collect(db.rawQuery(query, args.map { it.toString() }.toTypedArray()))
+            } else {
+                val level = densityLevels.lastOrNull { level ->
+                    val n = 1L shl level
+                    ((center.lat + latRange + 90.0) * n).toLong() - ((center.lat - latRange + 90.0) * n).toLong() < GRID_MAX_ROWS
+                } ?: densityLevels.first()
+                val n = 1L shl level
+                val row0 = ((center.lat - latRange + 90.0) * n).toLong()
+                val row1 = ((center.lat + latRange + 90.0) * n).toLong()
+                val col0 = ((center.lon - lonRange + 180.0) * n).toLong()
+                val col1 = ((center.lon + lonRange + 180.0) * n).toLong()
+                val query = """
+                    SELECT $categoryColumn, SUM(count) FROM ${Tables.POI_DENSITY}
+                    WHERE level = ? AND cell BETWEEN ? AND ?
+                    GROUP BY $categoryColumn
+                """.trimIndent()
+                for (row in row0..row1) {
+                    val args = arrayOf(level.toString(), (row * 360L * n + col0).toString(), (row * 360L * n + col1).toString())
+                    collect(db.rawQuery(query, args))
+                }
+            }
+            
+            Log.d(TAG, "附近分类数量: $counts")
+            Result.success(counts)
+        } catch (e: Exception) {
+            Log.e(TAG, "统计附近分类数量失败", e)
+            Result.failure(e)
+        }
+    }
+    
+    /**
+     * 构造网格范围查询（与 extract_poi.py 的 grid_cell_ranges / grid_nearby_sql 一致）
+     * 
+     * 选择扫描行数不超过 GRID_MAX_ROWS 的最细分辨率，每行网格的单元编号连续，
+     * 对应覆盖索引上的一次范围扫描，各行用 UNION ALL 拼接
+     */
+    private fun buildGridQuery(
+        minLat: Double,
+        maxLat: Double,
+        minLon: Double,
+        maxLon: Double,
+        category: String?
+    ): Pair<String, Array<String>> {
+        val levels = gridLevels.sorted()
+        var level = levels.first()
+        for (candidate in levels.reversed()) {
+            val n = 1L shl candidate
+            val rows = ((maxLat + 90.0) * n).toLong() - ((minLat + 90.0) * n).toLong()
+            if (rows < GRID_MAX_ROWS) {
+                level = candidate
+                break
+            }
+        }
+        
+        val n = 1L shl level
+        val row0 = ((minLat + 90.0) * n).toLong()
+        val row1 = ((maxLat + 90.0) * n).toLong()
+        val col0 = ((minLon + 180.0) * n).toLong()
+        val col1 = ((maxLon + 180.0) * n).toLong()
+        val perRow = 360L * n
+        val column = "cell_$level"
+        
+        var branch = "SELECT $nearbyColumns FROM ${Tables.POI} INDEXED BY idx_poi_$column " +
+            "WHERE $column BETWEEN ? AND ?"
+        if (category != null) {
+            branch += " AND $categoryColumn = ?"
+        }
+        
+        val args = mutableListOf<String>()
+        for (row in row0..row1) {
+            args.add((row * perRow + col0).toString())
+            args.add((row * perRow + col1).toString())
+            if (category != null) {
+                args.add(categoryArg(category))
+            }
+        }
+        
+        val query = List((row1 - row0 + 1).toInt()) { branch }.joinToString("\nUNION ALL\n")
+        return query to args.toTypedArray()
+    }
+    
     /**
      * 分类搜索
      * 
@@ -398,17 +847,17 @@ class OfflineSearchService(
             Log.d(TAG, "分类搜索: $category, limit=$limit")
             
             val query = """
-                SELECT ${Columns.ID}, ${Columns.NAME}, ${Columns.MAIN_CATEGORY},
+                SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
                        ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
                        opening_hours, description, travel_time, rating
                 FROM ${Tables.POI}
-                WHERE ${Columns.MAIN_CATEGORY} = ?
+                WHERE $categoryColumn = ?
                 LIMIT ?
             """.trimIndent()
             
             val results = mutableListOf<PoiResult>()
             
-            db.rawQuery(query, arrayOf(category, (limit * 2).toString())).use { cursor ->
+            db.rawQuery(query, arrayOf(categoryArg(category), (limit * 2).toString())).use { cursor ->
                 while (cursor.moveToNext()) {
                     results.add(cursorToPoi(cursor))
                 }
@@ -432,6 +881,92 @@ class OfflineSearchService(
         }
     }
     
+    /**
+     * 分类排行：评分最高（RANK_BY_RATING）或最知名（RANK_BY_PROMINENCE）的 POI
+     * 
+     * 数据库带排行榜表（extract_poi.py --leaderboard）时，对覆盖范围内的每个网格单元在
+     * poi_leaderboard 主键上做一次范围扫描，取出预先排好序的 POI ID；
+     * 没有排行榜表时评分排行退回按分类现场排序
+     * 
+     * @param category 分类名称
+     * @param rankBy 排行方式
+     * @param center 中心点，给出时只看覆盖 radiusMeters 矩形的网格单元（约 3.5 公里），否则为全城排行
+     * @param radiusMeters 覆盖半径（米），0 表示只看中心点所在单元
+     * @param limit 返回结果数量限制（有排行榜表时不超过每榜条数）
+     * @return POI 结果列表（按排名顺序）
+     */
+    suspend fun searchTopInCategory(
+        category: String,
+        rankBy: String = RANK_BY_RATING,
+        center: LatLng? = null,
+        radiusMeters: Double = 0.0,
+        limit: Int = DEFAULT_LIMIT
+    ): Result<List<PoiResult>> = withContext(Dispatchers.IO) {
+        try {
+            val db = database
+            requireNotNull(db) { "搜索服务未初始化" }
+            require(category.isNotBlank()) { "分类不能为空" }
+            
+            Log.d(TAG, "分类排行: $category, rankBy=$rankBy, center=$center, radius=${radiusMeters}m")
+            
+            // 覆盖半径矩形的网格单元（与 poi_query.py 的 leaderboard_cells 一致）
+            val level = if (leaderboardTopN > 0) leaderboardLevel else gridLevels.minOrNull() ?: 5
+            val n = 1L shl level
+            var cells = listOf(LEADERBOARD_CITY)
+            var bounds: List<Double>? = null
+            if (center != null) {
+                val latRange = radiusMeters / EARTH_RADIUS * (180.0 / Math.PI)
+                val lonRange = radiusMeters / (EARTH_RADIUS * Math.cos(Math.toRadians(center.lat))) * (180.0 / Math.PI)
+                val row0 = ((center.lat - latRange + 90.0) * n).toLong()
+                val row1 = ((center.lat + latRange + 90.0) * n).toLong()
+                val col0 = ((center.lon - lonRange + 180.0) * n).toLong()
+                val col1 = ((center.lon + lonRange + 180.0) * n).toLong()
+                cells = (row0..row1).flatMap { row -> (col0..col1).map { col -> row * 360L * n + col } }
+                bounds = listOf(
+                    row0.toDouble() / n - 90.0, (row1 + 1).toDouble() / n - 90.0,
+                    col0.toDouble() / n - 180.0, (col1 + 1).toDouble() / n - 180.0
+                )
+            }
+            
+            val results = if (leaderboardTopN > 0) {
+                val query = """
+                    SELECT poi_id FROM ${Tables.POI_LEADERBOARD}
+                    WHERE $categoryColumn = ? AND metric = ? AND cell IN (${cells.joinToString(",")})
+                    ORDER BY score DESC, poi_id
+                    LIMIT ?
+                """.trimIndent()
+                val ids = db.rawQuery(query, arrayOf(categoryArg(category), rankBy, limit.toString())).use { c ->
+                    generateSequence { if (c.moveToNext()) c.getLong(0) else null }.toList()
+                }
+                loadPoisByIds(db, ids, center)
+            } else {
+                require(rankBy == RANK_BY_RATING) { "知名度排行需要排行榜表" }
+                val boundsClause = if (bounds != null) "AND lat >= ? AND lat < ? AND lon >= ? AND lon < ?" else ""
+                val query = """
+                    SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
+                           ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
+                           opening_hours, description, travel_time, rating
+                    FROM ${Tables.POI}
+                    WHERE $categoryColumn = ? AND rating IS NOT NULL $boundsClause
+                    ORDER BY rating DESC, ${Columns.ID}
+                    LIMIT ?
+                """.trimIndent()
+                val args = listOf(categoryArg(category)) + bounds.orEmpty().map { it.toString() } + limit.toString()
+                db.rawQuery(query, args.toTypedArray()).use { cursor ->
+                    generateSequence { if (cursor.moveToNext()) cursorToPoi(cursor) else null }.toList()
+                }.map { poi ->
+                    if (center != null) poi.copy(distance = center.distanceTo(poi.location)) else poi
+                }
+            }
+            
+            Log.i(TAG, "分类排行完成: ${results.size} 条结果")
+            Result.success(results)
+        } catch (e: Exception) {
+            Log.e(TAG, "分类排行失败", e)
+            Result.failure(e)
+        }
+    }
+    
     /**
      * 获取所有可用分类
      */
@@ -441,18 +976,18 @@ class OfflineSearchService(
             requireNotNull(db) { "搜索服务未初始化" }
             
             val query = """
-                SELECT DISTINCT ${Columns.MAIN_CATEGORY}
+                SELECT DISTINCT $categoryColumn
                 FROM ${Tables.POI}
-                ORDER BY ${Columns.MAIN_CATEGORY}
             """.trimIndent()
             
             val categories = mutableListOf<String>()
             
             db.rawQuery(query, null).use { cursor ->
                 while (cursor.moveToNext()) {
-                    cursor.getString(0)?.let { categories.add(it) }
+                    cursor.getString(0)?.let { categories.add(categoryName(it)) }
                 }
             }
+            categories.sort()
             
             Log.d(TAG, "获取分类列表: ${categories.size} 个")
             
@@ -465,16 +1000,22 @@ class OfflineSearchService(
     
     /**
      * 获取热门分类及其 POI 数量
+     * 
+     * 有密度直方图时汇总最粗一级的计数（几十行），不再对 poi 表分组计数
      */
     suspend fun getPopularCategories(): Result<List<Pair<String, Int>>> = withContext(Dispatchers.IO) {
         try {
             val db = database
             requireNotNull(db) { "搜索服务未初始化" }
             
+            val source = if (densityLevels.isEmpty()) {
+                "SELECT $categoryColumn, COUNT(*) as count FROM ${Tables.POI}"
+            } else {
+                "SELECT $categoryColumn, SUM(count) as count FROM ${Tables.POI_DENSITY} WHERE level = ${densityLevels.first()}"
+            }
             val query = """
-                SELECT ${Columns.MAIN_CATEGORY}, COUNT(*) as count
-                FROM ${Tables.POI}
-                GROUP BY ${Columns.MAIN_CATEGORY}
+                $source
+                GROUP BY $categoryColumn
                 ORDER BY count DESC
                 LIMIT 10
             """.trimIndent()
@@ -483,7 +1024,7 @@ class OfflineSearchService(
             
             db.rawQuery(query, null).use { cursor ->
                 while (cursor.moveToNext()) {
-                    val category = cursor.getString(0) ?: continue
+                    val category = cursor.getString(0)?.let { categoryName(it) } ?: continue
                     val count = cursor.getInt(1)
                     categories.add(category to count)
                 }
@@ -496,6 +1037,59 @@ class OfflineSearchService(
         }
     }
     
+    /**
+     * 获取预计算的出行时间
+     * 
+     * 数据库带出行时间表（extract_poi.py --travel-time）时，读取从锚点出发到该 POI 的
+     * 步行、骑行、驾车时间；未指定起点时使用第一个单点锚点（默认位置），
+     * 指定起点时只使用与起点相距 TRAVEL_ANCHOR_MATCH_METERS 以内的锚点
+     * 
+     * @param poiId POI ID
+     * @param origin 起点，为空时使用默认锚点
+     * @return 出行方式（TRAVEL_MODE_*）→ 秒数；没有预计算结果时为空
+     */
+    suspend fun getTravelTimes(
+        poiId: Long,
+        origin: LatLng? = null
+    ): Result<Map<String, Int>> = withContext(Dispatchers.IO) {
+        try {
+            val db = database
+            requireNotNull(db) { "搜索服务未初始化" }
+            
+            if (travelModes.isEmpty()) {
+                return@withContext Result.success(emptyMap())
+            }
+            
+            // 单点锚点（多源锚点没有坐标）
+            val anchors = db.rawQuery(
+                "SELECT id, lat, lon FROM ${Tables.TRAVEL_ANCHORS} WHERE lat IS NOT NULL ORDER BY id",
+                null
+            ).use { c ->
+                generateSequence { if (c.moveToNext()) c.getLong(0) to LatLng(c.getDouble(1), c.getDouble(2)) else null }.toList()
+            }
+            val anchorId = if (origin == null) {
+                anchors.firstOrNull()?.first
+            } else {
+                anchors.map { (id, location) -> id to origin.distanceTo(location) }
+                    .filter { it.second <= TRAVEL_ANCHOR_MATCH_METERS }
+                    .minByOrNull { it.second }?.first
+            } ?: return@withContext Result.success(emptyMap())
+            
+            val times = db.rawQuery(
+                "SELECT mode, seconds FROM ${Tables.POI_TRAVEL_TIME} WHERE anchor_id = ? AND poi_id = ?",
+                arrayOf(anchorId.toString(), poiId.toString())
+            ).use { c ->
+                generateSequence { if (c.moveToNext()) c.getString(0) to c.getInt(1) else null }.toMap()
+            }
+            
+            Log.d(TAG, "出行时间: poi=$poiId, anchor=$anchorId, $times")
+            Result.success(times)
+        } catch (e: Exception) {
+            Log.e(TAG, "获取出行时间失败", e)
+            Result.failure(e)
+        }
+    }
+    
     /**
      * 根据 ID 获取 POI 详情
      */
@@ -505,7 +1099,7 @@ class OfflineSearchService(
             requireNotNull(db) { "搜索服务未初始化" }
             
             val query = """
-                SELECT ${Columns.ID}, ${Columns.NAME}, ${Columns.MAIN_CATEGORY},
+                SELECT ${Columns.ID}, ${Columns.NAME}, ${categorySelect()},
                        ${Columns.LAT}, ${Columns.LON}, ${Columns.ADDRESS}, ${Columns.PHONE},
                        opening_hours, description, travel_time, rating
                 FROM ${Tables.POI}
@@ -549,6 +1143,24 @@ class OfflineSearchService(
         }
     }
     
+    /**
+     * 查询主分类的列表达式（精简输出中读取分类 ID，列名统一为 main_category）
+     */
+    private fun categorySelect(prefix: String = ""): String =
+        "$prefix$categoryColumn AS ${Columns.MAIN_CATEGORY}"
+    
+    /**
+     * 分类过滤条件的参数：精简输出中为分类 ID（未知分类用 -1，不匹配任何记录）
+     */
+    private fun categoryArg(category: String): String =
+        if (categoryNames.isEmpty()) category else (categoryIds[category] ?: -1L).toString()
+    
+    /**
+     * 主分类列的值转换为分类名称
+     */
+    private fun categoryName(value: String): String =
+        if (categoryNames.isEmpty()) value else value.toLongOrNull()?.let { categoryNames[it] } ?: value
+    
     /**
      * 从游标读取 POI 数据
      */
@@ -565,7 +1177,7 @@ class OfflineSearchService(
         return PoiResult(
             id = id,
             name = name,
-            category = cursor.getString(cursor.getColumnIndexOrThrow(Columns.MAIN_CATEGORY)) ?: "",
+            category = cursor.getString(cursor.getColumnIndexOrThrow(Columns.MAIN_CATEGORY))?.let { categoryName(it) } ?: "",
             lat = cursor.getDouble(cursor.getColumnIndexOrThrow(Columns.LAT)),
             lon = cursor.getDouble(cursor.getColumnIndexOrThrow(Columns.LON)),
             address = cursor.getStringOrNull(Columns.ADDRESS),
@@ -28,17 +28,7 @@ data class RouteResult(
     /**
      * 获取格式化的时间字符串
      */
-    fun getFormattedTime(): String {
-        val totalMinutes = (time / 60000).toInt()
-        return when {
-            totalMinutes < 60 -> "${totalMinutes}分钟"
-            else -> {
-                val hours = totalMinutes / 60
-                val minutes = totalMinutes % 60
-                if (minutes > 0) "${hours}小时${minutes}分钟" else "${hours}小时"
-            }
-        }
-    }
+    fun getFormattedTime(): String = formatMinutes((time / 60000).toInt())
     
     /**
      * 获取路线边界框
@@ -64,6 +54,22 @@ data class RouteResult(
             maxLon = maxLon
         )
     }
+    
+    companion object {
+        /**
+         * 分钟数格式化为“X分钟”或“X小时Y分钟”（路线结果和详情页的预计算出行时间共用）
+         */
+        fun formatMinutes(totalMinutes: Int): String {
+            return when {
+                totalMinutes < 60 -> "${totalMinutes}分钟"
+                else -> {
+                    val hours = totalMinutes / 60
+                    val minutes = totalMinutes % 60
+                    if (minutes > 0) "${hours}小时${minutes}分钟" else "${hours}小时"
+                }
+            }
+        }
+    }
 }
 
 /**
@@ -58,7 +58,9 @@ import androidx.compose.ui.text.font.FontWeight
 import androidx.compose.ui.text.style.TextOverflow
 import androidx.compose.ui.unit.dp
 import androidx.lifecycle.viewmodel.compose.viewModel
+import com.example.amap_sim.data.local.OfflineSearchService
 import com.example.amap_sim.domain.model.PoiResult
+import com.example.amap_sim.domain.model.RouteResult
 import com.example.amap_sim.ui.screen.mapcontainer.MapStateController
 import com.example.amap_sim.ui.theme.AmapBlue
 import com.example.amap_sim.ui.theme.Gray400
@@ -181,6 +183,8 @@ private fun DetailOverlayContent(
                 PoiDetailCard(
                     poi = uiState.poi,
                     isFavorite = uiState.isFavorite,
+                    travelTimes = uiState.travelTimes,
+                    travelTimeMode = uiState.travelTimeMode,
                     onEvent = onEvent,
                     onNavigateToNearby = onNavigateToNearby,
                     modifier = Modifier.align(Alignment.BottomCenter)
@@ -262,6 +266,8 @@ private fun TopBar(
 private fun PoiDetailCard(
     poi: PoiResult,
     isFavorite: Boolean,
+    travelTimes: Map<String, Int>,
+    travelTimeMode: String?,
     onEvent: (DetailEvent) -> Unit,
     onNavigateToNearby: (Double, Double, String) -> Unit,
     modifier: Modifier = Modifier
@@ -350,11 +356,12 @@ private fun PoiDetailCard(
 
             Spacer(modifier = Modifier.height(12.dp))
 
-            // 驾车距离和时间
+            // 距离和 poi.travel_time 的出行时间（数据库未记录出行方式时按原来的驾车显示）
             poi.getFormattedDistance()?.let { distance ->
                 poi.travelTime?.let { time ->
+                    val label = TRAVEL_MODE_LABELS.toMap()[travelTimeMode] ?: "驾车"
                     Text(
-                        text = "驾车 $distance $time",
+                        text = "$label $distance $time",
                         style = MaterialTheme.typography.titleMedium,
                         fontWeight = FontWeight.Bold,
                         color = MaterialTheme.colorScheme.onSurface
@@ -363,6 +370,19 @@ private fun PoiDetailCard(
                 }
             }
             
+            // 从默认位置出发的步行 / 骑行 / 驾车时间（离线预计算）
+            // 秒数按四舍五入取整分钟，不足 1 分钟按 1 分钟
+            val travelSummary = TRAVEL_MODE_LABELS.mapNotNull { (mode, label) ->
+                travelTimes[mode]?.let { "$label ${RouteResult.formatMinutes(maxOf(1, (it + 30) / 60))}" }
+            }
+            if (travelSummary.isNotEmpty()) {
+                Text(
+                    text = travelSummary.joinToString(" · "),
+                    style = MaterialTheme.typography.bodyMedium,
+                    color = Gray500
+                )
+            }
+            
             Spacer(modifier = Modifier.height(16.dp))
             
             // 地址信息
@@ -642,3 +662,11 @@ private fun ErrorContent(
     }
 }
 
+/**
+ * 预计算出行时间的出行方式及其显示名称（按显示顺序）
+ */
+private val TRAVEL_MODE_LABELS = listOf(
+    OfflineSearchService.TRAVEL_MODE_WALK to "步行",
+    OfflineSearchService.TRAVEL_MODE_BIKE to "骑行",
+    OfflineSearchService.TRAVEL_MODE_CAR to "驾车"
+)
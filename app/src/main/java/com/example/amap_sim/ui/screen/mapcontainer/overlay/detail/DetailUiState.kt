@@ -14,6 +14,10 @@ data class DetailUiState(
     val error: String? = null,
     /** 是否已收藏 */
     val isFavorite: Boolean = false,
+    /** 从默认位置出发的预计算出行时间（出行方式 → 秒数），数据库没有出行时间表时为空 */
+    val travelTimes: Map<String, Int> = emptyMap(),
+    /** poi.travelTime 对应的出行方式（OfflineSearchService.TRAVEL_MODE_*），数据库未记录时为空 */
+    val travelTimeMode: String? = null,
     /** 地图更新信息（由 ViewModel 计算） */
     val mapUpdate: DetailMapUpdate? = null,
     /** 是否显示电话确认对话框 */
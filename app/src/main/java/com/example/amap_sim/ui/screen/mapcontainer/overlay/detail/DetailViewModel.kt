@@ -41,6 +41,9 @@ class DetailViewModel : ViewModel() {
     // 当前 POI ID
     private var currentPoiId: String = ""
     
+    // 默认位置（与搜索页相同），出行时间只取该位置附近的预计算锚点
+    private val defaultCenter = LatLng(30.5928, 114.3055)
+    
     init {
         observePoiChanges()
     }
@@ -140,12 +143,15 @@ class DetailViewModel : ViewModel() {
                     if (poi != null) {
                         val favorites = userDataManager.getFavorites()
                         val isFavorite = favorites.contains(currentPoiId)
+                        val travelTimes = searchService.getTravelTimes(id, defaultCenter).getOrNull().orEmpty()
                         _uiState.update {
                             it.copy(
                                 isLoading = false,
                                 poi = poi,
                                 error = null,
                                 isFavorite = isFavorite,
+                                travelTimes = travelTimes,
+                                travelTimeMode = searchService.getTravelDisplayMode(),
                                 mapUpdate = null // 由 observePoiChanges 自动计算
                             )
                         }
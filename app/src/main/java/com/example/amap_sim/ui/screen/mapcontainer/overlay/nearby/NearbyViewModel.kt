@@ -204,6 +204,26 @@ class NearbyViewModel : ViewModel() {
 
                 Log.d(TAG, "加载 ${category.displayName} 排行榜")
 
+                // 评分排行：数据库带排行榜表时为预先排好的前 N 名，一次主键查询即可
+                val topRated = searchService.searchTopInCategory(
+                    category = category.dbCategory,
+                    rankBy = OfflineSearchService.RANK_BY_RATING,
+                    center = center,
+                    radiusMeters = 10000.0,
+                    limit = 10
+                ).getOrNull().orEmpty().filter { it.rating != null && it.rating > 0 }
+                if (topRated.size >= 10) {
+                    _uiState.update {
+                        it.copy(
+                            rankingList = topRated,
+                            isLoading = false
+                        )
+                    }
+                    Log.d(TAG, "${category.displayName} 排行榜加载完成（评分排行）: ${topRated.size} 个结果")
+                    return@launch
+                }
+
+                // 评分数据不足 10 条时按附近搜索结果混合排序
                 val result = searchService.searchNearby(
                     center = center,
                     radiusMeters = 10000.0, // 扩大搜索范围到10km
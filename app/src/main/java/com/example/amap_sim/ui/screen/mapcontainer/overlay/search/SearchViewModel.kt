@@ -154,7 +154,7 @@ class SearchViewModel : ViewModel() {
         // 防抖搜索
         searchJob = viewModelScope.launch {
             delay(SEARCH_DEBOUNCE_MS)
-            performSearchInternal(query)
+            performSearchInternal(query, typeAhead = true)
         }
     }
     
@@ -177,8 +177,10 @@ class SearchViewModel : ViewModel() {
     
     /**
      * 内部搜索实现
+     * 
+     * @param typeAhead 输入过程中的联想查询，优先使用预计算的建议表
      */
-    private suspend fun performSearchInternal(query: String) {
+    private suspend fun performSearchInternal(query: String, typeAhead: Boolean = false) {
         _uiState.update { it.copy(isLoading = true, error = null) }
         
         try {
@@ -198,11 +200,19 @@ class SearchViewModel : ViewModel() {
                 }
             }
             
-            val result = searchService.searchByKeyword(
-                keyword = query,
-                limit = 50,
-                center = defaultCenter
-            )
+            val result = if (typeAhead) {
+                searchService.suggest(
+                    keyword = query,
+                    limit = 50,
+                    center = defaultCenter
+                )
+            } else {
+                searchService.searchByKeyword(
+                    keyword = query,
+                    limit = 50,
+                    center = defaultCenter
+                )
+            }
             
             if (result.isSuccess) {
                 val pois = result.getOrNull() ?: emptyList()
@@ -81,11 +81,20 @@ class WaypointViewModel : ViewModel() {
                     return@launch
                 }
                 
-                val result = searchService.searchNearby(
+                // 按密度直方图选半径，城区不必扫描整个 5 公里范围；估算偏小时再按 5 公里查一次
+                val radius = searchService.estimateNearbyRadius(defaultCenter, k = 10, defaultRadius = 5000.0)
+                var result = searchService.searchNearby(
                     center = defaultCenter,
-                    radiusMeters = 5000.0,
+                    radiusMeters = radius,
                     limit = 10
                 )
+                if (radius < 5000.0 && (result.getOrNull()?.size ?: 0) < 10) {
+                    result = searchService.searchNearby(
+                        center = defaultCenter,
+                        radiusMeters = 5000.0,
+                        limit = 10
+                    )
+                }
                 
                 result.onSuccess { locations ->
                     _uiState.update { it.copy(suggestedLocations = locations) }
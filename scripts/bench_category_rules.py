@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分类规则微基准
+对比编译后的 CategoryRules.classify 与旧版逐标签拼接字符串的 _get_category
+
+使用方法：
+    python3 bench_category_rules.py
+    python3 bench_category_rules.py --count 500000 --categories poi_categories.json
+"""
+
+import argparse
+import random
+import time
+from typing import Dict, List, Optional
+
+from extract_poi import CategoryRules, DEFAULT_CATEGORIES_FILE
+
+
+def legacy_get_category(categories: Dict[str, str], tags: Dict[str, str]) -> Optional[str]:
+    """旧版实现：每个标签构造两个字符串并查表，结果取决于标签顺序"""
+    for tag_key, tag_value in tags.items():
+        key = f"{tag_key}={tag_value}"
+        if key in categories:
+            return categories[key]
+
+        wildcard_key = f"{tag_key}=*"
+        if wildcard_key in categories:
+            return categories[wildcard_key]
+
+    return None
+
+
+def make_samples(rules: CategoryRules, count: int, seed: int = 42) -> List[Dict[str, str]]:
+    """
+    生成带标签对象样本：大部分是道路、建筑等无关对象，少量命中规则
+    """
+    rng = random.Random(seed)
+    rule_tags = [rule.split('=', 1) for rule in rules.categories]
+    noise = [
+        {'highway': 'residential'},
+        {'highway': 'footway', 'surface': 'paved'},
+        {'building': 'yes'},
+        {'building': 'yes', 'building:levels': '6'},
+        {'landuse': 'farmland'},
+        {'natural': 'tree'},
+        {'barrier': 'gate'},
+        {'power': 'tower', 'ref': '12'},
+    ]
+
+    samples = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            key, value = rng.choice(rule_tags)
+            if value == CategoryRules.WILDCARD:
+                value = 'variety_store'
+            tags = {'name': '测试', 'addr:street': '解放大道', key: value}
+            if rng.random() < 0.1:
+                tags['shop'] = 'bakery'
+        else:
+            tags = dict(rng.choice(noise))
+        samples.append(tags)
+    return samples
+
+
+def bench(name: str, func, samples: List[Dict[str, str]]) -> float:
+    start = time.perf_counter()
+    for tags in samples:
+        func(tags)
+    elapsed = time.perf_counter() - start
+    ns_per_op = elapsed / len(samples) * 1e9
+    print(f"  {name:<24} {elapsed:8.3f} s  {ns_per_op:8.1f} ns/次")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POI 分类规则微基准')
+    parser.add_argument('-n', '--count', type=int, default=200000, help='样本数量')
+    parser.add_argument('-c', '--categories', default=DEFAULT_CATEGORIES_FILE, help='分类规则配置文件')
+    args = parser.parse_args()
+
+    rules = CategoryRules.load(args.categories)
+    samples = make_samples(rules, args.count)
+
+    print(f"规则数: {len(rules.categories)}, 标签键: {len(rules.keys)}, 样本数: {len(samples)}")
+    legacy = bench('legacy _get_category', lambda t: legacy_get_category(rules.categories, t), samples)
+    compiled = bench('CategoryRules.classify', rules.classify, samples)
+    print(f"  加速比: {legacy / compiled:.2f}x")
+
+    # 旧实现依赖标签顺序，统计分类结果不一致的样本
+    diff = 0
+    for tags in samples:
+        old = legacy_get_category(rules.categories, tags)
+        new = rules.classify(tags)
+        if (old is None) != (new is None) or (new and old.split('|')[:2] != list(new)):
+            diff += 1
+    print(f"  分类结果不同的样本: {diff}（旧实现按标签顺序取第一个匹配）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路径中心点计算对比
+在同一次读取中对每条带标签的路径分别计算：
+  - loop:   原来的实现，Python 循环读取 w.nodes 全部坐标求平均（封闭路径的首尾节点计两次）
+  - native: 当前实现（extract_poi.way_center），osmium 原生生成 WKB，numpy 向量运算求面积加权质心
+报告每条路径的耗时、两者结果的距离，以及中心点落在面外的路径数
+
+默认生成合成数据：每条路径是一个矩形，一条边按 --dense-vertices 个节点密集绘制，
+其余三条边只有角点，模拟大面积 landuse=residential 等节点疏密不均的面。
+
+使用方法：
+    python3 bench_centroid.py
+    python3 bench_centroid.py --ways 20000 --dense-vertices 500
+    python3 bench_centroid.py --pbf temp/wuhan.osm.pbf
+"""
+
+import argparse
+import math
+import os
+import random
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+import osmium
+import osmium.geom
+import shapely
+
+from extract_poi import METERS_PER_DEGREE, way_center
+
+
+def legacy_way_center(w) -> Optional[Tuple[float, float]]:
+    """原来的 POIHandler._way_center"""
+    lats = []
+    lons = []
+    for node in w.nodes:
+        if node.location.valid():
+            lats.append(node.location.lat)
+            lons.append(node.location.lon)
+    if not lats or not lons:
+        return None
+    return sum(lats) / len(lats), sum(lons) / len(lons)
+
+
+def generate(path: str, ways: int, dense_vertices: int, seed: int = 1):
+    """生成矩形路径，南边按 dense_vertices 个节点密集绘制，其余三边只有角点"""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    node_id = 0
+    try:
+        for way_id in range(1, ways + 1):
+            lon = rng.uniform(114.0, 114.6)
+            lat = rng.uniform(30.3, 30.8)
+            width = rng.uniform(0.002, 0.02)
+            height = rng.uniform(0.002, 0.02)
+            points = [(lon + width * i / dense_vertices, lat) for i in range(dense_vertices)]
+            points += [(lon + width, lat), (lon + width, lat + height), (lon, lat + height)]
+            refs = []
+            for location in points:
+                node_id += 1
+                writer.add_node(osmium.osm.mutable.Node(id=node_id, location=location))
+                refs.append(node_id)
+            writer.add_way(osmium.osm.mutable.Way(
+                id=way_id, nodes=refs + [refs[0]], tags={'landuse': 'residential', 'name': f'小区{way_id}'}
+            ))
+    finally:
+        writer.close()
+
+
+class CentroidBench(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.factory = osmium.geom.WKBFactory()
+        self.seconds = {'loop': 0.0, 'native': 0.0}
+        self.offsets: List[float] = []
+        self.outside = {'loop': 0, 'native': 0}
+        self.ways = 0
+        self.vertices = 0
+
+    def way(self, w):
+        if not w.tags or len(w.nodes) < 2:
+            return
+
+        start = time.perf_counter()
+        old = legacy_way_center(w)
+        middle = time.perf_counter()
+        try:
+            new = way_center(self.factory.create_linestring(w), w.is_closed())
+        except (osmium.InvalidLocationError, RuntimeError):
+            return
+        end = time.perf_counter()
+        if old is None or new is None:
+            return
+
+        self.seconds['loop'] += middle - start
+        self.seconds['native'] += end - middle
+        self.ways += 1
+        self.vertices += len(w.nodes)
+        scale = math.cos(math.radians(new[0]))
+        self.offsets.append(math.hypot(old[0] - new[0], (old[1] - new[1]) * scale) * METERS_PER_DEGREE)
+
+        if w.is_closed() and len(w.nodes) >= 4:
+            polygon = shapely.polygons(shapely.get_coordinates(shapely.from_wkb(self.factory.create_linestring(w))))
+            for name, (lat, lon) in (('loop', old), ('native', new)):
+                if not shapely.contains_xy(polygon, lon, lat):
+                    self.outside[name] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='路径中心点计算对比（Python 循环 vs 原生几何）')
+    parser.add_argument('--pbf', help='使用已有的 PBF 文件（默认生成合成数据）')
+    parser.add_argument('--ways', type=int, default=5000, help='合成数据路径数')
+    parser.add_argument('--dense-vertices', type=int, default=200, help='合成路径密集边的节点数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    args = parser.parse_args()
+
+    pbf = args.pbf
+    if not pbf:
+        pbf = os.path.join(tempfile.gettempdir(), f'centroid_{args.ways}_{args.dense_vertices}_{args.seed}.osm.pbf')
+        if not os.path.exists(pbf):
+            print(f">>> 生成合成数据: {pbf}")
+            generate(pbf, args.ways, args.dense_vertices, args.seed)
+
+    bench = CentroidBench()
+    bench.apply_file(pbf, locations=True)
+    if not bench.ways:
+        print("错误: 没有可计算中心点的路径")
+        return
+
+    offsets = sorted(bench.offsets)
+    print(f"输入: {pbf}, 路径 {bench.ways} 条, 平均 {bench.vertices / bench.ways:.1f} 个节点")
+    print(f"\n{'实现':<8} {'总耗时 s':>10} {'µs/路径':>10} {'面外中心点':>10}")
+    for name in ('loop', 'native'):
+        seconds = bench.seconds[name]
+        print(f"{name:<8} {seconds:>10.3f} {seconds * 1e6 / bench.ways:>10.1f} {bench.outside[name]:>10}")
+    print(f"\n加速比: {bench.seconds['loop'] / bench.seconds['native']:.2f}x")
+    print(f"两者距离: 中位数 {offsets[len(offsets) // 2]:.1f} m, "
+          f"P95 {offsets[int(len(offsets) * 0.95)]:.1f} m, 最大 {offsets[-1]:.1f} m")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+POI 提取吞吐量基准
+用合成 PBF（make_synthetic_pbf.py）离线运行 extract_poi.py 的提取流程，分阶段计时：
+  - parse:    osmium 读取解码、坐标缓存、C++ 过滤器（提取总耗时减去 Python 回调耗时）
+  - classify: 分类规则匹配（POIHandler._get_category）
+  - centroid: 路径 / 面中心点计算（_way_center、geometry_center）
+  - extract:  回调中的其余工作（读取标签、组装 POI 记录）
+  - insert:   写入 SQLite（PoiWriter.write_rows）
+  - index:    结束写入（PoiWriter.finish，批量模式下构建 R-Tree、FTS 和普通索引）
+另外不加计时器完整运行一次，记录端到端耗时 wall。
+
+结果写入 JSON 报告；指定 --baseline 时与基线报告逐阶段比较，
+超出 bench_thresholds.json 中允许的变慢比例时以退出码 1 结束。
+
+使用方法：
+    python3 bench_extract.py --report bench_report.json
+    python3 bench_extract.py --nodes 1000000 --ways 100000 --repeat 3 --report new.json --baseline old.json
+    python3 bench_extract.py --check-index    # 两遍扫描下各坐标索引类型的结果是否一致
+    python3 bench_extract.py --check-stats    # 去重、分类统计、密度直方图和排行榜是否符合预期值
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+import osmium
+import osmium.version
+
+import extract_poi
+from extract_poi import (
+    DEFAULT_TRAVEL_ANCHORS, DENSITY_LEVELS, CategoryRules, POIHandler, PoiWriter, build_leaderboards,
+    build_travel_times, create_database, deduplicate_pois, extract_road_graphs, load_travel_anchors,
+    peak_rss_mb, resolve_location_index, set_category_rules,
+)
+from make_synthetic_pbf import generate, generate_duplicates, load_tag_mix
+
+STAGES = ('parse', 'classify', 'centroid', 'extract', 'insert', 'index')
+
+# 一致性检查覆盖的坐标索引类型（内存型和文件型各两种）
+CHECK_INDEX_TYPES = ('flex_mem', 'sparse_mem_array', 'dense_file_array', 'sparse_file_array')
+
+# 去重校验数据集（make_synthetic_pbf.DUPLICATE_FIXTURE）上的预期值，由数据集的坐标和标签逐条推算
+EXPECTED_DEDUP = (2, 3)  # (合并组数, 删除的记录数)
+EXPECTED_MERGED = {2: 1, 3: 1, 5: 4}  # 被合并节点 → 保留节点
+EXPECTED_FILLED = {1: {'phone': '027-88888888', 'website': 'https://example.com', 'rating': 4.5}}
+EXPECTED_CATEGORY_STATS = {
+    ('餐饮', '餐厅'): 5, ('餐饮', '咖啡厅'): 2, ('金融', '银行'): 2, ('休闲', '公园'): 1, ('住宿', '酒店'): 1,
+}
+# 1/8 度单元：位置 A 为 2778674，位置 B 为 2778675
+EXPECTED_DENSITY_3 = {
+    (2778674, '餐饮'): 6, (2778674, '金融'): 1, (2778674, '休闲'): 1,
+    (2778675, '餐饮'): 1, (2778675, '金融'): 1, (2778675, '住宿'): 1,
+}
+# (主分类, 指标, 单元) → 排名顺序的节点 ID；-1 为全城，1/32 度单元 A 为 44442057，B 为 44442062
+EXPECTED_LEADERBOARD_TOP_N = 3
+EXPECTED_LEADERBOARDS = {
+    ('餐饮', 'rating', -1): [11, 1, 13],
+    ('餐饮', 'rating', 44442057): [11, 1, 10],
+    ('餐饮', 'rating', 44442062): [13],
+    ('餐饮', 'prominence', -1): [13, 11, 1],
+    ('餐饮', 'prominence', 44442057): [11, 1, 10],
+    ('住宿', 'rating', -1): [14],
+}
+
+# 出行时间覆盖率检查：默认位置周围约 4 × 3 km 的合成数据，街道间距约 100 m，
+# 另有大量随机的小段道路（封闭路径）。60 分钟步行可达整个范围，
+# 有显示出行时间（poi.travel_time）的 POI 应不少于 EXPECTED_TRAVEL_COVERAGE
+TRAVEL_CHECK_HALF_SIZE = (0.02, 0.015)  # (经度, 纬度) 半宽
+TRAVEL_CHECK_ROAD_GRID = 40
+EXPECTED_TRAVEL_COVERAGE = 0.9
+
+DEFAULT_THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_thresholds.json')
+
+
+class StageTimer:
+    """按阶段累计耗时"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+
+    def wrap(self, stage: str, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+                self.calls[stage] = self.calls.get(stage, 0) + 1
+        return timed
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        yield
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+
+    def get(self, stage: str) -> float:
+        return self.seconds.get(stage, 0.0)
+
+
+class TimedPOIHandler(POIHandler):
+    """在回调、分类和中心点计算外加计时的 POIHandler"""
+
+    def __init__(self, timer: StageTimer, **kwargs):
+        super().__init__(**kwargs)
+        self.timer = timer
+        self._get_category = timer.wrap('classify', self._get_category)
+        self._way_center = timer.wrap('centroid', self._way_center)
+        self._node = timer.wrap('callback', super().node)
+        self._way = timer.wrap('callback', super().way)
+        self._area = timer.wrap('callback', super().area)
+
+    # osmium 按类属性查找回调，因此以方法形式转发
+    def node(self, n):
+        self._node(n)
+
+    def way(self, w):
+        self._way(w)
+
+    def area(self, a):
+        self._area(a)
+
+
+class TimedPoiWriter(PoiWriter):
+    """写入计时的 PoiWriter"""
+
+    def __init__(self, timer: StageTimer, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timer = timer
+
+    def write_rows(self, rows):
+        with self.timer.measure('insert'):
+            return super().write_rows(rows)
+
+
+def run_instrumented(pbf: str, db_path: str, bulk: bool) -> Dict:
+    """分阶段计时运行一次，返回各阶段秒数和 POI 数"""
+    timer = StageTimer()
+    geometry_center = extract_poi.geometry_center
+    extract_poi.geometry_center = timer.wrap('centroid', geometry_center)
+    try:
+        conn = create_database(db_path, bulk=bulk)
+        writer = TimedPoiWriter(timer, conn, bulk=bulk)
+        handler = TimedPOIHandler(timer, writer=writer)
+
+        start = time.perf_counter()
+        handler.extract_file(pbf)
+        extract_seconds = time.perf_counter() - start
+        insert_in_callbacks = timer.get('insert')
+
+        writer.write(handler.pois)
+        with timer.measure('index'):
+            writer.finish()
+        poi_count = conn.execute('SELECT COUNT(*) FROM poi').fetchone()[0]
+        conn.close()
+    finally:
+        extract_poi.geometry_center = geometry_center
+
+    callbacks = timer.get('callback')
+    stages = {
+        'parse': extract_seconds - callbacks,
+        'classify': timer.get('classify'),
+        'centroid': timer.get('centroid'),
+        'extract': callbacks - timer.get('classify') - timer.get('centroid') - insert_in_callbacks,
+        'insert': timer.get('insert'),
+        'index': timer.get('index'),
+    }
+    return {'stages': stages, 'calls': dict(timer.calls), 'poi_count': poi_count}
+
+
+def run_plain(pbf: str, db_path: str, bulk: bool) -> float:
+    """不加计时器完整运行一次（与 extract_poi.py 主流程相同），返回耗时"""
+    start = time.perf_counter()
+    conn = create_database(db_path, bulk=bulk)
+    writer = PoiWriter(conn, bulk=bulk)
+    handler = POIHandler(writer=writer)
+    handler.extract_file(pbf)
+    writer.write(handler.pois)
+    writer.finish()
+    conn.close()
+    return time.perf_counter() - start
+
+
+def check_index_types(pbf: str, work_dir: str) -> Dict[str, int]:
+    """两遍扫描（--two-pass）下用各坐标索引类型提取一次，返回各类型的 POI 数（应全部相同）"""
+    counts = {}
+    db_path = os.path.join(work_dir, 'bench_index.db')
+    for idx_type in CHECK_INDEX_TYPES:
+        idx, idx_tmp = resolve_location_index(idx_type, work_dir)
+        try:
+            conn = create_database(db_path, bulk=True)
+            writer = PoiWriter(conn, bulk=True)
+            handler = POIHandler(writer=writer)
+            handler.extract_file(pbf, idx=idx, two_pass=True)
+            writer.write(handler.pois)
+            writer.finish()
+            counts[idx_type] = conn.execute('SELECT COUNT(*) FROM poi').fetchone()[0]
+            conn.close()
+        finally:
+            for path in (idx_tmp, db_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+    return counts
+
+
+def check_stats(work_dir: str) -> list:
+    """
+    在去重校验数据集上提取、去重（默认半径）并构建排行榜，返回与预期值不符的项目说明
+
+    密度直方图另外与 poi 表的分组计数逐级比较
+    """
+    pbf = os.path.join(work_dir, 'duplicates.osm.pbf')
+    db_path = os.path.join(work_dir, 'bench_stats.db')
+    generate_duplicates(pbf)
+    failures = []
+
+    def expect(label, actual, expected):
+        if actual != expected:
+            failures.append(f"{label}: {actual} != 预期 {expected}")
+
+    try:
+        conn = create_database(db_path, bulk=True)
+        writer = PoiWriter(conn, bulk=True)
+        handler = POIHandler(writer=writer)
+        handler.extract_file(pbf)
+        writer.write(handler.pois)
+        writer.finish()
+        expect('去重', deduplicate_pois(conn), EXPECTED_DEDUP)
+        build_leaderboards(conn, EXPECTED_LEADERBOARD_TOP_N)
+        conn.commit()
+
+        osm_ids = dict(conn.execute("SELECT id, osm_id FROM poi WHERE osm_type = 'node'"))
+        merged = dict(conn.execute("SELECT osm_id, poi_id FROM poi_merged WHERE osm_type = 'node'"))
+        expect('合并记录', {osm_id: osm_ids.get(poi_id) for osm_id, poi_id in merged.items()}, EXPECTED_MERGED)
+        for osm_id, fields in EXPECTED_FILLED.items():
+            row = conn.execute(f"SELECT {', '.join(fields)} FROM poi WHERE osm_type = 'node' AND osm_id = ?",
+                               (osm_id,)).fetchone()
+            expect(f'节点 {osm_id} 合并后字段', dict(zip(fields, row or ())), fields)
+
+        expect('分类统计', {(main, sub): count for main, sub, count in conn.execute(
+            'SELECT main_category, sub_category, count FROM category_stats'
+        )}, EXPECTED_CATEGORY_STATS)
+        expect('密度直方图 (级别 3)', {(cell, main): count for cell, main, count in conn.execute(
+            'SELECT cell, main_category, count FROM poi_density WHERE level = 3'
+        )}, EXPECTED_DENSITY_3)
+        for level in DENSITY_LEVELS:
+            n = 1 << level
+            recount = {(cell, main): count for cell, main, count in conn.execute(f'''
+                SELECT CAST((lat + 90.0) * {n} AS INTEGER) * {360 * n} + CAST((lon + 180.0) * {n} AS INTEGER),
+                       main_category, COUNT(*)
+                FROM poi GROUP BY 1, 2
+            ''')}
+            expect(f'密度直方图 (级别 {level}) 与分组计数', {(cell, main): count for cell, main, count in conn.execute(
+                'SELECT cell, main_category, count FROM poi_density WHERE level = ?', (level,)
+            )}, recount)
+
+        boards = {}
+        for main, metric, cell, poi_id in conn.execute('''
+            SELECT main_category, metric, cell, poi_id FROM poi_leaderboard
+            ORDER BY main_category, metric, cell, score DESC, poi_id
+        '''):
+            boards.setdefault((main, metric, cell), []).append(osm_ids[poi_id])
+        for key, expected in EXPECTED_LEADERBOARDS.items():
+            expect(f'排行榜 {key}', boards.get(key), expected)
+        conn.close()
+    finally:
+        for path in (pbf, db_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return failures
+
+
+def check_travel_coverage(work_dir: str) -> list:
+    """
+    在默认位置周围的合成路网上预计算出行时间，返回覆盖率不足时的说明
+
+    锚点或 POI 吸附到孤立小片段上时，从默认位置出发几乎到不了任何 POI
+    """
+    anchor = DEFAULT_TRAVEL_ANCHORS[0]
+    half_lon, half_lat = TRAVEL_CHECK_HALF_SIZE
+    bbox = (anchor['lon'] - half_lon, anchor['lat'] - half_lat, anchor['lon'] + half_lon, anchor['lat'] + half_lat)
+    pbf = os.path.join(work_dir, 'travel_check.osm.pbf')
+    db_path = os.path.join(work_dir, 'bench_travel.db')
+    generate(pbf, nodes=20000, ways=2000, relations=20, bbox=bbox, road_grid=TRAVEL_CHECK_ROAD_GRID)
+    try:
+        conn = create_database(db_path, bulk=True)
+        writer = PoiWriter(conn, bulk=True)
+        handler = POIHandler(writer=writer)
+        handler.extract_file(pbf)
+        writer.write(handler.pois)
+        writer.finish()
+        graphs, _ = extract_road_graphs(pbf)
+        build_travel_times(conn, graphs, load_travel_anchors(None))
+        conn.commit()
+        total, covered = conn.execute('SELECT COUNT(*), COUNT(travel_time) FROM poi').fetchone()
+        conn.close()
+    finally:
+        for path in (pbf, db_path):
+            if os.path.exists(path):
+                os.remove(path)
+    coverage = covered / total if total else 0.0
+    print(f"  {anchor['name']}出发的出行时间覆盖 {covered}/{total} 个 POI ({coverage:.1%})")
+    if coverage < EXPECTED_TRAVEL_COVERAGE:
+        return [f"出行时间覆盖率: {coverage:.1%} < 预期 {EXPECTED_TRAVEL_COVERAGE:.0%}"]
+    return []
+
+
+def check_regressions(report: Dict, baseline: Dict, thresholds: Dict) -> list:
+    """逐阶段与基线比较，返回超出阈值的阶段说明"""
+    tolerances = thresholds.get('stages', {})
+    min_seconds = thresholds.get('min_seconds', 0.0)
+    failures = []
+    for stage in (*STAGES, 'wall'):
+        current = report['stages'].get(stage) if stage != 'wall' else report['wall']
+        base = baseline['stages'].get(stage) if stage != 'wall' else baseline.get('wall')
+        if current is None or base is None or stage not in tolerances:
+            continue
+        limit = base * (1 + tolerances[stage])
+        if current > limit and current - base > min_seconds:
+            failures.append(f"{stage}: {current:.3f} s > 基线 {base:.3f} s × {1 + tolerances[stage]:.2f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POI 提取吞吐量基准（合成数据，离线运行）')
+    parser.add_argument('--nodes', type=int, default=200000, help='合成数据独立节点数')
+    parser.add_argument('--ways', type=int, default=20000, help='合成数据路径数')
+    parser.add_argument('--relations', type=int, default=200, help='合成数据 multipolygon 关系数')
+    parser.add_argument('--poi-ratio', type=float, default=0.1, help='带 POI 标签的节点比例')
+    parser.add_argument('--tag-mix', help='标签构成 JSON 文件（见 make_synthetic_pbf.py）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--pbf', help='直接使用已有的 PBF 文件（不生成合成数据）')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'amap_poi_bench'),
+                        help='合成数据和临时数据库目录（相同参数的合成数据会复用）')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数，各阶段取最小值')
+    parser.add_argument('--no-bulk', action='store_true', help='使用逐批提交的普通写入模式（默认批量模式）')
+    parser.add_argument('--report', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='基线 JSON 报告，用于回归检查')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS_FILE, help='回归阈值配置文件')
+    parser.add_argument('--check-index', action='store_true',
+                        help='只做一致性检查：两遍扫描下各坐标索引类型的 POI 数不同时以退出码 1 结束')
+    parser.add_argument('--check-stats', action='store_true',
+                        help='只做正确性检查：在含已知重复 POI 的固定数据集上校验去重、分类统计、'
+                             '密度直方图和排行榜，并检查默认位置出发的出行时间覆盖率，'
+                             '与预期值不符时以退出码 1 结束')
+    args = parser.parse_args()
+
+    set_category_rules(CategoryRules.load())
+    os.makedirs(args.work_dir, exist_ok=True)
+    bulk = not args.no_bulk
+
+    if args.check_stats:
+        print(">>> 去重与统计校验（固定数据集）")
+        failures = check_stats(args.work_dir) + check_travel_coverage(args.work_dir)
+        if failures:
+            print("\n❌ 与预期值不符:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("\n✅ 去重、分类统计、密度直方图、排行榜和出行时间覆盖率与预期值一致")
+        return
+
+    if args.pbf:
+        pbf = args.pbf
+        source = {'file': os.path.basename(pbf)}
+    else:
+        mix_name = os.path.splitext(os.path.basename(args.tag_mix))[0] if args.tag_mix else 'default'
+        pbf = os.path.join(args.work_dir, f'synthetic_{args.nodes}_{args.ways}_{args.relations}_'
+                                          f'{args.poi_ratio}_{mix_name}_{args.seed}.osm.pbf')
+        source = {'nodes': args.nodes, 'ways': args.ways, 'relations': args.relations,
+                  'poi_ratio': args.poi_ratio, 'tag_mix': mix_name, 'seed': args.seed}
+        if not os.path.exists(pbf):
+            print(f">>> 生成合成数据: {pbf}")
+            tag_mix = load_tag_mix(args.tag_mix) if args.tag_mix else None
+            generate(pbf, args.nodes, args.ways, args.relations,
+                     poi_ratio=args.poi_ratio, seed=args.seed, tag_mix=tag_mix)
+
+    if args.check_index:
+        print(f">>> 坐标索引一致性检查（两遍扫描）: {pbf}")
+        counts = check_index_types(pbf, args.work_dir)
+        for idx_type, count in counts.items():
+            print(f"  {idx_type:<20} {count} 条")
+        if len(set(counts.values())) > 1:
+            print("\n❌ 各坐标索引类型的 POI 数不一致")
+            sys.exit(1)
+        print("\n✅ 各坐标索引类型结果一致")
+        return
+
+    db_path = os.path.join(args.work_dir, 'bench_poi.db')
+    print(f">>> 输入: {pbf} ({os.path.getsize(pbf) / 1024 / 1024:.1f} MB), "
+          f"{'批量' if bulk else '普通'}写入, 重复 {args.repeat} 次")
+
+    best: Dict[str, float] = {}
+    wall: Optional[float] = None
+    result = None
+    for i in range(args.repeat):
+        result = run_instrumented(pbf, db_path, bulk)
+        for stage, seconds in result['stages'].items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+        elapsed = run_plain(pbf, db_path, bulk)
+        wall = elapsed if wall is None else min(wall, elapsed)
+        print(f"  第 {i + 1} 次: 端到端 {elapsed:.2f} s")
+    os.remove(db_path)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'pyosmium': osmium.version.pyosmium_release,
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+        },
+        'input': source,
+        'bulk': bulk,
+        'repeat': args.repeat,
+        'poi_count': result['poi_count'],
+        'stages': best,
+        'calls': result['calls'],
+        'wall': wall,
+        'pois_per_second': result['poi_count'] / wall if wall else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    print("\n" + "=" * 60)
+    print(f"提取基准（POI {report['poi_count']} 条，取 {args.repeat} 次最小值）")
+    print("=" * 60)
+    for stage in STAGES:
+        print(f"  {stage:<10} {best[stage]:8.3f} s")
+    print(f"  {'wall':<10} {wall:8.3f} s  ({report['pois_per_second']:.0f} POI/s)")
+    print(f"  峰值内存 (RSS): {report['peak_rss_mb']:.1f} MB")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已写入: {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.thresholds, encoding='utf-8') as f:
+            thresholds = json.load(f)
+        if baseline.get('input') != report['input'] or baseline.get('bulk') != report['bulk']:
+            print("警告: 基线报告的输入参数或写入模式不同，比较结果仅供参考")
+        failures = check_regressions(report, baseline, thresholds)
+        if failures:
+            print("\n❌ 性能回归:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("\n✅ 未超出回归阈值")
+
+
+if __name__ == '__main__':
+    main()
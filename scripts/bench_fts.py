@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文索引分词方式对比
+用已有的 POI 数据库分别构建 unicode61 / trigram / bigram 三种全文索引，
+比较索引大小、查询延迟，以及相对 LIKE 全表扫描的召回率
+
+使用方法：
+    python3 bench_fts.py --db map_data/wuhan_poi.db
+    python3 bench_fts.py --db map_data/wuhan_poi.db --queries 500
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Set
+
+from extract_poi import (
+    FTS_TOKENIZERS, POI_COLUMNS, PoiWriter, cjk_fts_query, create_database,
+)
+
+
+def build_variant(src_path: str, dst_path: str, tokenizer: str) -> sqlite3.Connection:
+    """用源数据库的 POI 记录构建指定分词方式的新数据库"""
+    src = sqlite3.connect(src_path)
+    src_columns = {row[1] for row in src.execute('PRAGMA table_info(poi)')}
+    select = ', '.join(col if col in src_columns else 'NULL' for col in POI_COLUMNS)
+
+    conn = create_database(dst_path, bulk=True, fts_tokenizer=tokenizer)
+    writer = PoiWriter(conn, bulk=True)
+    cursor = src.execute(f'SELECT {select} FROM poi ORDER BY id')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        writer.write_rows(rows)
+    src.close()
+
+    writer.finish()
+    return conn
+
+
+def table_size(conn: sqlite3.Connection, prefix: str) -> int:
+    """返回名称以 prefix 开头的表（含影子表）占用的字节数"""
+    row = conn.execute(
+        'SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = ? OR name GLOB ?',
+        (prefix, prefix + '_*')
+    ).fetchone()
+    return row[0]
+
+
+def sample_keywords(conn: sqlite3.Connection, count: int, seed: int = 7) -> List[str]:
+    """从 POI 名称中随机截取 1~4 个字的子串作为查询关键词"""
+    rng = random.Random(seed)
+    names = [row[0] for row in conn.execute('SELECT name FROM poi')]
+    keywords = []
+    while len(keywords) < count and names:
+        name = rng.choice(names)
+        length = min(len(name), rng.randint(1, 4))
+        start = rng.randint(0, len(name) - length)
+        keyword = name[start:start + length].strip()
+        if keyword and '"' not in keyword:
+            keywords.append(keyword)
+    return keywords
+
+
+def search_ids(conn: sqlite3.Connection, tokenizer: str, keyword: str) -> Set[int]:
+    """按各分词方式推荐的写法执行一次关键词查询"""
+    if tokenizer == 'bigram':
+        query = cjk_fts_query(keyword)
+    elif tokenizer == 'trigram':
+        # trigram 只能匹配至少 3 个字符的子串
+        if len(keyword) < 3:
+            return set()
+        query = f'"{keyword}"'
+    else:
+        # 与 OfflineSearchService.searchFts 相同的前缀查询
+        query = f'"{keyword}"*'
+
+    if not query:
+        return set()
+    rows = conn.execute(
+        'SELECT rowid FROM poi_fts WHERE poi_fts MATCH ?', (query,)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def like_ids(conn: sqlite3.Connection, keyword: str) -> Set[int]:
+    """LIKE 全表扫描（应用中的后备路径）"""
+    pattern = f'%{keyword}%'
+    rows = conn.execute(
+        'SELECT id FROM poi WHERE name LIKE ? OR address LIKE ?', (pattern, pattern)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def report(name: str, latencies: List[float]) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return f"{name}: 平均 {statistics.mean(latencies):.3f} ms, p95 {p95:.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文索引分词方式对比')
+    parser.add_argument('--db', required=True, help='已有的 POI 数据库（如 wuhan_poi.db）')
+    parser.add_argument('-n', '--queries', type=int, default=300, help='查询关键词数量')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"错误: 数据库不存在: {args.db}")
+        return
+
+    results: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for tokenizer in FTS_TOKENIZERS:
+            print(f">>> 构建 {tokenizer} 索引...")
+            conn = build_variant(args.db, os.path.join(tmp, f'{tokenizer}.db'), tokenizer)
+            keywords = sample_keywords(conn, args.queries)
+
+            fts_latency, like_latency = [], []
+            found = expected = 0
+            for keyword in keywords:
+                ids, elapsed = timed(search_ids, conn, tokenizer, keyword)
+                fts_latency.append(elapsed)
+                truth, elapsed = timed(like_ids, conn, keyword)
+                like_latency.append(elapsed)
+                found += len(ids & truth)
+                expected += len(truth)
+
+            results[tokenizer] = {
+                'fts_size': table_size(conn, 'poi_fts'),
+                'poi_size': conn.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = 'poi'").fetchone()[0],
+                'db_size': os.path.getsize(os.path.join(tmp, f'{tokenizer}.db')),
+                'fts': fts_latency,
+                'like': like_latency,
+                'recall': found / expected if expected else 1.0,
+            }
+            conn.close()
+
+    print("\n" + "=" * 60)
+    print(f"全文索引对比（{args.queries} 个关键词，取自 POI 名称的 1~4 字子串）")
+    print("=" * 60)
+    for tokenizer, r in results.items():
+        print(f"\n[{tokenizer}]")
+        print(f"  poi_fts 大小: {r['fts_size'] / 1024 / 1024:.2f} MB, "
+              f"poi 表: {r['poi_size'] / 1024 / 1024:.2f} MB, "
+              f"数据库: {r['db_size'] / 1024 / 1024:.2f} MB")
+        print(f"  {report('FTS 查询', r['fts'])}")
+        print(f"  {report('LIKE 扫描', r['like'])}")
+        print(f"  FTS 召回率（相对 LIKE）: {r['recall'] * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+附近搜索查询方式对比
+在已有的 POI 数据库上比较三种矩形范围查询：
+  - bbox: poi 表上 lat/lon BETWEEN 过滤（应用原来的写法，无可用索引）
+  - rtree: poi_rtree 范围查询后按 ID 回表
+  - grid: 网格单元列覆盖索引，每行网格一次范围扫描
+三种方式按半径过滤后的结果必须一致
+
+使用方法：
+    python3 bench_nearby.py --db map_data/wuhan_poi.db
+    python3 bench_nearby.py --db map_data/wuhan_poi.db --radius 500 2000 5000 --category 餐饮
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import statistics
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from extract_poi import GRID_COLUMNS, grid_cell_ranges, grid_nearby_sql
+
+EARTH_RADIUS = 6371000.0
+
+# 与 OfflineSearchService.searchNearby 读取的列一致
+SELECT = 'id, name, main_category, lat, lon, address, phone, opening_hours, description, travel_time, rating'
+RTREE_SELECT = ', '.join(f'p.{col.strip()}' for col in SELECT.split(','))
+
+Box = Tuple[float, float, float, float]
+
+RTREE_EPSILON = 1e-5
+
+
+def bounding_box(lat: float, lon: float, radius: float) -> Box:
+    """半径对应的经纬度矩形（与应用中的计算相同）"""
+    lat_range = math.degrees(radius / EARTH_RADIUS)
+    lon_range = math.degrees(radius / (EARTH_RADIUS * math.cos(math.radians(lat))))
+    return lat - lat_range, lat + lat_range, lon - lon_range, lon + lon_range
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine 距离（米）"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def query_bbox(conn: sqlite3.Connection, box: Box, category: Optional[str]) -> List[Tuple]:
+    sql = f'SELECT {SELECT} FROM poi WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?'
+    args = list(box)
+    if category:
+        sql += ' AND main_category = ?'
+        args.append(category)
+    return conn.execute(sql, args).fetchall()
+
+
+def query_rtree(conn: sqlite3.Connection, box: Box, category: Optional[str]) -> List[Tuple]:
+    # CROSS JOIN 固定先查 R-Tree（否则带分类条件时会先扫分类索引）；
+    # R-Tree 以 float32 存储坐标，矩形向外扩展 RTREE_EPSILON 避免边界点被舍入排除
+    sql = f'''
+        SELECT {RTREE_SELECT} FROM poi_rtree r CROSS JOIN poi p ON p.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+    '''
+    min_lat, max_lat, min_lon, max_lon = box
+    args = [min_lat - RTREE_EPSILON, max_lat + RTREE_EPSILON,
+            min_lon - RTREE_EPSILON, max_lon + RTREE_EPSILON]
+    if category:
+        sql += ' AND p.main_category = ?'
+        args.append(category)
+    return conn.execute(sql, args).fetchall()
+
+
+def query_grid(conn: sqlite3.Connection, box: Box, category: Optional[str]) -> List[Tuple]:
+    column, ranges = grid_cell_ranges(*box)
+    sql = grid_nearby_sql(column, len(ranges), SELECT, category=bool(category))
+    args = []
+    for lo, hi in ranges:
+        args += [lo, hi, category] if category else [lo, hi]
+    return conn.execute(sql, args).fetchall()
+
+
+METHODS: Dict[str, Callable] = {'bbox': query_bbox, 'rtree': query_rtree, 'grid': query_grid}
+
+
+def within(rows: List[Tuple], lat: float, lon: float, radius: float) -> set:
+    """按半径过滤，返回 ID 集合"""
+    return {row[0] for row in rows if distance(lat, lon, row[3], row[4]) <= radius}
+
+
+def object_size(conn: sqlite3.Connection, names: List[str]) -> float:
+    placeholders = ', '.join('?' * len(names))
+    row = conn.execute(
+        f'SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN ({placeholders})', names
+    ).fetchone()
+    return row[0] / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='附近搜索查询方式对比')
+    parser.add_argument('--db', required=True, help='POI 数据库（如 wuhan_poi.db）')
+    parser.add_argument('-n', '--queries', type=int, default=300, help='每个半径的查询次数')
+    parser.add_argument('--radius', type=float, nargs='+', default=[500, 1000, 5000, 20000],
+                        help='搜索半径（米）')
+    parser.add_argument('--category', help='同时按主分类过滤（如 餐饮）')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"错误: 数据库不存在: {args.db}")
+        return
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(poi)')}
+    if not set(GRID_COLUMNS) <= columns:
+        print("错误: 数据库没有网格单元列，请用当前版本的 extract_poi.py 重新生成")
+        return
+
+    # 以随机 POI 的位置作为查询中心
+    rng = random.Random(11)
+    points = conn.execute('SELECT lat, lon FROM poi').fetchall()
+    centers = [rng.choice(points) for _ in range(args.queries)]
+
+    print(f"数据库: {args.db}, 查询中心: {len(centers)} 个, 分类: {args.category or '全部'}")
+    print(f"R-Tree 大小: {object_size(conn, ['poi_rtree_node', 'poi_rtree_rowid', 'poi_rtree_parent']):.2f} MB")
+    for column in GRID_COLUMNS:
+        print(f"idx_poi_{column} 大小: {object_size(conn, [f'idx_poi_{column}']):.2f} MB")
+    print()
+    print(f"{'半径':>8} {'方式':<6} {'平均 ms':>9} {'p95 ms':>9} {'平均结果数':>10}")
+
+    for radius in args.radius:
+        timings = {name: [] for name in METHODS}
+        hits = []
+        for lat, lon in centers:
+            box = bounding_box(lat, lon, radius)
+            expected = None
+            for name, method in METHODS.items():
+                start = time.perf_counter()
+                rows = method(conn, box, args.category)
+                timings[name].append((time.perf_counter() - start) * 1000)
+                found = within(rows, lat, lon, radius)
+                if expected is None:
+                    expected = found
+                    hits.append(len(found))
+                elif found != expected:
+                    print(f"错误: {name} 结果不一致 (中心 {lat}, {lon}, 半径 {radius})")
+                    return
+
+        for name, values in timings.items():
+            values.sort()
+            p95 = values[int(len(values) * 0.95) - 1]
+            print(f"{radius:>8.0f} {name:<6} {statistics.mean(values):>9.3f} {p95:>9.3f} "
+                  f"{statistics.mean(hits):>10.1f}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二进制 POI 包与 SQLite 查询对比
+在同一批随机查询点上分别对 SQLite 数据库（PoiDatabase）和二进制包（PoiPack）执行：
+  - open:   仅打开 + 关闭
+  - cold:   打开文件 + 一次附近查询 + 关闭（每个查询点单独计时，模拟应用冷启动后的首次查询）
+  - nearby: 已打开时的附近查询
+  - knn:    已打开时的 k 近邻查询
+报告每次查询的中位数 / P95 耗时（µs），并核对两者返回的 POI id 是否一致。
+冷启动计时不清理操作系统页缓存，反映的是文件已在页缓存中时的打开和首次查询开销。
+
+使用方法：
+    python3 bench_pack.py --db map_data/wuhan_poi.db
+    python3 bench_pack.py --db map_data/wuhan_poi.db --pack map_data/wuhan_poi.pack --queries 500
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from typing import Callable, List, Tuple
+
+from extract_poi import write_poi_pack
+from poi_query import PoiDatabase, PoiPack
+
+
+def timed(func: Callable, points: List[Tuple[float, float]]) -> Tuple[List[float], list]:
+    """逐个查询点计时，返回 (每次耗时 µs, 每次结果的 id 列表)"""
+    micros = []
+    results = []
+    for lat, lon in points:
+        start = time.perf_counter()
+        pois = func(lat, lon)
+        micros.append((time.perf_counter() - start) * 1e6)
+        results.append([poi.id for poi in pois])
+    return micros, results
+
+
+def percentiles(values: List[float]) -> Tuple[float, float]:
+    values = sorted(values)
+    return values[len(values) // 2], values[int(len(values) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='二进制 POI 包与 SQLite 查询对比')
+    parser.add_argument('--db', required=True, help='SQLite POI 数据库')
+    parser.add_argument('--pack', help='二进制包路径（默认与数据库同名 .pack，不存在时自动生成）')
+    parser.add_argument('--queries', type=int, default=300, help='查询点数量')
+    parser.add_argument('--radius', type=float, default=1000, help='附近查询半径（米）')
+    parser.add_argument('-k', type=int, default=10, help='k 近邻数量')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    args = parser.parse_args()
+
+    pack_path = args.pack or os.path.splitext(args.db)[0] + '.pack'
+    if not os.path.exists(pack_path):
+        print(f">>> 生成二进制包: {pack_path}")
+        conn = sqlite3.connect(args.db)
+        write_poi_pack(conn, pack_path)
+        conn.close()
+
+    # 查询点取自数据库中的随机 POI 附近，保证大部分查询有结果
+    conn = sqlite3.connect(args.db)
+    coords = conn.execute("SELECT lat, lon FROM poi ORDER BY random() LIMIT ?", (args.queries,)).fetchall()
+    conn.close()
+    rng = random.Random(args.seed)
+    points = [(lat + rng.uniform(-0.005, 0.005), lon + rng.uniform(-0.005, 0.005)) for lat, lon in coords]
+
+    backends = (('sqlite', PoiDatabase, args.db), ('pack', PoiPack, pack_path))
+    print(f"数据库: {args.db} ({os.path.getsize(args.db) / 1024 / 1024:.2f} MB), "
+          f"二进制包: {pack_path} ({os.path.getsize(pack_path) / 1024 / 1024:.2f} MB)")
+    print(f"查询点 {len(points)} 个, 附近半径 {args.radius:g} m, k={args.k}\n")
+
+    def cold(opener, path):
+        def query(lat, lon):
+            with opener(path) as db:
+                return db.nearby(lat, lon, args.radius)
+        return query
+
+    def open_only(opener, path):
+        def query(lat, lon):
+            opener(path).close()
+            return []
+        return query
+
+    stats = {}
+    results = {}
+    for name, opener, path in backends:
+        stats[(name, 'open')], _ = timed(open_only(opener, path), points)
+        micros, _ = timed(cold(opener, path), points)
+        stats[(name, 'cold')] = micros
+        with opener(path) as db:
+            for test, func in (('nearby', lambda lat, lon: db.nearby(lat, lon, args.radius)),
+                               ('knn', lambda lat, lon: db.knn(lat, lon, args.k))):
+                func(*points[0])
+                micros, ids = timed(func, points)
+                stats[(name, test)] = micros
+                results[(name, test)] = ids
+
+    print(f"{'查询':<8} {'sqlite 中位数':>14} {'P95':>10} {'pack 中位数':>14} {'P95':>10} {'加速比':>8}")
+    for test in ('open', 'cold', 'nearby', 'knn'):
+        sqlite_median, sqlite_p95 = percentiles(stats[('sqlite', test)])
+        pack_median, pack_p95 = percentiles(stats[('pack', test)])
+        print(f"{test:<8} {sqlite_median:>12.0f}µs {sqlite_p95:>8.0f}µs "
+              f"{pack_median:>12.0f}µs {pack_p95:>8.0f}µs {sqlite_median / pack_median:>7.1f}x")
+
+    # 距离相同的 POI 顺序可能不同，按集合比较
+    for test in ('nearby', 'knn'):
+        same = sum(set(a) == set(b) for a, b in zip(results[('sqlite', test)], results[('pack', test)]))
+        print(f"{test} 结果一致: {same}/{len(points)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tags 列编码大小对比
+解码 extract_poi.py 生成的数据库中的 tags 列（键名字典 + varint 序列），
+与其他几种编码方式比较总字节数：
+  - repr:   原来的 str(dict(tags)) 文本（不截断）
+  - json:   JSON 文本
+  - varint: 当前编码（tag_keys 键名字典 + [键 ID][值长度][值] 序列）
+  - zlib:   在 varint 编码上逐行 zlib 压缩，使用按样本训练的共享预置字典
+另外报告 poi 表和整个数据库的实际占用，以及解码速度
+
+使用方法：
+    python3 bench_tags.py --db map_data/wuhan_poi.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from extract_poi import _read_varint, decode_tags, load_tag_keys
+
+# zlib 预置字典上限为 32 KB
+ZDICT_SIZE = 32 * 1024
+
+
+def train_zdict(blobs: List[bytes], size: int = ZDICT_SIZE) -> bytes:
+    """
+    用样本训练预置字典：按 (出现次数 × 长度) 选取最常见的单个标签编码片段，
+    越常见的放在越靠后（zlib 对距离较近的匹配编码更短）
+    """
+    pieces = Counter()
+    for blob in blobs:
+        pieces.update(_split_tags(blob))
+    ranked = sorted(pieces, key=lambda p: pieces[p] * len(p), reverse=True)
+    selected = []
+    total = 0
+    for piece in ranked:
+        if pieces[piece] < 2 or total + len(piece) > size:
+            continue
+        selected.append(piece)
+        total += len(piece)
+    return b''.join(reversed(selected))
+
+
+def _split_tags(blob: bytes) -> List[bytes]:
+    """把 varint 编码拆成每个标签一段（键 ID、值长度和值）"""
+    pieces = []
+    pos = 0
+    while pos < len(blob):
+        _, value_pos = _read_varint(blob, pos)
+        length, value_pos = _read_varint(blob, value_pos)
+        pieces.append(blob[pos:value_pos + length])
+        pos = value_pos + length
+    return pieces
+
+
+def compress_all(blobs: List[bytes], zdict: bytes) -> int:
+    total = 0
+    for blob in blobs:
+        c = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=zdict)
+        total += len(c.compress(blob) + c.flush())
+    return total
+
+
+def object_size(conn: sqlite3.Connection, name: str) -> float:
+    row = conn.execute('SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = ?', (name,)).fetchone()
+    return row[0] / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tags 列编码大小对比')
+    parser.add_argument('--db', required=True, help='POI 数据库（如 wuhan_poi.db）')
+    parser.add_argument('--sample', type=int, default=5000, help='训练 zlib 预置字典的样本行数')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"错误: 数据库不存在: {args.db}")
+        return
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    keys = load_tag_keys(conn)
+    if not keys:
+        print("错误: 数据库没有 tag_keys 表，请用当前版本的 extract_poi.py 重新生成")
+        return
+
+    blobs = [blob for (blob,) in conn.execute('SELECT tags FROM poi WHERE tags IS NOT NULL')]
+
+    start = time.perf_counter()
+    decoded = [decode_tags(blob, keys) for blob in blobs]
+    decode_seconds = time.perf_counter() - start
+
+    zdict = train_zdict(blobs[::max(1, len(blobs) // args.sample)])
+    key_table = sum(len(key.encode('utf-8')) + 2 for key in keys.values())
+    sizes: Dict[str, int] = {
+        'repr': sum(len(str(tags).encode('utf-8')) for tags in decoded),
+        'json': sum(len(json.dumps(tags, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                    for tags in decoded),
+        'varint': sum(len(blob) for blob in blobs) + key_table,
+        'zlib': compress_all(blobs, zdict) + key_table + len(zdict),
+    }
+
+    print(f"数据库: {args.db}, POI {len(blobs)} 条, 键名 {len(keys)} 个")
+    print(f"\n{'编码':<8} {'总大小 MB':>10} {'平均字节/行':>12} {'相对 repr':>10}")
+    for name, size in sizes.items():
+        print(f"{name:<8} {size / 1024 / 1024:>10.2f} {size / len(blobs):>12.1f} "
+              f"{size / sizes['repr']:>10.1%}")
+    print("\n（varint 和 zlib 含键名表，zlib 另含预置字典）")
+
+    print(f"\npoi 表: {object_size(conn, 'poi'):.2f} MB, 数据库文件: "
+          f"{os.path.getsize(args.db) / 1024 / 1024:.2f} MB")
+    print(f"解码: {decode_seconds * 1e6 / len(blobs):.2f} µs/行")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,147 +12,158 @@ POI 提取脚本
 """
 
 import argparse
+import cProfile
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import pickle
+import queue
+import re
+import resource
 import sqlite3
+import struct
 import sys
 import os
-from typing import Optional, Dict, List, Tuple
+import tempfile
+import threading
+import time
+import tracemalloc
+import unicodedata
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional, Dict, Iterator, List, NamedTuple, Tuple
 from datetime import datetime
 
 try:
     import osmium
+    import osmium.area
+    import osmium.filter
+    import osmium.index
+    import osmium.io
     from osmium import geom
 except ImportError:
     print("错误: 请先安装 osmium 模块")
     print("  pip install osmium")
     sys.exit(1)
 
+# 可选依赖：shapely (GEOS) 用于计算面状 POI 的中心点
+try:
+    import numpy as np
+    import shapely
+except ImportError:
+    np = None
+    shapely = None
+
 
 # ============================================================================
-# POI 分类映射表
-# 将 OSM 标签映射到中文分类
-# ============================================================================
-
-POI_CATEGORIES = {
-    # 餐饮
-    "amenity=restaurant": "餐饮|餐厅",
-    "amenity=fast_food": "餐饮|快餐",
-    "amenity=cafe": "餐饮|咖啡厅",
-    "amenity=bar": "餐饮|酒吧",
-    "amenity=pub": "餐饮|酒吧",
-    "amenity=food_court": "餐饮|美食城",
-    
-    # 购物
-    "shop=supermarket": "购物|超市",
-    "shop=convenience": "购物|便利店",
-    "shop=mall": "购物|商场",
-    "shop=department_store": "购物|百货",
-    "shop=clothes": "购物|服装",
-    "shop=electronics": "购物|电子产品",
-    "shop=mobile_phone": "购物|手机店",
-    "shop=bakery": "购物|烘焙店",
-    "shop=butcher": "购物|肉店",
-    "shop=greengrocer": "购物|果蔬店",
-    "shop=pharmacy": "购物|药店",
-    "shop=books": "购物|书店",
-    "shop=furniture": "购物|家具店",
-    "shop=hardware": "购物|五金店",
-    "shop=*": "购物|商店",
-    
-    # 交通
-    "highway=bus_stop": "交通|公交站",
-    "railway=station": "交通|火车站",
-    "railway=subway_entrance": "交通|地铁站",
-    "station=subway": "交通|地铁站",
-    "public_transport=station": "交通|公交站",
-    "aeroway=aerodrome": "交通|机场",
-    "aeroway=terminal": "交通|航站楼",
-    "amenity=bus_station": "交通|汽车站",
-    "amenity=ferry_terminal": "交通|渡口",
-    "amenity=parking": "交通|停车场",
-    "amenity=fuel": "交通|加油站",
-    "amenity=charging_station": "交通|充电站",
-    "amenity=bicycle_rental": "交通|自行车租赁",
-    "amenity=taxi": "交通|出租车站",
-    
-    # 住宿
-    "tourism=hotel": "住宿|酒店",
-    "tourism=motel": "住宿|汽车旅馆",
-    "tourism=guest_house": "住宿|民宿",
-    "tourism=hostel": "住宿|青年旅社",
-    
-    # 医疗
-    "amenity=hospital": "医疗|医院",
-    "amenity=clinic": "医疗|诊所",
-    "amenity=pharmacy": "医疗|药店",
-    "amenity=dentist": "医疗|牙科",
-    "amenity=doctors": "医疗|诊所",
-    "amenity=veterinary": "医疗|宠物医院",
-    
-    # 教育
-    "amenity=school": "教育|学校",
-    "amenity=university": "教育|大学",
-    "amenity=college": "教育|学院",
-    "amenity=kindergarten": "教育|幼儿园",
-    "amenity=library": "教育|图书馆",
-    
-    # 金融
-    "amenity=bank": "金融|银行",
-    "amenity=atm": "金融|ATM",
-    
-    # 政务
-    "amenity=townhall": "政务|政府机关",
-    "amenity=police": "政务|公安局",
-    "amenity=fire_station": "政务|消防站",
-    "amenity=post_office": "政务|邮局",
-    "amenity=courthouse": "政务|法院",
-    
-    # 休闲娱乐
-    "leisure=park": "休闲|公园",
-    "leisure=playground": "休闲|游乐场",
-    "leisure=sports_centre": "休闲|体育中心",
-    "leisure=stadium": "休闲|体育场",
-    "leisure=swimming_pool": "休闲|游泳馆",
-    "leisure=fitness_centre": "休闲|健身房",
-    "amenity=cinema": "休闲|电影院",
-    "amenity=theatre": "休闲|剧院",
-    "amenity=nightclub": "休闲|夜店",
-    "amenity=casino": "休闲|赌场",
-    
-    # 旅游景点
-    "tourism=attraction": "景点|旅游景点",
-    "tourism=museum": "景点|博物馆",
-    "tourism=gallery": "景点|美术馆",
-    "tourism=zoo": "景点|动物园",
-    "tourism=theme_park": "景点|主题公园",
-    "tourism=viewpoint": "景点|观景点",
-    "historic=monument": "景点|纪念碑",
-    "historic=memorial": "景点|纪念馆",
-    "historic=castle": "景点|城堡",
-    "historic=ruins": "景点|遗址",
-    
-    # 宗教场所
-    "amenity=place_of_worship": "宗教|宗教场所",
-    
-    # 生活服务
-    "amenity=toilets": "生活服务|公共厕所",
-    "amenity=drinking_water": "生活服务|饮水点",
-    "amenity=recycling": "生活服务|回收站",
-    "amenity=car_wash": "生活服务|洗车",
-    "amenity=laundry": "生活服务|洗衣店",
-    "shop=hairdresser": "生活服务|理发店",
-    "shop=beauty": "生活服务|美容店",
-    
-    # 住宅/小区
-    "landuse=residential": "住宅|居民区",
-    "building=apartments": "住宅|公寓楼",
-    "building=residential": "住宅|住宅楼",
-    
-    # 办公/公司
-    "office=company": "办公|公司",
-    "office=government": "政务|政府机关",
-    "building=office": "办公|办公楼",
-    "building=commercial": "办公|商业楼",
-}
+# POI 分类规则
+# OSM 标签到中文分类的映射保存在 poi_categories.json 中，
+# 加载时编译为按标签键索引的查找表，修改分类无需改动代码
+# ============================================================================
+
+DEFAULT_CATEGORIES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'poi_categories.json'
+)
+
+
+class CategoryRules:
+    """
+    编译后的 POI 分类规则
+    
+    规则形如 "key=value" 或 "key=*"（通配符）。编译后每个标签键对应一张
+    value -> (优先级, 主分类, 子分类) 的查找表：
+    - 优先级由 key_priority 的顺序决定，同一键下精确匹配优先于通配符
+    - 不出现在任何规则中的标签键只需一次字典查找即可排除
+    - 结果与标签的遍历顺序无关
+    """
+    
+    WILDCARD = '*'
+    
+    def __init__(self, categories: Dict[str, str], key_priority: List[str] = ()):
+        order = list(key_priority)
+        for rule in categories:
+            key = rule.split('=', 1)[0]
+            if key not in order:
+                order.append(key)
+        rank = {key: i for i, key in enumerate(order)}
+        
+        self.categories = dict(categories)
+        self.tables: Dict[str, Dict[str, Tuple[int, str, str]]] = {}
+        for rule, category in categories.items():
+            key, value = rule.split('=', 1)
+            parts = category.split('|')
+            main_category = parts[0] if parts[0] else "其他"
+            sub_category = parts[1] if len(parts) > 1 else ""
+            self.tables.setdefault(key, {})[value] = (rank[key], main_category, sub_category)
+        
+        # 所有规则涉及的标签键（供快速排除和 osmium 过滤器使用）
+        self.keys = frozenset(self.tables)
+    
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATEGORIES_FILE) -> 'CategoryRules':
+        """
+        从 JSON 配置文件加载分类规则
+        
+        categories 下可按分组嵌套，分组名仅用于阅读，加载时展开
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        categories = {}
+        for name, value in config.get('categories', {}).items():
+            if isinstance(value, dict):
+                categories.update(value)
+            else:
+                categories[name] = value
+        
+        return cls(categories, config.get('key_priority', []))
+    
+    def classify(self, tags: Dict[str, str]) -> Optional[Tuple[str, str]]:
+        """
+        返回 (主分类, 子分类)，无匹配时返回 None
+        """
+        tables = self.tables
+        best = None
+        for key, value in tags.items():
+            table = tables.get(key)
+            if table is None:
+                continue
+            hit = table.get(value)
+            if hit is None:
+                hit = table.get(self.WILDCARD)
+                if hit is None:
+                    continue
+            if best is None or hit[0] < best[0]:
+                best = hit
+        
+        if best is None:
+            return None
+        return best[1], best[2]
+
+
+# 名称标签，按优先级排列
+NAME_KEYS = ('name', 'name:zh', 'name:en')
+
+
+# 当前进程使用的分类规则（并行模式下由进程池初始化函数设置）
+_category_rules: Optional[CategoryRules] = None
+
+
+def get_category_rules() -> CategoryRules:
+    """返回当前分类规则，未设置时加载默认配置"""
+    global _category_rules
+    if _category_rules is None:
+        _category_rules = CategoryRules.load()
+    return _category_rules
+
+
+def set_category_rules(rules: CategoryRules):
+    """设置当前进程使用的分类规则"""
+    global _category_rules
+    _category_rules = rules
 
 
 class POIHandler(osmium.SimpleHandler):
@@ -161,9 +172,13 @@ class POIHandler(osmium.SimpleHandler):
     继承 osmium.SimpleHandler 来处理 OSM 数据
     """
     
-    def __init__(self, db_conn: sqlite3.Connection = None):
+    def __init__(self, writer: 'PoiWriter' = None, entities=None,
+                 rules: CategoryRules = None):
         super().__init__()
-        self.db_conn = db_conn
+        self.writer = writer
+        self.rules = rules or get_category_rules()
+        # 限制处理的对象类型（并行模式下按 worker 分工），None 表示不限制
+        self.entities = entities
         self.pois: List[Dict] = []
         self.node_count = 0
         self.way_count = 0
@@ -173,29 +188,111 @@ class POIHandler(osmium.SimpleHandler):
         # 用于计算 way 中心点
         self.wkb_factory = geom.WKBFactory()
     
+    def enabled_for(self):
+        """返回需要 osmium 回调的对象类型"""
+        entities = super().enabled_for()
+        if self.entities is not None:
+            entities &= self.entities
+        return entities
+    
     def _flush_pois(self):
         """批量写入 POI 到数据库，避免内存溢出"""
-        if self.db_conn and len(self.pois) >= self.batch_size:
-            insert_pois_batch(self.db_conn, self.pois)
+        if self.writer and len(self.pois) >= self.batch_size:
+            self.writer.write(self.pois)
             self.pois = []
     
-    def _get_category(self, tags: Dict[str, str]) -> Optional[str]:
+    def osmium_filters(self) -> List:
         """
-        根据 OSM 标签获取 POI 分类
+        返回在 libosmium（C++）中执行的预过滤器
+        
+        只有同时带有分类规则标签键和名称标签的对象才会进入 Python 回调，
+        其余对象（绝大多数道路、建筑、地类）不会跨越到解释器。
+        节点坐标缓存位于过滤器之前，不受影响。
         """
-        # 按优先级检查标签
-        for tag_key, tag_value in tags.items():
-            # 精确匹配
-            key = f"{tag_key}={tag_value}"
-            if key in POI_CATEGORIES:
-                return POI_CATEGORIES[key]
-            
-            # 通配符匹配
-            wildcard_key = f"{tag_key}=*"
-            if wildcard_key in POI_CATEGORIES:
-                return POI_CATEGORIES[wildcard_key]
+        return [
+            osmium.filter.KeyFilter(*self.rules.keys),
+            osmium.filter.KeyFilter(*NAME_KEYS),
+        ]
+    
+    def extract_file(self, filename: str, idx: str = 'flex_mem', two_pass: bool = False):
+        """
+        解析 OSM 文件
         
-        return None
+        idx 为节点坐标索引类型（见 osmium.index.map_types()），
+        two_pass=True 时只为候选路径引用的节点缓存坐标，见 _apply_two_pass()。
+        节点和路径处理完成后，再单独组装 multipolygon 关系，见 _apply_relation_areas()
+        """
+        if two_pass:
+            self._apply_two_pass(filename, idx)
+        else:
+            objects = self.enabled_for() & (osmium.osm.NODE | osmium.osm.WAY)
+            # 节点都需读入以缓存坐标，但不属于本处理器的对象不进入 Python 回调
+            with node_locations(idx) as lh, osmium.io.Reader(filename, osmium.osm.NODE | objects) as reader:
+                osmium.apply(reader, lh, osmium.filter.EntityFilter(objects),
+                             *self.osmium_filters(), self)
+        
+        if self.enabled_for() & osmium.osm.AREA:
+            self._apply_relation_areas(filename, idx)
+    
+    def _apply_two_pass(self, filename: str, idx: str):
+        """
+        两遍扫描，节点坐标缓存只保存候选路径引用的节点
+        
+        第一遍：处理节点 POI，同时用 IdTracker 记录候选路径引用的节点 ID
+        第二遍：只为记录的节点缓存坐标，处理路径
+        """
+        entities = self.enabled_for()
+        tracker = osmium.IdTracker()
+        
+        first_pass = osmium.osm.WAY | (entities & osmium.osm.NODE)
+        with osmium.io.Reader(filename, first_pass) as reader:
+            osmium.apply(reader, *self.osmium_filters(), _ReferenceTracker(tracker),
+                         osmium.filter.EntityFilter(osmium.osm.NODE), self)
+        
+        second_pass = osmium.osm.NODE | (entities & osmium.osm.WAY)
+        with node_locations(idx) as lh, osmium.io.Reader(filename, second_pass) as reader:
+            osmium.apply(reader, tracker.id_filter().enable_for(osmium.osm.NODE), lh,
+                         osmium.filter.EntityFilter(osmium.osm.WAY), *self.osmium_filters(), self)
+    
+    def _apply_relation_areas(self, filename: str, idx: str):
+        """
+        组装候选 multipolygon 关系并提取面状 POI（校园、公园、商场等）
+        
+        1. 只读关系：筛选带分类和名称标签的 multipolygon，交给 AreaManager，
+           同时记录其成员路径
+        2. 只读路径：补全成员路径引用的节点 ID
+        3. 只读取记录的节点和成员路径，缓存坐标并组装面，中心点由 GEOS 计算
+        
+        坐标缓存和 AreaManager 只保存候选关系用到的数据，内存与候选关系规模成正比
+        """
+        if shapely is None:
+            print("  警告: 未安装 shapely，跳过 multipolygon 关系 POI（pip install shapely）")
+            return
+        
+        area_manager = osmium.area.AreaManager()
+        tracker = osmium.IdTracker()
+        relations = _ReferenceTracker(tracker)
+        
+        with osmium.io.Reader(filename, osmium.osm.RELATION) as reader:
+            osmium.apply(reader, osmium.filter.TagFilter(('type', 'multipolygon')),
+                         *self.osmium_filters(), relations, area_manager.first_pass_handler())
+        self.relation_count += relations.relation_count
+        if not relations.relation_count:
+            return
+        
+        tracker.complete_backward_references(filename)
+        
+        # 关系成员的坐标只在本遍使用，文件型索引另用临时文件，不覆盖主扫描的索引
+        with node_locations(idx, 'relations') as lh, \
+                osmium.io.Reader(filename, osmium.osm.NODE | osmium.osm.WAY) as reader:
+            osmium.apply(reader, tracker.id_filter(), lh,
+                         area_manager.second_pass_handler(*self.osmium_filters(), self))
+    
+    def _get_category(self, tags: Dict[str, str]) -> Optional[Tuple[str, str]]:
+        """
+        根据 OSM 标签获取 POI 分类 (主分类, 子分类)
+        """
+        return self.rules.classify(tags)
     
     def _extract_poi_info(self, osm_id: int, tags: Dict[str, str], 
                           lat: float, lon: float, obj_type: str) -> Optional[Dict]:
@@ -204,7 +301,7 @@ class POIHandler(osmium.SimpleHandler):
         """
         # 获取名称，按优先级尝试：name > name:zh > name:en
         name = None
-        for name_key in ['name', 'name:zh', 'name:en']:
+        for name_key in NAME_KEYS:
             val = tags.get(name_key)
             if val and val.strip():
                 name = val.strip()
@@ -219,10 +316,7 @@ class POIHandler(osmium.SimpleHandler):
         if not category:
             return None
         
-        # 解析分类
-        category_parts = category.split('|')
-        main_category = category_parts[0] if len(category_parts) > 0 else "其他"
-        sub_category = category_parts[1] if len(category_parts) > 1 else ""
+        main_category, sub_category = category
         
         # 提取地址信息
         address_parts = []
@@ -273,15 +367,17 @@ class POIHandler(osmium.SimpleHandler):
             'opening_hours': opening_hours,
             'description': description,
             'rating': rating,
-            'tags': str(dict(tags))[:500],  # 保存原始标签（限制长度）
+            'tags': tags,  # 原始标签，写入时由 TagEncoder 编码
+            'hilbert': hilbert_key(lat, lon),
+            **grid_cells(lat, lon),
         }
     
     def node(self, n):
-        """处理节点"""
+        """处理节点（使用 osmium_filters() 时只会收到候选节点）"""
         self.node_count += 1
         
         if self.node_count % 100000 == 0:
-            print(f"  已处理 {self.node_count} 个节点, {self.way_count} 条路径, 提取 {self.poi_count} 个 POI")
+            print(f"  已处理 {self.node_count} 个候选节点, {self.way_count} 条路径, 提取 {self.poi_count} 个 POI")
         
         tags = dict(n.tags)
         if not tags:
@@ -303,6 +399,35 @@ class POIHandler(osmium.SimpleHandler):
         except Exception:
             pass  # 跳过无效节点
     
+    def _way_center(self, w) -> Optional[Tuple[float, float]]:
+        """
+        计算路径中心点 (lat, lon)
+        
+        安装 shapely 时由 osmium 原生生成 WKB、GEOS 计算（见 way_center），Python 只拿到最终坐标；
+        未安装或路径缺少节点坐标时退回节点坐标平均值（封闭路径的首尾重复节点只计一次）
+        """
+        if shapely is not None:
+            try:
+                return way_center(self.wkb_factory.create_linestring(w), w.is_closed())
+            except (osmium.InvalidLocationError, RuntimeError):
+                pass  # 缺少节点坐标或退化的路径，使用有效节点的平均值
+        
+        lats = []
+        lons = []
+        for node in w.nodes:
+            if node.location.valid():
+                lats.append(node.location.lat)
+                lons.append(node.location.lon)
+        
+        if not lats or not lons:
+            return None
+        
+        if len(lats) > 1 and w.is_closed():
+            lats.pop()
+            lons.pop()
+        
+        return sum(lats) / len(lats), sum(lons) / len(lons)
+    
     def way(self, w):
         """处理路径（用于面状 POI，如公园、商场等）"""
         self.way_count += 1
@@ -316,20 +441,11 @@ class POIHandler(osmium.SimpleHandler):
         if not category:
             return
         
-        # 计算中心点：取所有节点坐标的平均值
         try:
-            lats = []
-            lons = []
-            for node in w.nodes:
-                if node.location.valid():
-                    lats.append(node.location.lat)
-                    lons.append(node.location.lon)
-            
-            if not lats or not lons:
+            center = self._way_center(w)
+            if not center:
                 return
-            
-            center_lat = sum(lats) / len(lats)
-            center_lon = sum(lons) / len(lons)
+            center_lat, center_lon = center
             
             poi = self._extract_poi_info(
                 osm_id=w.id,
@@ -347,364 +463,3240 @@ class POIHandler(osmium.SimpleHandler):
             pass  # 跳过无效的 way
     
     def area(self, a):
-        """处理面（封闭的 way 或 relation 形成的区域）"""
-        tags = dict(a.tags)
-        if not tags:
+        """处理由 multipolygon 关系组装的面（封闭的 way 已在 way() 中处理）"""
+        if a.from_way():
             return
         
-        category = self._get_category(tags)
-        if not category:
+        tags = dict(a.tags)
+        if not tags:
             return
         
         try:
-            # 使用 osmium 的几何工厂计算中心点
-            # 对于 area，尝试获取外环的节点来计算中心
-            if a.from_way():
-                # 这是从 way 转换的 area，在 way() 中已处理
+            center = geometry_center(self.wkb_factory.create_multipolygon(a))
+            if not center:
                 return
             
-            # 对于 relation 形成的 area，跳过（在 relation 中处理）
-        except Exception:
-            pass
-    
-    def relation(self, r):
-        """处理关系（如大型建筑群、校园等）"""
-        self.relation_count += 1
-        
-        tags = dict(r.tags)
-        if not tags:
-            return
-        
-        # 只处理有名称的 relation
-        category = self._get_category(tags)
-        if not category:
-            return
-        
-        # 获取名称
-        name = None
-        for name_key in ['name', 'name:zh', 'name:en']:
-            val = tags.get(name_key)
-            if val and val.strip():
-                name = val.strip()
-                break
-        
-        if not name:
-            return
-        
-        # 对于 relation，尝试从成员中获取第一个有效的位置作为代表点
-        try:
-            for member in r.members:
-                if member.type == 'n':  # node 成员
-                    # 无法直接获取节点位置，跳过
-                    continue
-            # relation 的位置难以确定，此处暂时跳过
-            # 可以后续使用更复杂的逻辑处理
+            poi = self._extract_poi_info(
+                osm_id=a.orig_id(),
+                tags=tags,
+                lat=center[0],
+                lon=center[1],
+                obj_type='relation'
+            )
+            
+            if poi:
+                self.pois.append(poi)
+                self.poi_count += 1
+                self._flush_pois()
         except Exception:
-            pass
+            pass  # 跳过无法组装的面
 
 
-def insert_pois_batch(conn: sqlite3.Connection, pois: List[Dict]) -> int:
-    """
-    批量插入 POI 数据（内部辅助函数，用于流式写入）
+# ============================================================================
+# 网格单元
+# 经纬度按 1/2^level 度量化为网格单元编号（行号 × 每行单元数 + 列号），
+# 同一行的单元编号连续，矩形范围查询可拆成每行一次索引范围扫描。
+# 多个分辨率各存一列，查询时按范围大小选择扫描行数不超过 GRID_MAX_ROWS 的最细一级
+# ============================================================================
+
+# level 5 单元约 3.5 km，level 9 单元约 220 m（纬度方向）
+GRID_LEVELS = (5, 9)
+GRID_COLUMNS = tuple(f'cell_{level}' for level in GRID_LEVELS)
+GRID_MAX_ROWS = 16
+
+# 网格覆盖索引附带的列，附近搜索只读索引即可返回列表所需字段
+GRID_INDEX_COLUMNS = (
+    'main_category', 'lat', 'lon', 'name', 'address', 'phone',
+    'opening_hours', 'description', 'travel_time', 'rating',
+)
+
+
+def grid_cell(lat: float, lon: float, level: int) -> int:
+    """计算经纬度在指定分辨率下的网格单元编号"""
+    n = 1 << level
+    row = int((lat + 90.0) * n)
+    col = int((lon + 180.0) * n)
+    return row * 360 * n + col
+
+
+def grid_cells(lat: float, lon: float) -> Dict[str, int]:
+    """返回各分辨率的网格单元列值"""
+    return {col: grid_cell(lat, lon, level) for col, level in zip(GRID_COLUMNS, GRID_LEVELS)}
+
+
+def grid_cell_ranges(min_lat: float, max_lat: float, min_lon: float,
+                     max_lon: float) -> Tuple[str, List[Tuple[int, int]]]:
     """
-    if not pois:
-        return 0
+    将矩形范围转换为网格单元编号区间
     
-    cursor = conn.cursor()
+    返回 (列名, [(起始编号, 结束编号), ...])，每个区间对应一行网格
+    """
+    for level, column in reversed(list(zip(GRID_LEVELS, GRID_COLUMNS))):
+        n = 1 << level
+        row0 = int((min_lat + 90.0) * n)
+        row1 = int((max_lat + 90.0) * n)
+        if row1 - row0 < GRID_MAX_ROWS or level == GRID_LEVELS[0]:
+            break
     
-    insert_sql = '''
-        INSERT INTO poi (
-            osm_id, osm_type, name, name_en, main_category, sub_category,
-            lat, lon, address, phone, website, opening_hours, description, travel_time, rating, tags
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''
+    col0 = int((min_lon + 180.0) * n)
+    col1 = int((max_lon + 180.0) * n)
+    per_row = 360 * n
+    return column, [(row * per_row + col0, row * per_row + col1) for row in range(row0, row1 + 1)]
 
-    data = [
-        (
-            poi['osm_id'],
-            poi['osm_type'],
-            poi['name'],
-            poi['name_en'],
-            poi['main_category'],
-            poi['sub_category'],
-            poi['lat'],
-            poi['lon'],
-            poi['address'],
-            poi['phone'],
-            poi['website'],
-            poi['opening_hours'],
-            poi.get('description'),
-            poi.get('travel_time'),
-            poi.get('rating'),
-            poi['tags'],
-        )
-        for poi in pois
-    ]
-    
-    # 在插入前获取当前最大 ID（executemany 后 lastrowid 可能为 None）
-    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM poi")
-    max_id_before = cursor.fetchone()[0]
-    
-    cursor.executemany(insert_sql, data)
-    
-    # 同时插入 R-Tree 索引
-    # 计算新插入记录的 ID 范围
-    first_id = max_id_before + 1
-    
-    rtree_sql = '''
-        INSERT INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon)
-        VALUES (?, ?, ?, ?, ?)
-    '''
-    rtree_data = [
-        (first_id + i, poi['lat'], poi['lat'], poi['lon'], poi['lon'])
-        for i, poi in enumerate(pois)
-    ]
-    cursor.executemany(rtree_sql, rtree_data)
+
+def grid_nearby_sql(column: str, range_count: int, select: str, category: bool = False,
+                    category_column: str = 'main_category', exclude_box: bool = False) -> str:
+    """
+    构造网格范围查询：每行网格一个分支，用 UNION ALL 拼接（各行单元不重叠）
     
-    conn.commit()
-    return len(pois)
+    指定 INDEXED BY 使每个分支都在覆盖索引上做范围扫描，
+    参数依次为每个分支的 (起始编号, 结束编号[, 主分类][, 排除矩形 min_lat, max_lat, min_lon, max_lon])；
+    精简输出的数据库按 main_category_id 过滤。exclude_box 时跳过矩形内的行
+    （k 近邻上一圈已读取的范围，完整输出的覆盖索引含坐标，在索引内即可过滤）
+    """
+    branch = f'SELECT {select} FROM poi INDEXED BY idx_poi_{column} WHERE {column} BETWEEN ? AND ?'
+    if category:
+        branch += f' AND {category_column} = ?'
+    if exclude_box:
+        branch += ' AND NOT (lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?)'
+    return '\nUNION ALL\n'.join([branch] * range_count)
+
+
+# poi 表写入列（与 poi_row() 返回的元组顺序一致）
+POI_COLUMNS = (
+    'osm_id', 'osm_type', 'name', 'name_en', 'main_category', 'sub_category',
+    'lat', 'lon', 'address', 'phone', 'website', 'opening_hours', 'description',
+    'travel_time', 'rating', 'tags', 'hilbert', *GRID_COLUMNS, 'search_tokens',
+)
 
+_NAME_IDX = POI_COLUMNS.index('name')
+_ADDRESS_IDX = POI_COLUMNS.index('address')
+_SEARCH_TOKENS_IDX = POI_COLUMNS.index('search_tokens')
+_TAGS_IDX = POI_COLUMNS.index('tags')
 
-def create_database(db_path: str) -> sqlite3.Connection:
+
+def poi_row(poi: Dict) -> Tuple:
     """
-    创建 SQLite 数据库和表结构
+    将 POI 字典转换为紧凑的行元组（按 POI_COLUMNS 顺序）
     """
-    # 删除已存在的数据库
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # 创建主表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS poi (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            osm_id INTEGER NOT NULL,
-            osm_type TEXT NOT NULL,
-            name TEXT NOT NULL,
-            name_en TEXT,
-            main_category TEXT NOT NULL,
-            sub_category TEXT,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            address TEXT,
-            phone TEXT,
-            website TEXT,
-            opening_hours TEXT,
-            description TEXT,
-            travel_time TEXT,
-            rating REAL,
-            tags TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 创建 FTS5 虚拟表用于全文搜索
-    cursor.execute('''
-        CREATE VIRTUAL TABLE IF NOT EXISTS poi_fts USING fts5(
-            name,
-            name_en,
-            main_category,
-            sub_category,
-            address,
-            content='poi',
-            content_rowid='id',
-            tokenize='unicode61'
-        )
-    ''')
-    
-    # 创建触发器以保持 FTS 表同步
-    cursor.execute('''
-        CREATE TRIGGER poi_ai AFTER INSERT ON poi BEGIN
-            INSERT INTO poi_fts(rowid, name, name_en, main_category, sub_category, address)
-            VALUES (new.id, new.name, new.name_en, new.main_category, new.sub_category, new.address);
-        END
-    ''')
+    return tuple(poi.get(col) for col in POI_COLUMNS)
+
+
+# ============================================================================
+# 分类统计与密度直方图
+# 写入时在内存中累计 (主分类, 子分类) 计数和各级网格单元内每个主分类的 POI 数，
+# 结束写入时一次写入 category_stats 和 poi_density，不再对 poi 表做 GROUP BY。
+# 查询时用密度直方图估算 k 近邻的初始半径、统计范围内各分类的数量
+# ============================================================================
+
+# level 3 / 5 / 7 单元约 14 km / 3.5 km / 870 m（纬度方向）。
+# 更细的级别在城区几乎每个单元只有一两条 POI，行数接近 POI 数，不再起到汇总作用
+# 须从粗到细排列：只按最细一级累计，其余级别由其汇总
+DENSITY_LEVELS = (3, 5, 7)
+
+# 精简输出中分类列与 poi 表一致改为 main_category_id
+POI_DENSITY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        level INTEGER NOT NULL,
+        cell INTEGER NOT NULL,
+        {category} {category_type} NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (level, cell, {category})
+    ) WITHOUT ROWID
+'''
+
+_MAIN_CATEGORY_IDX = POI_COLUMNS.index('main_category')
+_SUB_CATEGORY_IDX = POI_COLUMNS.index('sub_category')
+_LAT_IDX = POI_COLUMNS.index('lat')
+_LON_IDX = POI_COLUMNS.index('lon')
+
+
+class PoiStatsEntry(NamedTuple):
+    """PoiStats 按条累计的一条 POI（PoiWriter.upsert() / delete() 的返回值）"""
+    main_category: str
+    sub_category: Optional[str]
+    lat: float
+    lon: float
+
+
+class PoiStats:
+    """
+    分类计数和密度直方图的内存累计
     
-    cursor.execute('''
-        CREATE TRIGGER poi_ad AFTER DELETE ON poi BEGIN
-            INSERT INTO poi_fts(poi_fts, rowid, name, name_en, main_category, sub_category, address)
-            VALUES('delete', old.id, old.name, old.name_en, old.main_category, old.sub_category, old.address);
-        END
-    ''')
+    密度只按最细一级（DENSITY_LEVELS[-1]）的单元累计，较粗的级别在写入时由细单元汇总
+    （级别相差 d 时，粗单元行列号 = 细单元行列号 >> d）。
     
-    cursor.execute('''
-        CREATE TRIGGER poi_au AFTER UPDATE ON poi BEGIN
-            INSERT INTO poi_fts(poi_fts, rowid, name, name_en, main_category, sub_category, address)
-            VALUES('delete', old.id, old.name, old.name_en, old.main_category, old.sub_category, old.address);
-            INSERT INTO poi_fts(rowid, name, name_en, main_category, sub_category, address)
-            VALUES (new.id, new.name, new.name_en, new.main_category, new.sub_category, new.address);
-        END
-    ''')
+    save() 写入数据库：replace=True 时覆盖两张表（新生成的数据库），
+    否则作为增量加到已有计数上（去重、增量更新），计数归零的行被删除
+    """
     
-    # 创建 R-Tree 空间索引（用于高效的范围查询和附近搜索）
-    cursor.execute('''
-        CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree(
-            id,
-            min_lat, max_lat,
-            min_lon, max_lon
-        )
-    ''')
+    def __init__(self):
+        self.categories: Counter = Counter()
+        self.density: Counter = Counter()
     
-    # 创建普通索引
-    cursor.execute('CREATE INDEX idx_poi_category ON poi(main_category, sub_category)')
-    cursor.execute('CREATE INDEX idx_poi_name ON poi(name)')
+    def add(self, main_category: str, sub_category: Optional[str], lat: float, lon: float, delta: int = 1):
+        """累计单条 POI（delta=-1 表示移除）"""
+        self.categories[(main_category, sub_category)] += delta
+        self.density[(grid_cell(lat, lon, DENSITY_LEVELS[-1]), main_category)] += delta
     
-    # 创建分类统计表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS category_stats (
-            main_category TEXT NOT NULL,
-            sub_category TEXT,
-            count INTEGER DEFAULT 0,
-            PRIMARY KEY (main_category, sub_category)
-        )
-    ''')
+    def add_rows(self, rows: List[Tuple]):
+        """累计 POI 行元组（按 POI_COLUMNS 顺序）"""
+        self.categories.update((row[_MAIN_CATEGORY_IDX], row[_SUB_CATEGORY_IDX]) for row in rows)
+        n = 1 << DENSITY_LEVELS[-1]
+        width = 360 * n
+        self.density.update((int((row[_LAT_IDX] + 90.0) * n) * width + int((row[_LON_IDX] + 180.0) * n),
+                             row[_MAIN_CATEGORY_IDX]) for row in rows)
     
-    # 创建元数据表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS metadata (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )
-    ''')
+    def density_rows(self) -> Counter:
+        """各级别的密度计数 {(level, cell, main_category): count}"""
+        finest = DENSITY_LEVELS[-1]
+        width = 360 << finest
+        counts = Counter()
+        for (cell, main_category), count in self.density.items():
+            row, col = divmod(cell, width)
+            for level in DENSITY_LEVELS:
+                shift = finest - level
+                counts[(level, (row >> shift) * (360 << level) + (col >> shift), main_category)] += count
+        return counts
     
-    conn.commit()
-    return conn
+    def save(self, conn: sqlite3.Connection, replace: bool = False):
+        """写入 category_stats 和 poi_density，由调用方提交事务"""
+        cursor = conn.cursor()
+        has_density = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'poi_density'"
+        ).fetchone()
+        if replace:
+            cursor.execute(POI_DENSITY_TABLE_SQL.format(table='poi_density', category='main_category',
+                                                        category_type='TEXT'))
+            cursor.execute('DELETE FROM category_stats')
+            cursor.execute('DELETE FROM poi_density')
+            cursor.executemany('INSERT INTO category_stats (main_category, sub_category, count) VALUES (?, ?, ?)',
+                               [(*key, count) for key, count in self.categories.items() if count > 0])
+            cursor.executemany('INSERT INTO poi_density (level, cell, main_category, count) VALUES (?, ?, ?, ?)',
+                               [(*key, count) for key, count in sorted(self.density_rows().items()) if count > 0])
+            return
+        
+        # sub_category 可以为 NULL，主键冲突检测不到，逐条按 IS 匹配更新
+        for (main, sub), count in self.categories.items():
+            if not count:
+                continue
+            cursor.execute('UPDATE category_stats SET count = count + ? WHERE main_category = ? AND sub_category IS ?',
+                           (count, main, sub))
+            if not cursor.rowcount:
+                cursor.execute('INSERT INTO category_stats (main_category, sub_category, count) VALUES (?, ?, ?)',
+                               (main, sub, count))
+        cursor.execute('DELETE FROM category_stats WHERE count <= 0')
+        
+        # 旧版本生成的数据库没有密度直方图，不写入不完整的计数
+        if has_density:
+            cursor.executemany('''
+                INSERT INTO poi_density (level, cell, main_category, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (level, cell, main_category) DO UPDATE SET count = count + excluded.count
+            ''', [(*key, count) for key, count in self.density_rows().items() if count])
+            cursor.execute('DELETE FROM poi_density WHERE count <= 0')
+
+
+# ============================================================================
+# 标签编码
+# 原始标签不再以截断的 dict 文本保存：键名登记在 tag_keys 表中，
+# 每条 POI 的 tags 列是 [varint 键 ID][varint 值字节数][UTF-8 值] 的连续序列。
+# ============================================================================
+
+TAGS_ENCODING = 'keyed-varint'
+
+TAG_KEYS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS tag_keys (
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE
+    )
+'''
+
+
+def _write_varint(out: bytearray, value: int):
+    """追加 varint（每字节 7 位，低位在前）"""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
 
 
-def insert_pois(conn: sqlite3.Connection, pois: List[Dict]) -> int:
+class TagEncoder:
     """
-    批量插入 POI 数据（处理剩余的 POI，主要数据已在解析时流式写入）
+    标签编码器，由 PoiWriter 持有
+
+    启动时读入已有的键名表，遇到新键名时分配下一个 ID 并写入 tag_keys
+    （与 POI 行在同一事务中提交），增量更新沿用同一张键名表
     """
-    if not pois:
-        return 0
-    
-    cursor = conn.cursor()
     
-    insert_sql = '''
-        INSERT INTO poi (
-            osm_id, osm_type, name, name_en, main_category, sub_category,
-            lat, lon, address, phone, website, opening_hours, tags
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        conn.execute(TAG_KEYS_TABLE_SQL)
+        self.key_ids = {key: key_id for key_id, key in conn.execute('SELECT id, key FROM tag_keys')}
     
-    batch_size = 1000
-    total = len(pois)
-    inserted = 0
-    
-    for i in range(0, total, batch_size):
-        batch = pois[i:i+batch_size]
-        
-        # 在插入前获取当前最大 ID（executemany 后 lastrowid 可能为 None）
-        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM poi")
-        max_id_before = cursor.fetchone()[0]
-        
-        data = [
-            (
-                poi['osm_id'],
-                poi['osm_type'],
-                poi['name'],
-                poi['name_en'],
-                poi['main_category'],
-                poi['sub_category'],
-                poi['lat'],
-                poi['lon'],
-                poi['address'],
-                poi['phone'],
-                poi['website'],
-                poi['opening_hours'],
-                poi['tags'],
-            )
-            for poi in batch
-        ]
-        
-        cursor.executemany(insert_sql, data)
-        
-        # 计算新插入记录的 ID 范围用于 R-Tree
-        first_id = max_id_before + 1
-        
-        # 插入 R-Tree 索引
-        rtree_sql = '''
-            INSERT INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon)
-            VALUES (?, ?, ?, ?, ?)
-        '''
-        rtree_data = [
-            (first_id + j, poi['lat'], poi['lat'], poi['lon'], poi['lon'])
-            for j, poi in enumerate(batch)
-        ]
-        cursor.executemany(rtree_sql, rtree_data)
-        
-        inserted += len(batch)
-        
-        if inserted % 5000 == 0:
-            print(f"  已插入 {inserted}/{total} 条记录")
+    def _key_id(self, key: str) -> int:
+        key_id = len(self.key_ids) + 1
+        self.key_ids[key] = key_id
+        self.conn.execute('INSERT INTO tag_keys (id, key) VALUES (?, ?)', (key_id, key))
+        return key_id
     
-    conn.commit()
-    return inserted
+    def encode(self, tags: Optional[Dict[str, str]]) -> Optional[bytes]:
+        if not tags:
+            return None
+        out = bytearray()
+        for key, value in tags.items():
+            key_id = self.key_ids.get(key) or self._key_id(key)
+            data = value.encode('utf-8')
+            _write_varint(out, key_id)
+            _write_varint(out, len(data))
+            out += data
+        return bytes(out)
+
+
+def load_tag_keys(conn: sqlite3.Connection) -> Dict[int, str]:
+    """读取键名表（ID → 键名），旧数据库没有该表时返回空字典"""
+    try:
+        return dict(conn.execute('SELECT id, key FROM tag_keys'))
+    except sqlite3.OperationalError:
+        return {}
 
 
-def update_category_stats(conn: sqlite3.Connection):
+def decode_tags(blob: Optional[bytes], keys: Dict[int, str]) -> Dict[str, str]:
     """
-    更新分类统计信息
+    解码 tags 列，keys 为 load_tag_keys() 的结果
+
+    旧版本数据库的 tags 列是截断的 dict 文本，无法可靠解析，返回空字典
     """
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO category_stats (main_category, sub_category, count)
-        SELECT main_category, sub_category, COUNT(*) as count
-        FROM poi
-        GROUP BY main_category, sub_category
-    ''')
-    
-    conn.commit()
+    if not isinstance(blob, bytes):
+        return {}
+    tags = {}
+    pos = 0
+    end = len(blob)
+    while pos < end:
+        key_id, pos = _read_varint(blob, pos)
+        length, pos = _read_varint(blob, pos)
+        tags[keys[key_id]] = blob[pos:pos + length].decode('utf-8')
+        pos += length
+    return tags
+
+
+
+# ============================================================================
+# 中文全文索引
+# unicode61 分词器把连续的汉字当作一个词，"酒店" 无法命中 "汉口江滩酒店"。
+# bigram 模式预先把名称和地址切成重叠的二元组存入 search_tokens 列，
+# 查询时把关键词切成同样的二元组做短语匹配，任意长度的子串都能走索引。
+# ============================================================================
+
+FTS_COLUMNS = ('name', 'name_en', 'main_category', 'sub_category', 'address')
+
+# 可选的 FTS 分词方式：unicode61（默认）、trigram（FTS5 三元组）、bigram（预计算二元组列）
+FTS_TOKENIZERS = ('unicode61', 'trigram', 'bigram')
+
+CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{CJK_CHARS}]+)|([^\\W{CJK_CHARS}]+)')
+
+
+def cjk_bigrams(text: Optional[str]) -> str:
+    """
+    将文本切分为空格分隔的词：连续汉字切成重叠二元组，末尾汉字再单独保留一个
+    （保证每个汉字都是某个词的开头，单字前缀查询可以命中），其他字母数字串保持不变
+    
+    例如 "汉口江滩酒店" -> "汉口 口江 江滩 滩酒 酒店 店"
+    """
+    if not text:
+        return ''
+    
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+    return ' '.join(tokens)
+
+
+def cjk_fts_query(keyword: str, phrase: bool = True) -> str:
+    """
+    为 bigram 索引构造 FTS5 查询表达式
+    
+    多个汉字组成二元组短语，单个汉字和其他词做前缀匹配，各部分之间为 AND。
+    phrase=False 时二元组之间也是 AND（detail=none 的索引没有位置信息，不支持短语查询）
+    """
+    parts = []
+    for cjk, word in _TOKEN_RE.findall(keyword):
+        if word:
+            parts.append(f'"{word}"*')
+        elif len(cjk) == 1:
+            parts.append(f'"{cjk}"*')
+        elif phrase:
+            parts.append('"' + ' '.join(cjk[i:i + 2] for i in range(len(cjk) - 1)) + '"')
+        else:
+            parts.extend(f'"{cjk[i:i + 2]}"' for i in range(len(cjk) - 1))
+    return ' '.join(parts)
+
+
+def create_fts_table(cursor: sqlite3.Cursor, tokenizer: str = 'unicode61'):
+    """
+    创建 poi_fts 外部内容 FTS5 表
+    
+    bigram 模式额外索引 search_tokens 列（由 PoiWriter 写入名称和地址的二元组）
+    """
+    if tokenizer not in FTS_TOKENIZERS:
+        raise ValueError(f"不支持的 FTS 分词方式: {tokenizer}")
+    
+    columns = list(FTS_COLUMNS)
+    if tokenizer == 'bigram':
+        columns.append('search_tokens')
+    
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS poi_fts USING fts5(
+            {', '.join(columns)},
+            content='poi',
+            content_rowid='id',
+            tokenize='{'trigram' if tokenizer == 'trigram' else 'unicode61'}'
+        )
+    ''')
+    cursor.execute(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES ('fts_tokenizer', ?)", (tokenizer,)
+    )
+
+
+def fts_columns(cursor: sqlite3.Cursor) -> List[str]:
+    """返回 poi_fts 表的索引列"""
+    return [row[0] for row in cursor.execute("SELECT name FROM pragma_table_info('poi_fts')").fetchall()]
+
+
+# ============================================================================
+# 空间排序键
+# 经纬度映射到 2^HILBERT_ORDER × 2^HILBERT_ORDER 网格后计算 Hilbert 曲线序号，
+# 序号相近的点在空间上也相近，按此排序可让相邻 POI 落在相同的数据页中
+# ============================================================================
+
+# 20 阶网格单元约 0.00034°（约 38 m），序号不超过 2^40
+HILBERT_ORDER = 20
+
+
+def hilbert_key(lat: float, lon: float, order: int = HILBERT_ORDER) -> int:
+    """
+    计算经纬度的 Hilbert 曲线序号
+    """
+    n = 1 << order
+    x = min(int((lon + 180.0) / 360.0 * n), n - 1)
+    y = min(int((lat + 90.0) / 180.0 * n), n - 1)
+    
+    d = 0
+    s = n >> 1
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        # 旋转象限，保证曲线连续
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+class _ReferenceTracker(osmium.SimpleHandler):
+    """记录路径引用的节点、关系引用的成员 ID（预扫描阶段使用）"""
+    
+    def __init__(self, tracker: 'osmium.IdTracker'):
+        super().__init__()
+        self.tracker = tracker
+        self.relation_count = 0
+    
+    def way(self, w):
+        self.tracker.add_references(w)
+    
+    def relation(self, r):
+        self.relation_count += 1
+        self.tracker.add_references(r)
+
+
+def geometry_center(wkb: str) -> Optional[Tuple[float, float]]:
+    """
+    计算面几何的代表点 (lat, lon)，由 GEOS 原生计算
+    
+    取面积加权质心；质心落在面外时（凹多边形、多个分离部分）改用面内点
+    """
+    return _polygon_center(shapely.from_wkb(wkb))
+
+
+def _polygon_center(geometry) -> Optional[Tuple[float, float]]:
+    if geometry.is_empty:
+        return None
+    
+    point = geometry.centroid
+    if not geometry.contains(point):
+        point = geometry.point_on_surface()
+    return point.y, point.x
+
+
+# 节点数达到此值的路径用 numpy 向量运算计算中心点，更少时逐点计算的开销更小
+WAY_CENTER_NUMPY_MIN = 32
+
+
+def _ring_center_numpy(x, y, closed: bool) -> Tuple[float, float, bool]:
+    """
+    以首个节点为原点的坐标数组，返回 (cx, cy, 是否在面内)
+    
+    封闭且面积不为 0 时为面积加权质心（鞋带公式），否则为按长度加权的线质心（视为在面内）
+    """
+    x0, x1, y0, y1 = x[:-1], x[1:], y[:-1], y[1:]
+    if closed:
+        cross = x0 * y1 - x1 * y0
+        area = cross.sum()
+        if area != 0:
+            cx = np.dot(x0 + x1, cross) / (3 * area)
+            cy = np.dot(y0 + y1, cross) / (3 * area)
+            # 射线法：与过质心水平线相交的边中，交点在质心右侧的条数为奇数时质心在面内
+            c = (y0 > cy) != (y1 > cy)
+            hits = x0[c] + (cy - y0[c]) * (x1[c] - x0[c]) / (y1[c] - y0[c]) > cx
+            return float(cx), float(cy), np.count_nonzero(hits) % 2 == 1
+    lengths = np.hypot(x1 - x0, y1 - y0)
+    total = lengths.sum()
+    if total == 0:
+        return 0.0, 0.0, True
+    return float(np.dot(x0 + x1, lengths) / (2 * total)), float(np.dot(y0 + y1, lengths) / (2 * total)), True
+
+
+def _ring_center_python(x: List[float], y: List[float], closed: bool) -> Tuple[float, float, bool]:
+    """与 _ring_center_numpy 相同的计算，用于节点较少的路径"""
+    segments = list(zip(x, x[1:], y, y[1:]))
+    if closed:
+        area = cx = cy = 0.0
+        for x0, x1, y0, y1 in segments:
+            cross = x0 * y1 - x1 * y0
+            area += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+        if area != 0:
+            cx /= 3 * area
+            cy /= 3 * area
+            hits = sum(1 for x0, x1, y0, y1 in segments
+                       if (y0 > cy) != (y1 > cy) and x0 + (cy - y0) * (x1 - x0) / (y1 - y0) > cx)
+            return cx, cy, hits % 2 == 1
+    total = cx = cy = 0.0
+    for x0, x1, y0, y1 in segments:
+        length = math.hypot(x1 - x0, y1 - y0)
+        total += length
+        cx += (x0 + x1) * length
+        cy += (y0 + y1) * length
+    if total == 0:
+        return 0.0, 0.0, True
+    return cx / (2 * total), cy / (2 * total), True
+
+
+def way_center(wkb: str, closed: bool) -> Optional[Tuple[float, float]]:
+    """
+    计算路径的代表点 (lat, lon)，wkb 为 osmium WKBFactory 生成的线串（小端、无 SRID）
+    
+    坐标直接从 WKB 字节读取，不在 Python 中遍历节点对象；节点多的路径用 numpy 向量运算。
+    封闭路径取面积加权质心，不受节点疏密影响，质心落在面外时（凹多边形）由 GEOS 取面内点；
+    非封闭路径（或自相交导致面积为 0 的环）取按长度加权的线质心
+    """
+    data = bytes.fromhex(wkb)
+    count = struct.unpack_from('<I', data, 5)[0]
+    closed = closed and count >= 4
+    if count >= WAY_CENTER_NUMPY_MIN:
+        coords = np.frombuffer(data, dtype='<f8', offset=9).reshape(-1, 2)
+        ox, oy = coords[0].tolist()
+        # 以首个节点为原点，减小大坐标值相乘的舍入误差
+        cx, cy, inside = _ring_center_numpy(coords[:, 0] - ox, coords[:, 1] - oy, closed)
+    else:
+        values = struct.unpack_from(f'<{count * 2}d', data, 9)
+        ox, oy = values[0], values[1]
+        cx, cy, inside = _ring_center_python([v - ox for v in values[0::2]],
+                                             [v - oy for v in values[1::2]], closed)
+    
+    if not inside:
+        coords = np.frombuffer(data, dtype='<f8', offset=9).reshape(-1, 2)
+        point = shapely.point_on_surface(shapely.polygons(coords))
+        if not point.is_empty:
+            return point.y, point.x
+    return cy + oy, cx + ox
+
+
+# ============================================================================
+# 节点坐标索引与内存统计
+# ============================================================================
+
+# 需要磁盘文件的坐标索引类型，未指定路径时在输出目录创建临时文件
+FILE_INDEX_TYPES = ('dense_file_array', 'sparse_file_array')
+
+
+def resolve_location_index(idx: str, work_dir: str) -> Tuple[str, Optional[str]]:
+    """
+    校验坐标索引类型，为文件型索引补全路径
+    
+    返回 (osmium 索引描述字符串, 需要清理的临时文件路径或 None)
+    """
+    idx_type, _, path = idx.partition(',')
+    if idx_type not in osmium.index.map_types():
+        raise ValueError(f"不支持的坐标索引类型: {idx_type}，可选: {', '.join(osmium.index.map_types())}")
+    
+    if idx_type in FILE_INDEX_TYPES and not path:
+        path = os.path.join(work_dir or '.', f'.node_locations.{os.getpid()}.idx')
+        return f'{idx_type},{path}', path
+    return idx, None
+
+
+@contextmanager
+def node_locations(idx: str, suffix: Optional[str] = None):
+    """
+    为一遍扫描创建节点坐标缓存（NodeLocationsForWays，忽略缺失的坐标）
+    
+    文件型索引每遍都从空文件开始：sparse_file_array 打开已有文件时在旧记录之后追加，
+    多遍复用同一文件会查不到部分节点。suffix 为空时使用索引路径本身（主扫描，文件保留，
+    供增量更新使用或由调用方清理）；否则使用 <路径>.<suffix>，扫描结束后删除
+    """
+    idx_type, _, path = idx.partition(',')
+    tmp = None
+    if idx_type in FILE_INDEX_TYPES and path:
+        if suffix:
+            path = tmp = f'{path}.{suffix}'
+            idx = f'{idx_type},{path}'
+        if os.path.exists(path):
+            os.remove(path)
+    try:
+        lh = osmium.NodeLocationsForWays(osmium.index.create_map(idx))
+        lh.ignore_errors()
+        yield lh
+    finally:
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def peak_rss_mb() -> float:
+    """返回本进程及已结束子进程中的最大峰值内存 (RSS, MB)"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux 上单位为 KB，macOS 上为字节
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+# ============================================================================
+# 运行剖析（--profile）
+# 为处理器回调和写入器方法加计时包装，定期把进度写入 JSON Lines 文件，
+# 结束时输出汇总：osmium 解析、Python 回调、SQLite 写入各占多少时间
+# ============================================================================
+
+# 进度记录间隔（秒）
+PROFILE_INTERVAL = 5.0
+
+
+class Profiler:
+    """
+    记录各回调 / 方法的调用次数和累计耗时（含内部调用），并输出 JSON Lines
+    
+    每行一条记录：{"event": "start" | "progress" | "stage" | "summary", "elapsed": 秒, ...}
+    """
+    
+    HANDLER_METHODS = ('node', 'way', 'area', '_extract_poi_info', '_flush_pois')
+    WRITER_METHODS = ('write_rows', 'finish')
+    # PipelinedWriter.write() 不经过 write_rows()，直接把 POI 字典放入队列
+    PIPELINE_METHODS = ('write', 'write_rows', 'finish')
+    
+    def __init__(self, path: str, interval: float = PROFILE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stream = open(path, 'w', encoding='utf-8')
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+        self.stages: Dict[str, float] = {}
+        self.writer: Optional['PoiWriter'] = None
+        # 流水线写入时写入线程也会计时和输出进度
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.next_emit = self.started + interval
+        self.emit('start', pid=os.getpid())
+    
+    def wrap(self, name: str, func):
+        """返回计时包装后的函数（同名函数的计数累加，多城市输出的各写入线程合计）"""
+        calls, seconds, lock = self.calls, self.seconds, self.lock
+        with lock:
+            calls.setdefault(name, 0)
+            seconds.setdefault(name, 0.0)
+        
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                with lock:
+                    calls[name] += 1
+                    seconds[name] += end - start
+                if end >= self.next_emit:
+                    self.progress()
+        return timed
+    
+    def instrument(self, handler: Optional['POIHandler'], writer: 'PoiWriter', pipelined: bool = False):
+        """
+        替换处理器和写入器实例上的方法（osmium 按实例属性查找回调）
+        
+        流水线写入（pipelined）时 writer 的方法只是把批次放入队列，计为 pipeline.*
+        （解析线程等待队列空位的时间）；SQLite 写入由写入线程用 instrument_writer()
+        包装其中的 PoiWriter 计时
+        """
+        if handler is not None:
+            for name in self.HANDLER_METHODS:
+                setattr(handler, name, self.wrap(name, getattr(handler, name)))
+        if pipelined:
+            for name in self.PIPELINE_METHODS:
+                setattr(writer, name, self.wrap(f'pipeline.{name}', getattr(writer, name)))
+        else:
+            self.instrument_writer(writer)
+        self.writer = writer
+    
+    def instrument_writer(self, writer: 'PoiWriter'):
+        """包装写入器的 WRITER_METHODS，计为 sqlite.<方法名>"""
+        for name in self.WRITER_METHODS:
+            setattr(writer, name, self.wrap(f'sqlite.{name}', getattr(writer, name)))
+    
+    def stage(self, name: str, seconds: float):
+        """记录主流程一个步骤的耗时（多城市输出时同名步骤累加）"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.emit('stage', stage=name, seconds=round(seconds, 4))
+    
+    def emit(self, event: str, **fields):
+        record = {'event': event, 'elapsed': round(time.perf_counter() - self.started, 3), **fields}
+        with self.lock:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.stream.flush()
+    
+    def _snapshot(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        rows = self.writer.count if self.writer else 0
+        with self.lock:
+            calls, seconds = dict(self.calls), dict(self.seconds)
+        return {
+            'rows': rows,
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else 0.0,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'sqlite_seconds': round(self.sqlite_seconds(), 4),
+            'calls': calls,
+            'seconds': {name: round(value, 4) for name, value in seconds.items()},
+        }
+    
+    def progress(self):
+        self.next_emit = time.perf_counter() + self.interval
+        self.emit('progress', **self._snapshot())
+    
+    def sqlite_seconds(self) -> float:
+        with self.lock:
+            return sum(value for name, value in self.seconds.items() if name.startswith('sqlite.'))
+    
+    def summary(self) -> Dict:
+        """
+        写入并返回汇总
+        
+        parse 为解析步骤中不在 Python 回调内的时间（osmium 读取解码、坐标缓存、C++ 过滤），
+        python 为回调自身的时间（不含回调中触发的 SQLite 写入），sqlite 为全部写入与建索引时间
+        """
+        callbacks = sum(self.seconds.get(name, 0.0) for name in ('node', 'way', 'area'))
+        # 回调内部 _flush_pois 触发的写入不计入 python
+        flush_sqlite = self.seconds.get('_flush_pois', 0.0)
+        parse_stage = self.stages.get('parse', 0.0)
+        breakdown = {
+            'parse': max(parse_stage - callbacks, 0.0) if callbacks else None,
+            'python': callbacks - flush_sqlite if callbacks else None,
+            'sqlite': self.sqlite_seconds(),
+        }
+        summary = {
+            'total_seconds': round(time.perf_counter() - self.started, 3),
+            **self._snapshot(),
+            'stages': {name: round(value, 4) for name, value in self.stages.items()},
+            'breakdown': {k: round(v, 4) for k, v in breakdown.items() if v is not None},
+        }
+        self.emit('summary', **summary)
+        return summary
+    
+    def close(self):
+        self.stream.close()
+
+
+def dump_tracemalloc(path: str, limit: int = 30):
+    """按代码行保存内存分配排行（需已调用 tracemalloc.start()）"""
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"当前 {current / 1024 / 1024:.1f} MB, 峰值 {peak / 1024 / 1024:.1f} MB\n\n")
+        for stat in snapshot.statistics('lineno')[:limit]:
+            f.write(f"{stat}\n")
+
+
+def print_profile(summary: Dict):
+    """打印剖析汇总"""
+    print("\n" + "=" * 60)
+    print("运行剖析")
+    print("=" * 60)
+    for name, value in summary['stages'].items():
+        print(f"  步骤 {name:<12} {value:9.3f} s")
+    print()
+    for name, calls in summary['calls'].items():
+        seconds = summary['seconds'][name]
+        per_call = seconds / calls * 1e6 if calls else 0.0
+        print(f"  {name:<20} {calls:>10} 次 {seconds:9.3f} s  {per_call:8.1f} µs/次")
+    print()
+    labels = {'parse': 'osmium 解析', 'python': 'Python 回调', 'sqlite': 'SQLite'}
+    for name, value in summary['breakdown'].items():
+        print(f"  {labels[name]:<12} {value:9.3f} s")
+    print(f"\n  写入 {summary['rows']} 行, {summary['rows_per_second']:.0f} 行/秒, "
+          f"峰值内存 {summary['peak_rss_mb']:.1f} MB")
+
+
+# ============================================================================
+# 多进程并行提取
+# 按 PBF 数据块（blob）切分文件：节点块由进程池并行分类，
+# 路径需要完整的节点坐标，由单独的 worker 扫描全文件处理。
+# 所有结果按文件顺序交给主进程统一写入，保证与串行模式行顺序一致。
+# ============================================================================
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """读取 protobuf varint，返回 (值, 新位置)"""
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_blob_header(buf: bytes) -> Tuple[str, int]:
+    """解析 PBF BlobHeader，返回 (type, datasize)"""
+    blob_type = ''
+    datasize = 0
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 0x07
+        if wire == 2:
+            length, pos = _read_varint(buf, pos)
+            if field == 1:
+                blob_type = buf[pos:pos + length].decode('ascii')
+            pos += length
+        elif wire == 0:
+            value, pos = _read_varint(buf, pos)
+            if field == 3:
+                datasize = value
+        else:
+            raise ValueError(f"无法解析的 BlobHeader 字段类型: {wire}")
+    return blob_type, datasize
+
+
+def scan_pbf_blocks(path: str) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    扫描 PBF 文件的数据块边界（只读块头，不解压）
+    
+    返回 (OSMHeader 块原始字节, [(偏移, 长度), ...] 的 OSMData 块列表)
+    """
+    header_bytes = b''
+    blocks = []
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            size_buf = f.read(4)
+            if len(size_buf) < 4:
+                break
+            header_size = struct.unpack('>I', size_buf)[0]
+            blob_type, datasize = _parse_blob_header(f.read(header_size))
+            length = 4 + header_size + datasize
+            if blob_type == 'OSMHeader':
+                f.seek(offset)
+                header_bytes = f.read(length)
+            else:
+                f.seek(datasize, os.SEEK_CUR)
+                blocks.append((offset, length))
+            offset += length
+    return header_bytes, blocks
+
+
+def _init_worker(rules: CategoryRules):
+    """进程池初始化：设置 worker 使用的分类规则"""
+    set_category_rules(rules)
+
+
+def _extract_node_blocks(task: Tuple[str, bytes, int, int]) -> Tuple[int, List[Tuple]]:
+    """
+    worker: 解析一段连续的 PBF 数据块中的节点 POI
+    
+    返回 (节点数, POI 行元组列表)
+    """
+    path, header_bytes, start, length = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(length)
+    
+    handler = POIHandler(entities=osmium.osm.NODE)
+    handler.apply_buffer(header_bytes + data, 'pbf', filters=handler.osmium_filters())
+    return handler.node_count, [poi_row(poi) for poi in handler.pois]
+
+
+class _RowSpill:
+    """
+    路径 worker 的写入器：每批 POI 转换为行元组后 pickle 追加到临时文件
+    
+    路径和关系 POI 不在 worker 中累积成一个大列表，也不经进程池的结果管道一次传回；
+    主进程写完节点后用 read_row_spill() 逐批读回写入，写入顺序与串行模式相同
+    """
+    
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.count = 0
+    
+    def write(self, pois: List[Dict]) -> int:
+        if pois:
+            pickle.dump([poi_row(poi) for poi in pois], self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.count += len(pois)
+        return len(pois)
+    
+    def close(self):
+        self.file.close()
+
+
+def read_row_spill(path: str) -> Iterator[List[Tuple]]:
+    """逐批读取 _RowSpill 写入的行元组列表"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _extract_ways(path: str, idx: str, two_pass: bool, spill_path: str) -> Tuple[int, int, int]:
+    """
+    worker: 扫描全文件（节点坐标只在 C++ 中缓存），提取路径和 multipolygon 关系 POI，
+    按批写入 spill_path（见 _RowSpill）
+    
+    返回 (路径数, 关系数, POI 数)
+    """
+    spill = _RowSpill(spill_path)
+    try:
+        handler = POIHandler(writer=spill, entities=osmium.osm.WAY | osmium.osm.AREA)
+        handler.extract_file(path, idx=idx, two_pass=two_pass)
+        spill.write(handler.pois)
+    finally:
+        spill.close()
+    return handler.way_count, handler.relation_count, spill.count
+
+
+def extract_parallel(writer: 'PoiWriter', input_file: str, workers: int,
+                     rules: CategoryRules = None, idx: str = 'flex_mem', two_pass: bool = False,
+                     batch_size: int = 1000) -> Dict[str, int]:
+    """
+    多进程并行提取 POI，由主进程作为唯一写入者
+    
+    返回处理计数 {'node_count', 'way_count', 'relation_count', 'poi_count'}
+    """
+    header_bytes, blocks = scan_pbf_blocks(input_file)
+    
+    # 每个 worker 分配若干个任务，任务粒度越细负载越均衡
+    chunk_count = max(1, min(len(blocks), workers * 4))
+    chunk_len = (len(blocks) + chunk_count - 1) // chunk_count
+    tasks = []
+    for i in range(0, len(blocks), chunk_len):
+        chunk = blocks[i:i + chunk_len]
+        start = chunk[0][0]
+        end = chunk[-1][0] + chunk[-1][1]
+        tasks.append((input_file, header_bytes, start, end - start))
+    
+    print(f"  {len(blocks)} 个数据块, 切分为 {len(tasks)} 个任务, {workers} 个进程")
+    
+    stats = {'node_count': 0, 'way_count': 0, 'relation_count': 0, 'poi_count': 0}
+    
+    def write_rows(rows: List[Tuple]):
+        for i in range(0, len(rows), batch_size):
+            writer.write_rows(rows[i:i + batch_size])
+        stats['poi_count'] += len(rows)
+    
+    rules = rules or get_category_rules()
+    spill_fd, spill_path = tempfile.mkstemp(prefix='poi_ways_', suffix='.pickle')
+    os.close(spill_fd)
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(rules,)) as pool:
+            # 路径任务耗时最长，最先提交
+            way_result = pool.apply_async(_extract_ways, (input_file, idx, two_pass, spill_path))
+            
+            # imap 保持任务顺序，写入顺序与串行模式相同
+            for node_count, rows in pool.imap(_extract_node_blocks, tasks):
+                stats['node_count'] += node_count
+                write_rows(rows)
+                print(f"  已处理 {stats['node_count']} 个候选节点, 提取 {stats['poi_count']} 个 POI")
+            
+            way_count, relation_count, _ = way_result.get()
+            stats['way_count'] = way_count
+            stats['relation_count'] = relation_count
+        
+        # 路径 POI 由 worker 逐批写入临时文件，这里逐批读回
+        for rows in read_row_spill(spill_path):
+            write_rows(rows)
+    finally:
+        os.remove(spill_path)
+    
+    return stats
+
+
+# poi 主表结构（表名可替换，空间排序时用于重建表）
+POI_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        osm_id INTEGER NOT NULL,
+        osm_type TEXT NOT NULL,
+        name TEXT NOT NULL,
+        name_en TEXT,
+        main_category TEXT NOT NULL,
+        sub_category TEXT,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        address TEXT,
+        phone TEXT,
+        website TEXT,
+        opening_hours TEXT,
+        description TEXT,
+        travel_time TEXT,
+        rating REAL,
+        tags BLOB,
+        hilbert INTEGER,
+        {grid_columns}
+        search_tokens TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''.replace('{grid_columns}', ' '.join(f'{col} INTEGER,' for col in GRID_COLUMNS))
+
+# 批量导入模式的连接参数：数据库每次从头重建，失败后重跑即可，因此关闭日志和同步
+BULK_PRAGMAS = (
+    ('journal_mode', 'OFF'),
+    ('synchronous', 'OFF'),
+    ('cache_size', '-262144'),  # 256 MB
+    ('temp_store', 'MEMORY'),
+)
+BULK_PAGE_SIZE = 4096
+
+
+def apply_bulk_pragmas(cursor: sqlite3.Cursor):
+    """批量导入参数（除 page_size 外均只对当前连接有效）"""
+    for name, value in BULK_PRAGMAS:
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def create_database(db_path: str, bulk: bool = False,
+                    fts_tokenizer: str = 'unicode61') -> sqlite3.Connection:
+    """
+    创建 SQLite 数据库和表结构
+    
+    bulk=True 时使用批量导入参数，并推迟创建索引和 FTS 触发器，
+    由 PoiWriter.finish() 在全部数据写入后一次性构建。
+    fts_tokenizer 见 create_fts_table()
+    """
+    # 删除已存在的数据库
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    if bulk:
+        # page_size 必须在创建第一张表之前设置
+        cursor.execute(f'PRAGMA page_size = {BULK_PAGE_SIZE}')
+        apply_bulk_pragmas(cursor)
+    
+    # 创建主表
+    cursor.execute(POI_TABLE_SQL.format(table='poi'))
+    
+    # 创建元数据表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    
+    # 标签编码格式（见 TagEncoder）
+    cursor.execute(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES ('tags_encoding', ?)",
+        (TAGS_ENCODING,)
+    )
+    
+    # 网格分辨率（应用据此计算单元编号区间）
+    cursor.execute(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES ('grid_levels', ?)",
+        (','.join(map(str, GRID_LEVELS)),)
+    )
+    
+    # 创建 FTS5 虚拟表用于全文搜索
+    create_fts_table(cursor, fts_tokenizer)
+    
+    # 创建 R-Tree 空间索引（用于高效的范围查询和附近搜索）
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree(
+            id,
+            min_lat, max_lat,
+            min_lon, max_lon
+        )
+    ''')
+    
+    if not bulk:
+        create_poi_indexes(cursor)
+    
+    # 创建分类统计表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_stats (
+            main_category TEXT NOT NULL,
+            sub_category TEXT,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (main_category, sub_category)
+        )
+    ''')
+    
+    # 分类密度直方图（见 PoiStats）
+    cursor.execute(POI_DENSITY_TABLE_SQL.format(table='poi_density', category='main_category',
+                                                category_type='TEXT'))
+    cursor.execute(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES ('density_levels', ?)",
+        (','.join(map(str, DENSITY_LEVELS)),)
+    )
+    
+    conn.commit()
+    return conn
+
+
+def create_poi_indexes(cursor: sqlite3.Cursor):
+    """
+    创建 poi 表的普通索引和 FTS 同步触发器（已存在时跳过）
+    """
+    # 普通索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_poi_category ON poi(main_category, sub_category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_poi_name ON poi(name)')
+    
+    # 空间排序键索引（按 Hilbert 序号范围扫描邻近 POI）
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_poi_hilbert ON poi(hilbert)')
+    
+    # 网格覆盖索引：(单元, 主分类, 显示列)，附近搜索按行做范围扫描且无需回表
+    for column in GRID_COLUMNS:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_poi_{column} ON poi({column}, {", ".join(GRID_INDEX_COLUMNS)})'
+        )
+    
+    # OSM 对象标识唯一索引（增量更新按此定位记录，保持行 ID 稳定）
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_poi_osm ON poi(osm_type, osm_id)')
+    
+    # 触发器保持 FTS 表同步（列与 poi_fts 的索引列一致）
+    columns = fts_columns(cursor)
+    col_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{col}' for col in columns)
+    old_values = ', '.join(f'old.{col}' for col in columns)
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS poi_ai AFTER INSERT ON poi BEGIN
+            INSERT INTO poi_fts(rowid, {col_list})
+            VALUES (new.id, {new_values});
+        END
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS poi_ad AFTER DELETE ON poi BEGIN
+            INSERT INTO poi_fts(poi_fts, rowid, {col_list})
+            VALUES('delete', old.id, {old_values});
+        END
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS poi_au AFTER UPDATE ON poi BEGIN
+            INSERT INTO poi_fts(poi_fts, rowid, {col_list})
+            VALUES('delete', old.id, {old_values});
+            INSERT INTO poi_fts(rowid, {col_list})
+            VALUES (new.id, {new_values});
+        END
+    ''')
+
+
+class PoiWriter:
+    """
+    POI 写入器，所有提取路径（串行、并行）共用
+    
+    ID 由写入器自行分配（只在启动时查询一次最大 ID，分片可沿用给定 ID），R-Tree 使用同样的 ID。
+    bulk=True 时全部数据在一个事务中写入，R-Tree、FTS5 和普通索引推迟到
+    finish() 中一次性构建，最后执行 ANALYZE。
+    spatial_sort=True 时 finish() 按 Hilbert 序号重排记录并重新分配 ID，
+    使空间相邻的 POI 存储在相邻的数据页中。
+    write_rows() 同时在 self.stats 中累计分类计数和密度直方图，由 finish() 写入。
+    """
+    
+    INSERT_SQL = f'''
+        INSERT INTO poi (id, {', '.join(POI_COLUMNS)})
+        VALUES ({', '.join('?' * (len(POI_COLUMNS) + 1))})
+    '''
+    
+    RTREE_SQL = '''
+        INSERT INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+    
+    def __init__(self, conn: sqlite3.Connection, bulk: bool = False, spatial_sort: bool = False):
+        self.conn = conn
+        self.bulk = bulk
+        self.spatial_sort = spatial_sort
+        self.count = 0
+        self.stats = PoiStats()
+        # bigram 全文索引需要写入 search_tokens 列
+        self.search_tokens = 'search_tokens' in fts_columns(conn.cursor())
+        self.tags = TagEncoder(conn)
+        cursor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM poi")
+        self.next_id = cursor.fetchone()[0] + 1
+        if bulk:
+            conn.execute('BEGIN')
+    
+    def write(self, pois: List[Dict]) -> int:
+        """写入 POI 字典列表"""
+        return self.write_rows([poi_row(poi) for poi in pois])
+    
+    def _prepare_row(self, row: Tuple) -> List:
+        """编码标签，bigram 模式下填充 search_tokens 列（名称和地址的二元组）"""
+        row = list(row)
+        row[_TAGS_IDX] = self.tags.encode(row[_TAGS_IDX])
+        if self.search_tokens:
+            row[_SEARCH_TOKENS_IDX] = cjk_bigrams(row[_NAME_IDX]) + ' ' + cjk_bigrams(row[_ADDRESS_IDX])
+        return row
+    
+    def write_rows(self, rows: List[Tuple], ids: Optional[List[int]] = None) -> int:
+        """
+        写入 POI 行元组列表（按 POI_COLUMNS 顺序）
+        
+        ids 为 None 时由写入器分配连续 ID；给出时沿用这些 ID（分片保留完整数据库中的 ID）
+        """
+        if not rows:
+            return 0
+        
+        if ids is None:
+            ids = range(self.next_id, self.next_id + len(rows))
+        self.next_id = max(self.next_id, max(ids) + 1)
+        self.count += len(rows)
+        self.stats.add_rows(rows)
+        
+        cursor = self.conn.cursor()
+        cursor.executemany(self.INSERT_SQL, [
+            (poi_id, *self._prepare_row(row)) for poi_id, row in zip(ids, rows)
+        ])
+        
+        if not self.bulk:
+            lat_idx = POI_COLUMNS.index('lat')
+            lon_idx = POI_COLUMNS.index('lon')
+            cursor.executemany(self.RTREE_SQL, [
+                (poi_id, row[lat_idx], row[lat_idx], row[lon_idx], row[lon_idx])
+                for poi_id, row in zip(ids, rows)
+            ])
+            self.conn.commit()
+        
+        return len(rows)
+    
+    def upsert(self, poi: Dict) -> Tuple[Optional[PoiStatsEntry], PoiStatsEntry]:
+        """
+        按 (osm_type, osm_id) 插入或更新单条 POI，已有记录保留原 ID
+        
+        返回 (旧记录的 (主分类, 子分类, lat, lon) 或 None, 新记录的同样四项)，供分类统计增量更新
+        """
+        cursor = self.conn.cursor()
+        row = self._prepare_row(poi_row(poi))
+        cursor.execute(
+            'SELECT id, main_category, sub_category, lat, lon FROM poi WHERE osm_type = ? AND osm_id = ?',
+            (poi['osm_type'], poi['osm_id'])
+        )
+        existing = cursor.fetchone()
+        rtree = (poi['lat'], poi['lat'], poi['lon'], poi['lon'])
+        
+        if existing:
+            poi_id = existing[0]
+            assignments = ', '.join(f'{col} = ?' for col in POI_COLUMNS)
+            cursor.execute(f'UPDATE poi SET {assignments} WHERE id = ?', (*row, poi_id))
+            cursor.execute(
+                'UPDATE poi_rtree SET min_lat = ?, max_lat = ?, min_lon = ?, max_lon = ? WHERE id = ?',
+                (*rtree, poi_id)
+            )
+            old_category = PoiStatsEntry(*existing[1:])
+        else:
+            poi_id = self.next_id
+            self.next_id += 1
+            self.count += 1
+            cursor.execute(self.INSERT_SQL, (poi_id, *row))
+            cursor.execute(self.RTREE_SQL, (poi_id, *rtree))
+            old_category = None
+        
+        return old_category, PoiStatsEntry(poi['main_category'], poi['sub_category'], poi['lat'], poi['lon'])
+    
+    def delete(self, osm_type: str, osm_id: int) -> Optional[PoiStatsEntry]:
+        """
+        删除 (osm_type, osm_id) 对应的 POI，返回被删除记录的 (主分类, 子分类, lat, lon)，不存在时返回 None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT id, main_category, sub_category, lat, lon FROM poi WHERE osm_type = ? AND osm_id = ?',
+            (osm_type, osm_id)
+        )
+        existing = cursor.fetchone()
+        if not existing:
+            return None
+        
+        cursor.execute('DELETE FROM poi WHERE id = ?', (existing[0],))
+        cursor.execute('DELETE FROM poi_rtree WHERE id = ?', (existing[0],))
+        return PoiStatsEntry(*existing[1:])
+    
+    def _sort_spatially(self):
+        """
+        按 Hilbert 序号重建 poi 表，ID 按新顺序从 1 开始重新分配
+        
+        重建会删除旧表上的索引和触发器，非批量模式下同时重建 R-Tree 和 FTS
+        """
+        cursor = self.conn.cursor()
+        columns = ', '.join((*POI_COLUMNS, 'created_at'))
+        
+        print("  按 Hilbert 序号重排记录...")
+        cursor.execute(POI_TABLE_SQL.format(table='poi_sorted'))
+        cursor.execute(f'''
+            INSERT INTO poi_sorted (id, {columns})
+            SELECT ROW_NUMBER() OVER (ORDER BY hilbert, id), {columns}
+            FROM poi
+        ''')
+        cursor.execute('DROP TABLE poi')
+        cursor.execute('ALTER TABLE poi_sorted RENAME TO poi')
+        
+        if not self.bulk:
+            cursor.execute('DELETE FROM poi_rtree')
+            cursor.execute('''
+                INSERT INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon)
+                SELECT id, lat, lat, lon, lon FROM poi
+            ''')
+            cursor.execute("INSERT INTO poi_fts(poi_fts) VALUES('rebuild')")
+            create_poi_indexes(cursor)
+        
+        cursor.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES ('row_order', 'hilbert')"
+        )
+        self.conn.commit()
+    
+    def finish(self):
+        """结束写入：写入分类统计和密度直方图，按需空间排序，批量模式下构建索引并提交"""
+        self.stats.save(self.conn, replace=True)
+        if not self.bulk:
+            self.conn.commit()
+        
+        if self.spatial_sort:
+            self._sort_spatially()
+        
+        if not self.bulk:
+            return
+        
+        cursor = self.conn.cursor()
+        
+        print("  构建 R-Tree 空间索引...")
+        cursor.execute('''
+            INSERT INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT id, lat, lat, lon, lon FROM poi
+        ''')
+        
+        print("  构建 FTS5 全文索引...")
+        cursor.execute("INSERT INTO poi_fts(poi_fts) VALUES('rebuild')")
+        
+        print("  构建普通索引...")
+        create_poi_indexes(cursor)
+        
+        self.conn.commit()
+        
+        cursor.execute('ANALYZE')
+        # 恢复默认日志模式，生成的文件可直接只读打开
+        cursor.execute('PRAGMA journal_mode = DELETE')
+        self.conn.commit()
+
+
+# ============================================================================
+# 流水线写入（--pipeline）
+# 解析线程（osmium 回调）只把整批 POI 放入有界队列，专用写入线程用自己的连接写入 SQLite，
+# 解析和写入同时进行；队列满时解析线程等待，内存占用不随数据量增长
+# ============================================================================
+
+PIPELINE_DEPTH = 8
+
+
+class PipelinedWriter:
+    """
+    流水线写入器：接口与 PoiWriter 相同（write / write_rows / finish）
+    
+    数据库须已由 create_database() 创建。写入线程打开自己的连接并在其上创建 PoiWriter，
+    行转换、标签编码和 SQLite 写入都在写入线程中进行；finish() 等待队列写完并在写入线程中
+    结束写入（批量模式下构建索引），之后 self.conn 为主线程重新打开的连接。
+    写入线程出错时，下一次 write / finish 在调用方抛出 RuntimeError。
+    给出 profiler 时在写入线程中包装内部的 PoiWriter，sqlite.* 计时为实际写入耗时
+    """
+    
+    def __init__(self, db_path: str, bulk: bool = False, spatial_sort: bool = False,
+                 depth: int = PIPELINE_DEPTH, profiler: Optional[Profiler] = None):
+        self.db_path = db_path
+        self.bulk = bulk
+        self.spatial_sort = spatial_sort
+        self.profiler = profiler
+        self.count = 0
+        self.conn: Optional[sqlite3.Connection] = None
+        self.error: Optional[BaseException] = None
+        self.queue: queue.Queue = queue.Queue(maxsize=depth)
+        self.thread = threading.Thread(target=self._run, name='poi-writer', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            if self.bulk:
+                apply_bulk_pragmas(conn.cursor())
+            writer = PoiWriter(conn, bulk=self.bulk, spatial_sort=self.spatial_sort)
+            if self.profiler:
+                self.profiler.instrument_writer(writer)
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                method, batch = item
+                getattr(writer, method)(batch)
+        except BaseException as e:
+            self.error = e
+            # 丢弃剩余的批次，解析线程不会阻塞在已满的队列上
+            while self.queue.get() is not None:
+                pass
+            return
+
+        try:
+            writer.finish()
+            conn.close()
+        except BaseException as e:
+            self.error = e
+    
+    def _put(self, item):
+        while True:
+            if self.error:
+                raise RuntimeError(f'写入线程出错: {self.error}') from self.error
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def write(self, pois: List[Dict]) -> int:
+        """写入 POI 字典列表（在写入线程中转换为行）"""
+        if pois:
+            self._put(('write', pois))
+            self.count += len(pois)
+        return len(pois)
+    
+    def write_rows(self, rows: List[Tuple]) -> int:
+        """写入 POI 行元组列表（按 POI_COLUMNS 顺序）"""
+        if rows:
+            self._put(('write_rows', rows))
+            self.count += len(rows)
+        return len(rows)
+    
+    def finish(self):
+        """写完队列中的全部批次，结束写入并打开主线程的连接"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise RuntimeError(f'写入线程出错: {self.error}') from self.error
+        self.conn = sqlite3.connect(self.db_path)
+
+
+# ============================================================================
+# 自动补全建议表
+# 预先计算每个名称前缀（最多 N 个字）排名前 K 的 POI ID，
+# 输入框每次按键只需在 poi_suggest 的主键 B-tree 上做一次点查询
+# ============================================================================
+
+SUGGEST_PREFIX_LEN = 4
+SUGGEST_TOP_K = 10
+
+# 主分类权重：地标、交通等用户更常搜索的分类排在前面
+SUGGEST_CATEGORY_WEIGHTS = {
+    '交通': 3.0, '景点': 3.0, '购物': 2.0, '教育': 2.0, '医疗': 2.0,
+    '住宿': 1.5, '休闲': 1.5, '政务': 1.5, '餐饮': 1.0, '金融': 1.0,
+    '宗教': 1.0, '生活服务': 0.5, '办公': 0.5, '住宅': 0.5,
+}
+
+# 知名度标签：有维基条目或品牌的 POI 通常更知名
+SUGGEST_PROMINENCE_TAGS = {'wikidata': 2.0, 'wikipedia': 2.0, 'brand': 1.0, 'website': 0.5}
+
+# 面状对象（校园、公园、商场）通常比同类的点状 POI 更重要
+SUGGEST_TYPE_WEIGHTS = {'relation': 1.5, 'way': 1.0, 'node': 0.0}
+
+SUGGEST_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS poi_suggest (
+        prefix TEXT PRIMARY KEY,
+        poi_ids BLOB NOT NULL
+    ) WITHOUT ROWID
+'''
+
+
+def normalize_suggest_text(text: str) -> str:
+    """前缀归一化：去掉空白并转为小写（应用查询时使用相同规则）"""
+    return ''.join(text.split()).lower()
+
+
+def suggest_score(main_category: str, osm_type: str, tags: Dict[str, str],
+                  rating: Optional[float]) -> float:
+    """
+    计算 POI 的建议排名分数：分类权重 + 对象类型 + 知名度标签 + 标签丰富度 + 评分
+    """
+    score = SUGGEST_CATEGORY_WEIGHTS.get(main_category, 1.0)
+    score += SUGGEST_TYPE_WEIGHTS.get(osm_type, 0.0)
+    if tags:
+        score += sum(w for key, w in SUGGEST_PROMINENCE_TAGS.items() if key in tags)
+        score += min(len(tags), 20) * 0.05
+    if rating:
+        score += rating / 5.0
+    return score
+
+
+def pack_poi_ids(ids: List[int]) -> bytes:
+    """ID 列表编码为小端 uint32 数组"""
+    return struct.pack(f'<{len(ids)}I', *ids)
+
+
+def unpack_poi_ids(blob: bytes) -> List[int]:
+    """pack_poi_ids() 的逆操作"""
+    return list(struct.unpack(f'<{len(blob) // 4}I', blob))
+
+
+def build_suggestions(conn: sqlite3.Connection, prefix_len: int = SUGGEST_PREFIX_LEN,
+                      top_k: int = SUGGEST_TOP_K) -> int:
+    """
+    重建 poi_suggest 表，返回前缀数量
+    
+    分数写入临时表后，每种前缀长度用一次窗口函数取前 K 名，
+    内存占用与 POI 数量无关。参数记录在 metadata 中，增量更新后按相同参数重建。
+    由调用方提交事务
+    """
+    cursor = conn.cursor()
+    cursor.execute(SUGGEST_TABLE_SQL)
+    cursor.execute('DELETE FROM poi_suggest')
+    cursor.execute('DROP TABLE IF EXISTS temp.suggest_source')
+    cursor.execute('CREATE TEMP TABLE suggest_source (id INTEGER PRIMARY KEY, name TEXT, score REAL)')
+    
+    keys = load_tag_keys(conn)
+    source = conn.cursor()
+    source.execute('SELECT id, name, main_category, osm_type, tags, rating FROM poi')
+    while True:
+        rows = source.fetchmany(10000)
+        if not rows:
+            break
+        cursor.executemany('INSERT INTO temp.suggest_source VALUES (?, ?, ?)', [
+            (poi_id, normalize_suggest_text(name),
+             suggest_score(main, osm_type, decode_tags(tags, keys), rating))
+            for poi_id, name, main, osm_type, tags, rating in rows
+        ])
+    
+    prefix_count = 0
+    for length in range(1, prefix_len + 1):
+        ranked = conn.execute('''
+            SELECT prefix, id FROM (
+                SELECT substr(name, 1, :n) AS prefix, id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY substr(name, 1, :n) ORDER BY score DESC, id
+                       ) AS rank
+                FROM temp.suggest_source
+                WHERE length(name) >= :n
+            )
+            WHERE rank <= :k
+            ORDER BY prefix, rank
+        ''', {'n': length, 'k': top_k})
+        
+        batch = []
+        current, ids = None, []
+        for prefix, poi_id in ranked:
+            if prefix != current:
+                if ids:
+                    batch.append((current, pack_poi_ids(ids)))
+                current, ids = prefix, []
+            ids.append(poi_id)
+        if ids:
+            batch.append((current, pack_poi_ids(ids)))
+        
+        cursor.executemany('INSERT INTO poi_suggest (prefix, poi_ids) VALUES (?, ?)', batch)
+        prefix_count += len(batch)
+    
+    cursor.execute('DROP TABLE temp.suggest_source')
+    cursor.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+        ('suggest_prefix_len', str(prefix_len)),
+        ('suggest_top_k', str(top_k)),
+    ])
+    return prefix_count
+
+# ============================================================================
+# 分类排行榜（--leaderboard）
+# 预先计算每个主分类评分最高、知名度最高的前 N 个 POI：全城一份，每个 level 5 网格单元
+# （约 3.5 km）各一份。"评分最高的餐厅""附近知名景点"只需在 poi_leaderboard 主键上做一次
+# 范围扫描，不再在查询时按分类全表排序
+# ============================================================================
+
+LEADERBOARD_TOP_N = 10
+LEADERBOARD_METRICS = ('rating', 'prominence')
+
+# 单元排行榜使用最粗一级网格，全城排行榜的单元编号为 LEADERBOARD_CITY
+LEADERBOARD_LEVEL = GRID_LEVELS[0]
+LEADERBOARD_COLUMN = f'cell_{LEADERBOARD_LEVEL}'
+LEADERBOARD_CITY = -1
+
+# 主键按 score 降序，每个排行榜是主键上的一段连续记录，读取时不需要排序。
+# 精简输出中分类列与 poi 表一致改为 main_category_id
+LEADERBOARD_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        {category} {category_type} NOT NULL,
+        metric TEXT NOT NULL,
+        cell INTEGER NOT NULL,
+        score REAL NOT NULL,
+        poi_id INTEGER NOT NULL,
+        PRIMARY KEY ({category}, metric, cell, score DESC, poi_id)
+    ) WITHOUT ROWID
+'''
+
+
+def leaderboard_prominence(main_category: str, osm_type: str, tags: Dict[str, str]) -> float:
+    """
+    知名度分数：与建议表排名相同，但不计评分
+    
+    评分单独成榜，手动修改评分时知名度排行不需要刷新
+    """
+    return suggest_score(main_category, osm_type, tags, None)
+
+
+def create_leaderboard_trigger(cursor: sqlite3.Cursor, top_n: int, category_column: str = 'main_category'):
+    """
+    创建评分修改触发器：rating 变化时重新计算该 POI 所在单元和全城的同分类评分排行
+    
+    手动 UPDATE poi SET rating = ... 后排行榜立即生效。
+    触发器随数据库分发，只使用旧版 SQLite 也能解析的语法（不用窗口函数）
+    """
+    c = category_column
+    select = f'''INSERT INTO poi_leaderboard ({c}, metric, cell, score, poi_id)
+            SELECT * FROM (
+                SELECT {c}, 'rating', {{cell}}, rating, id FROM poi
+                WHERE {{where}}{c} = NEW.{c} AND rating IS NOT NULL
+                ORDER BY rating DESC, id LIMIT {int(top_n)}
+            );'''
+    cursor.execute('DROP TRIGGER IF EXISTS poi_leaderboard_rating')
+    cursor.execute(f'''
+        CREATE TRIGGER poi_leaderboard_rating AFTER UPDATE OF rating ON poi
+        WHEN OLD.rating IS NOT NEW.rating
+        BEGIN
+            DELETE FROM poi_leaderboard
+            WHERE {c} = NEW.{c} AND metric = 'rating'
+              AND cell IN (NEW.{LEADERBOARD_COLUMN}, {LEADERBOARD_CITY});
+            {select.format(cell=f'NEW.{LEADERBOARD_COLUMN}', where=f'{LEADERBOARD_COLUMN} = NEW.{LEADERBOARD_COLUMN} AND ')}
+            {select.format(cell=LEADERBOARD_CITY, where='')}
+        END
+    ''')
+
+
+def build_leaderboards(conn: sqlite3.Connection, top_n: int = LEADERBOARD_TOP_N) -> int:
+    """
+    重建 poi_leaderboard 表和评分触发器，返回排行榜数量
+    
+    与建议表相同，分数写入临时表后用窗口函数按 (分类, 单元) 分组取前 N 名。
+    参数记录在 metadata 中，增量更新后按相同参数重建。由调用方提交事务
+    """
+    cursor = conn.cursor()
+    cursor.execute(LEADERBOARD_TABLE_SQL.format(table='poi_leaderboard', category='main_category',
+                                                category_type='TEXT'))
+    cursor.execute('DELETE FROM poi_leaderboard')
+    cursor.execute('DROP TABLE IF EXISTS temp.leaderboard_source')
+    cursor.execute('''
+        CREATE TEMP TABLE leaderboard_source (
+            id INTEGER PRIMARY KEY, main_category TEXT, cell INTEGER, rating REAL, prominence REAL
+        )
+    ''')
+    
+    keys = load_tag_keys(conn)
+    source = conn.cursor()
+    source.execute(f'SELECT id, main_category, {LEADERBOARD_COLUMN}, osm_type, tags, rating FROM poi')
+    while True:
+        rows = source.fetchmany(10000)
+        if not rows:
+            break
+        cursor.executemany('INSERT INTO temp.leaderboard_source VALUES (?, ?, ?, ?, ?)', [
+            (poi_id, main, cell, rating, leaderboard_prominence(main, osm_type, decode_tags(tags, keys)))
+            for poi_id, main, cell, osm_type, tags, rating in rows
+        ])
+    
+    for metric in LEADERBOARD_METRICS:
+        for cell in ('cell', str(LEADERBOARD_CITY)):
+            cursor.execute(f'''
+                INSERT INTO poi_leaderboard (main_category, metric, cell, score, poi_id)
+                SELECT main_category, :metric, cell, score, id FROM (
+                    SELECT main_category, {cell} AS cell, {metric} AS score, id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY main_category, {cell} ORDER BY {metric} DESC, id
+                           ) AS rank
+                    FROM temp.leaderboard_source
+                    WHERE {metric} IS NOT NULL
+                )
+                WHERE rank <= :n
+            ''', {'metric': metric, 'n': top_n})
+    
+    cursor.execute('DROP TABLE temp.leaderboard_source')
+    create_leaderboard_trigger(cursor, top_n)
+    cursor.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+        ('leaderboard_top_n', str(top_n)),
+        ('leaderboard_level', str(LEADERBOARD_LEVEL)),
+    ])
+    return conn.execute(
+        'SELECT COUNT(*) FROM (SELECT DISTINCT main_category, metric, cell FROM poi_leaderboard)'
+    ).fetchone()[0]
+
+
+# ============================================================================
+# 空间去重（--dedup）
+# 同一地点常出现多条记录：建筑轮廓内同名的商店节点、道路两侧同名的公交站等。
+# 按 (归一化名称, 主分类, 网格单元) 分桶，只比较同一单元和相邻单元内的候选，
+# 总耗时与 POI 数近似线性
+# ============================================================================
+
+DEDUP_RADIUS_M = 50.0
+
+# 每度纬度的距离（米）
+METERS_PER_DEGREE = 111320.0
+
+# 合并时从重复记录补全的空字段
+DEDUP_FILL_COLUMNS = ('name_en', 'address', 'phone', 'website', 'opening_hours', 'description')
+
+POI_MERGED_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS poi_merged (
+        osm_type TEXT NOT NULL,
+        osm_id INTEGER NOT NULL,
+        poi_id INTEGER NOT NULL,
+        PRIMARY KEY (osm_type, osm_id)
+    ) WITHOUT ROWID
+'''
+
+
+def normalize_dedup_name(name: str) -> str:
+    """名称归一化：全角转半角、转小写，去掉空白、标点和符号"""
+    text = unicodedata.normalize('NFKC', name).lower()
+    return ''.join(ch for ch in text if unicodedata.category(ch)[0] not in 'PZSC')
+
+
+def find_duplicates(points: List[Tuple], radius_m: float) -> List[Tuple[int, List[int]]]:
+    """
+    points 为 (id, 归一化名称, lat, lon) 列表，已按保留优先级从高到低排序
+    
+    依次以尚未归组的 POI 为代表，收集距它 radius_m 以内的同名 POI，
+    返回 [(保留 ID, [重复 ID, ...]), ...]。只与代表比较距离，不会沿一串相邻 POI 传递合并
+    """
+    if not points:
+        return []
+    max_lat = min(max(abs(lat) for _, _, lat, _ in points), 85.0)
+    cell_lat = radius_m / METERS_PER_DEGREE
+    # 经度方向按最高纬度取单元宽度，保证 radius_m 以内的点总在相邻单元
+    cell_lon = cell_lat / math.cos(math.radians(max_lat))
+    
+    buckets: Dict[Tuple[str, int, int], List[int]] = {}
+    for i, (_, name, lat, lon) in enumerate(points):
+        buckets.setdefault((name, int(lat // cell_lat), int(lon // cell_lon)), []).append(i)
+    
+    merged = [False] * len(points)
+    groups = []
+    for i, (poi_id, name, lat, lon) in enumerate(points):
+        if merged[i]:
+            continue
+        cy, cx = int(lat // cell_lat), int(lon // cell_lon)
+        scale = math.cos(math.radians(lat))
+        duplicates = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for j in buckets.get((name, cy + dy, cx + dx), ()):
+                    if j == i or merged[j]:
+                        continue
+                    _, _, lat2, lon2 = points[j]
+                    dist = math.hypot(lat2 - lat, (lon2 - lon) * scale) * METERS_PER_DEGREE
+                    if dist <= radius_m:
+                        merged[j] = True
+                        duplicates.append(points[j][0])
+        if duplicates:
+            merged[i] = True
+            groups.append((poi_id, duplicates))
+    return groups
+
+
+def deduplicate_pois(conn: sqlite3.Connection, radius_m: float = DEDUP_RADIUS_M) -> Tuple[int, int]:
+    """
+    合并同名、同主分类且相距不超过 radius_m 米的 POI
+    
+    每组保留信息最完整的一条（已填字段多、标签多，其次节点优先），
+    空字段和缺少的标签从被合并的记录补全，被合并对象的 OSM 标识记入 poi_merged，
+    增量更新时不再单独插入。按主分类分批处理以限制内存占用。
+    分类统计和密度直方图按删除的记录增量调整。
+    返回 (合并组数, 删除的记录数)
+    """
+    cursor = conn.cursor()
+    cursor.execute(POI_MERGED_TABLE_SQL)
+    keys = load_tag_keys(conn)
+    encoder = TagEncoder(conn)
+    search_tokens = 'search_tokens' in fts_columns(cursor)
+    fill = ', '.join(DEDUP_FILL_COLUMNS)
+    
+    categories = [row[0] for row in cursor.execute('SELECT DISTINCT main_category FROM poi')]
+    group_count = 0
+    removed = 0
+    stats = PoiStats()
+    for category in categories:
+        rows = cursor.execute(f'''
+            SELECT id, name, lat, lon, osm_type, LENGTH(tags),
+                   {' + '.join(f"({col} IS NOT NULL AND {col} != '')" for col in DEDUP_FILL_COLUMNS)}
+            FROM poi WHERE main_category = ? AND name IS NOT NULL
+        ''', (category,)).fetchall()
+        rows.sort(key=lambda r: (-r[6], -(r[5] or 0), r[4] != 'node', r[0]))
+        points = [(r[0], normalize_dedup_name(r[1]), r[2], r[3]) for r in rows]
+        points = [p for p in points if p[1]]
+        
+        merged_rows = []
+        for keep_id, duplicate_ids in find_duplicates(points, radius_m):
+            ids = [keep_id, *duplicate_ids]
+            placeholders = ', '.join('?' * len(ids))
+            records = {row[0]: row for row in cursor.execute(
+                f'SELECT id, osm_type, osm_id, name, tags, sub_category, lat, lon, {fill} '
+                f'FROM poi WHERE id IN ({placeholders})', ids
+            )}
+            keep = records[keep_id]
+            values = list(keep[8:])
+            tags = decode_tags(keep[4], keys)
+            for dup_id in duplicate_ids:
+                dup = records[dup_id]
+                values = [v if v else other for v, other in zip(values, dup[8:])]
+                for key, value in decode_tags(dup[4], keys).items():
+                    tags.setdefault(key, value)
+                merged_rows.append((dup[1], dup[2], keep_id, dup_id))
+                stats.add(category, dup[5], dup[6], dup[7], -1)
+            
+            updates = dict(zip(DEDUP_FILL_COLUMNS, values))
+            updates['tags'] = encoder.encode(tags)
+            if search_tokens:
+                updates['search_tokens'] = cjk_bigrams(keep[3]) + ' ' + cjk_bigrams(updates['address'])
+            assignments = ', '.join(f'{col} = ?' for col in updates)
+            cursor.execute(f'UPDATE poi SET {assignments} WHERE id = ?', (*updates.values(), keep_id))
+            group_count += 1
+        
+        cursor.executemany('INSERT OR REPLACE INTO poi_merged (osm_type, osm_id, poi_id) VALUES (?, ?, ?)',
+                           [row[:3] for row in merged_rows])
+        cursor.executemany('DELETE FROM poi WHERE id = ?', [(row[3],) for row in merged_rows])
+        cursor.executemany('DELETE FROM poi_rtree WHERE id = ?', [(row[3],) for row in merged_rows])
+        removed += len(merged_rows)
+    
+    stats.save(conn)
+    cursor.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('dedup_radius_m', ?)",
+                   (str(radius_m),))
+    conn.commit()
+    return group_count, removed
+
+
+def load_merged(conn: sqlite3.Connection) -> set:
+    """读取被合并对象的 (osm_type, osm_id) 集合，未去重的数据库返回空集合"""
+    try:
+        return set(conn.execute('SELECT osm_type, osm_id FROM poi_merged'))
+    except sqlite3.OperationalError:
+        return set()
+
+
+# ============================================================================
+# 出行时间预计算（--travel-time）
+# 再读一遍同一个 PBF，提取步行、骑行、驾车三种方式的路网，存为 CSR 数组；
+# 从锚点（默认位置、交通枢纽等）出发各做一次多源 Dijkstra，批量写入每条 POI
+# 各方式的出行时间。应用回答“步行去某地要几分钟”时直接读表，不必逐条调用 BRouter
+# ============================================================================
+
+TRAVEL_MODES = ('walk', 'bike', 'car')
+
+_WALKABLE_HIGHWAYS = (
+    'trunk', 'trunk_link', 'primary', 'primary_link', 'secondary', 'secondary_link',
+    'tertiary', 'tertiary_link', 'unclassified', 'residential', 'living_street', 'service', 'road',
+    'pedestrian', 'footway', 'path', 'track', 'cycleway', 'corridor',
+)
+
+# 各出行方式可通行的 highway 取值和速度（km/h），未列出的取值不可通行
+TRAVEL_SPEEDS = {
+    'walk': {**dict.fromkeys(_WALKABLE_HIGHWAYS, 5.0), 'steps': 2.5},
+    'bike': {
+        **dict.fromkeys(('primary', 'primary_link', 'secondary', 'secondary_link', 'tertiary',
+                         'tertiary_link', 'unclassified', 'residential', 'road'), 15.0),
+        'cycleway': 18.0, 'service': 12.0, 'path': 12.0, 'living_street': 10.0, 'track': 10.0,
+    },
+    'car': {
+        'motorway': 90.0, 'motorway_link': 45.0, 'trunk': 60.0, 'trunk_link': 40.0,
+        'primary': 40.0, 'primary_link': 30.0, 'secondary': 35.0, 'secondary_link': 30.0,
+        'tertiary': 30.0, 'tertiary_link': 25.0, 'unclassified': 25.0, 'residential': 20.0,
+        'road': 20.0, 'service': 15.0, 'living_street': 10.0,
+    },
+}
+
+# 通行权限标签（越靠后越具体，后面的覆盖前面的）。明确允许但 highway 取值不在上表中时
+# （如 bicycle=designated 的步行道）使用 TRAVEL_ALLOWED_SPEED
+TRAVEL_ACCESS_KEYS = {
+    'walk': ('access', 'foot'),
+    'bike': ('access', 'vehicle', 'bicycle'),
+    'car': ('access', 'vehicle', 'motor_vehicle', 'motorcar'),
+}
+TRAVEL_ACCESS_DENY = ('no', 'private')
+TRAVEL_ACCESS_ALLOW = ('yes', 'designated', 'permissive', 'destination')
+TRAVEL_ALLOWED_SPEED = {'walk': 5.0, 'bike': 12.0, 'car': 20.0}
+
+# POI 和锚点吸附到 TRAVEL_SNAP_M 米以内最近的路网节点，这一段按步行速度计时。
+# 吸附用网格单元边长 TRAVEL_SNAP_CELL_M 米，由近及远逐圈查找
+TRAVEL_SNAP_M = 300.0
+TRAVEL_SNAP_CELL_M = 100.0
+TRAVEL_ACCESS_SPEED = 5.0
+
+# 超过此时间的 POI 不写入
+TRAVEL_MAX_MINUTES = 60
+
+# 锚点：lat / lon 为单点；sub_category 为多源，从同一子分类中最近的一条 POI 出发（via 记录其 ID）。
+# 第一个单点锚点的 TRAVEL_DISPLAY_MODE 出行时间同时写入 poi.travel_time，显示在应用的详情页；
+# 默认位置与应用的默认位置（SearchViewModel / WaypointViewModel 的 defaultCenter）相同，
+# 应用只使用与起点相距 200 米以内的锚点，其他城市需用锚点配置文件给出坐标
+DEFAULT_TRAVEL_ANCHORS = [
+    {'name': '默认位置', 'lat': 30.5928, 'lon': 114.3055},
+    {'name': '交通枢纽', 'sub_category': ['火车站', '地铁站', '汽车站', '机场']},
+]
+
+TRAVEL_DISPLAY_MODE = 'walk'
+
+TRAVEL_ANCHORS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS travel_anchors (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        lat REAL,
+        lon REAL,
+        sources INTEGER NOT NULL
+    )
+'''
+
+POI_TRAVEL_TIME_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS poi_travel_time (
+        anchor_id INTEGER NOT NULL,
+        mode TEXT NOT NULL,
+        poi_id INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        via INTEGER,
+        PRIMARY KEY (anchor_id, mode, poi_id)
+    ) WITHOUT ROWID
+'''
+
+
+def travel_speed(tags, mode: str) -> Optional[float]:
+    """路径在该出行方式下的速度（km/h），不可通行时返回 None"""
+    speed = TRAVEL_SPEEDS[mode].get(tags.get('highway'))
+    for key in TRAVEL_ACCESS_KEYS[mode]:
+        value = tags.get(key)
+        if value in TRAVEL_ACCESS_DENY:
+            speed = None
+        elif value in TRAVEL_ACCESS_ALLOW:
+            speed = speed or TRAVEL_ALLOWED_SPEED[mode]
+    return speed
+
+
+def travel_oneway(tags, mode: str) -> int:
+    """单行方向：1 只能沿路径方向通行，-1 只能逆向，0 双向；步行不受单行限制"""
+    if mode == 'walk' or (mode == 'bike' and tags.get('oneway:bicycle') == 'no'):
+        return 0
+    value = tags.get('oneway')
+    if value in ('yes', '1', 'true'):
+        return 1
+    if value == '-1':
+        return -1
+    if value is None and (tags.get('junction') in ('roundabout', 'circular')
+                          or tags.get('highway') in ('motorway', 'motorway_link')):
+        return 1
+    return 0
+
+
+def format_travel_time(seconds: float) -> str:
+    """与应用 RouteResult.getFormattedTime() 相同的格式（X分钟 / X小时Y分钟），不足 1 分钟按 1 分钟"""
+    minutes = max(1, round(seconds / 60))
+    if minutes < 60:
+        return f'{minutes}分钟'
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}小时{minutes}分钟' if minutes else f'{hours}小时'
+
+
+class RoadGraph:
+    """
+    一种出行方式的路网（CSR）
+    
+    节点 v 的出边终点为 targets[offsets[v]:offsets[v + 1]]，weights 为对应的通行秒数。
+    三种方式共用同一组节点编号和坐标（lats / lons），不可通行的节点没有边。
+    构建时按无向图（单行边也算连通）标记连通分量，snap() 只吸附到最大分量中的节点：
+    停车场通道、小区内部路等孤立小片段上的起点几乎到不了任何地方
+    """
+    
+    def __init__(self, lats: array, lons: array, src: array, dst: array, weight: array):
+        self.lats = lats
+        self.lons = lons
+        node_count = len(lats)
+        
+        # 按起点计数排序（counting sort），同一起点的边连续存放
+        offsets = array('i', bytes(4 * (node_count + 1)))
+        for u in src:
+            offsets[u + 1] += 1
+        for v in range(node_count):
+            offsets[v + 1] += offsets[v]
+        position = array('i', offsets[:-1])
+        targets = array('i', bytes(4 * len(src)))
+        weights = array('f', bytes(4 * len(src)))
+        for u, v, w in zip(src, dst, weight):
+            p = position[u]
+            targets[p] = v
+            weights[p] = w
+            position[u] = p + 1
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        
+        connected = bytearray(node_count)
+        for v in dst:
+            connected[v] = 1
+        for u in src:
+            connected[u] = 1
+        self._connected = connected
+        self._main = self._main_component(src, dst)
+        self._grid: Optional[Dict[int, List[int]]] = None
+    
+    def _main_component(self, src: array, dst: array) -> bytearray:
+        """并查集标记连通分量，返回最大分量的节点标记（1 表示属于最大分量）"""
+        parent = array('i', range(len(self.lats)))
+        
+        def find(v: int) -> int:
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+        
+        for u, v in zip(src, dst):
+            ru, rv = find(u), find(v)
+            if ru != rv:
+                parent[ru] = rv
+        roots = [find(v) if connected else -1 for v, connected in enumerate(self._connected)]
+        sizes = Counter(root for root in roots if root >= 0)
+        main = sizes.most_common(1)[0][0] if sizes else -1
+        return bytearray(root == main and main >= 0 for root in roots)
+    
+    @property
+    def node_count(self) -> int:
+        return sum(self._connected)
+    
+    @property
+    def main_node_count(self) -> int:
+        """最大连通分量的节点数"""
+        return sum(self._main)
+    
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+    
+    @property
+    def nbytes(self) -> int:
+        """CSR 数组占用的字节数"""
+        return sum(a.itemsize * len(a) for a in (self.offsets, self.targets, self.weights))
+    
+    def _build_grid(self):
+        """按 TRAVEL_SNAP_CELL_M 米的网格索引最大连通分量的节点；经度方向按最高纬度取单元宽度"""
+        max_lat = min(max((abs(lat) for lat in self.lats), default=0.0), 85.0)
+        self._cell_lat = TRAVEL_SNAP_CELL_M / METERS_PER_DEGREE
+        self._cell_lon = self._cell_lat / math.cos(math.radians(max_lat))
+        grid: Dict[int, List[int]] = {}
+        for v, main in enumerate(self._main):
+            if main:
+                key = (int(self.lats[v] // self._cell_lat) << 32) + int(self.lons[v] // self._cell_lon)
+                grid.setdefault(key, []).append(v)
+        self._grid = grid
+    
+    def release_snap_index(self):
+        """释放吸附用的网格索引（下次 snap() 时重建）"""
+        self._grid = None
+    
+    def snap(self, lat: float, lon: float) -> Optional[Tuple[int, float]]:
+        """
+        距 (lat, lon) 最近且不超过 TRAVEL_SNAP_M 米的最大连通分量节点，返回 (节点, 距离米)
+        
+        由中心单元逐圈向外查找，第 r 圈的点至少相距 (r - 1) 个单元，已找到的点更近时停止
+        """
+        if self._grid is None:
+            self._build_grid()
+        cy, cx = int(lat // self._cell_lat), int(lon // self._cell_lon)
+        scale = math.cos(math.radians(lat))
+        lats, lons, grid = self.lats, self.lons, self._grid
+        best, best_m = None, TRAVEL_SNAP_M
+        for r in range(int(TRAVEL_SNAP_M // TRAVEL_SNAP_CELL_M) + 2):
+            if best is not None and best_m <= (r - 1) * TRAVEL_SNAP_CELL_M:
+                break
+            for dy in range(-r, r + 1):
+                # 第 r 圈：上下两行取整行，中间各行只取两端
+                step = 1 if abs(dy) == r else 2 * r
+                for dx in range(-r, r + 1, step):
+                    for v in grid.get(((cy + dy) << 32) + cx + dx, ()):
+                        meters = math.hypot(lats[v] - lat, (lons[v] - lon) * scale) * METERS_PER_DEGREE
+                        if meters < best_m:
+                            best, best_m = v, meters
+        return (best, best_m) if best is not None else None
+    
+    def dijkstra(self, sources: List[Tuple[int, float]], limit: float) -> Tuple[List[float], List[int]]:
+        """
+        多源 Dijkstra：sources 为 [(节点, 出发秒数), ...]，只扩展到 limit 秒
+        
+        返回每个节点的最短秒数（不可达为 inf）和来源（sources 中的下标，不可达为 -1）
+        """
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        dist = [math.inf] * len(self.lats)
+        origin = [-1] * len(self.lats)
+        heap = []
+        for i, (v, seconds) in enumerate(sources):
+            if seconds < dist[v]:
+                dist[v] = seconds
+                origin[v] = i
+                heap.append((seconds, v))
+        heapq.heapify(heap)
+        
+        while heap:
+            seconds, v = heapq.heappop(heap)
+            if seconds > dist[v]:
+                continue
+            source = origin[v]
+            for e in range(offsets[v], offsets[v + 1]):
+                u = targets[e]
+                t = seconds + weights[e]
+                if t < dist[u] and t <= limit:
+                    dist[u] = t
+                    origin[u] = source
+                    heapq.heappush(heap, (t, u))
+        return dist, origin
+
+
+class _RoadGraphHandler(osmium.SimpleHandler):
+    """收集道路节点坐标，按出行方式记录有向边（起点、终点、秒数）"""
+    
+    def __init__(self):
+        super().__init__()
+        self.node_index: Dict[int, int] = {}
+        self.lats = array('d')
+        self.lons = array('d')
+        self.edges = {mode: (array('i'), array('i'), array('f')) for mode in TRAVEL_MODES}
+        self.way_count = 0
+    
+    def way(self, w):
+        tags = w.tags
+        modes = []
+        for mode in TRAVEL_MODES:
+            speed = travel_speed(tags, mode)
+            if speed:
+                modes.append((self.edges[mode], 3.6 / speed, travel_oneway(tags, mode)))
+        if not modes:
+            return
+        self.way_count += 1
+        
+        lats, lons = self.lats, self.lons
+        prev = -1
+        for node in w.nodes:
+            location = node.location
+            if not location.valid():
+                prev = -1
+                continue
+            v = self.node_index.get(node.ref)
+            if v is None:
+                v = self.node_index[node.ref] = len(lats)
+                lats.append(location.lat)
+                lons.append(location.lon)
+            if prev >= 0 and prev != v:
+                meters = math.hypot(lats[v] - lats[prev],
+                                    (lons[v] - lons[prev]) * math.cos(math.radians(lats[v]))) * METERS_PER_DEGREE
+                for (src, dst, weight), seconds_per_meter, oneway in modes:
+                    seconds = meters * seconds_per_meter
+                    if oneway >= 0:
+                        src.append(prev)
+                        dst.append(v)
+                        weight.append(seconds)
+                    if oneway <= 0:
+                        src.append(v)
+                        dst.append(prev)
+                        weight.append(seconds)
+            prev = v
+
+
+def extract_road_graphs(filename: str, idx: str = 'flex_mem') -> Tuple[Dict[str, RoadGraph], int]:
+    """
+    从 PBF 中提取各出行方式的路网，返回 ({方式: RoadGraph}, 道路路径数)
+    
+    只有带 highway 标签的路径进入 Python 回调；节点坐标缓存位于过滤器之前
+    """
+    handler = _RoadGraphHandler()
+    with node_locations(idx, 'roads') as lh, \
+            osmium.io.Reader(filename, osmium.osm.NODE | osmium.osm.WAY) as reader:
+        osmium.apply(reader, lh, osmium.filter.EntityFilter(osmium.osm.WAY),
+                     osmium.filter.KeyFilter('highway'), handler)
+    graphs = {mode: RoadGraph(handler.lats, handler.lons, *handler.edges[mode]) for mode in TRAVEL_MODES}
+    return graphs, handler.way_count
+
+
+def load_travel_anchors(path: Optional[str]) -> List[Dict]:
+    """
+    读取锚点配置：JSON 列表，每项为 {"name", "lat", "lon"}（单点）或
+    {"name", "sub_category": 子分类或子分类列表}（多源）。未指定文件时使用 DEFAULT_TRAVEL_ANCHORS
+    """
+    if not path:
+        return [dict(anchor) for anchor in DEFAULT_TRAVEL_ANCHORS]
+    with open(path, encoding='utf-8') as f:
+        anchors = json.load(f)
+    if not isinstance(anchors, list) or not anchors:
+        raise ValueError('锚点配置应为非空 JSON 列表')
+    for anchor in anchors:
+        if not isinstance(anchor, dict) or not anchor.get('name'):
+            raise ValueError(f'锚点缺少名称: {anchor}')
+        if 'sub_category' in anchor:
+            if isinstance(anchor['sub_category'], str):
+                anchor['sub_category'] = [anchor['sub_category']]
+        elif not all(isinstance(anchor.get(key), (int, float)) for key in ('lat', 'lon')):
+            raise ValueError(f'锚点 {anchor["name"]} 需要数值 lat / lon 或 sub_category')
+    return anchors
+
+
+def build_travel_times(conn: sqlite3.Connection, graphs: Dict[str, RoadGraph], anchors: List[Dict],
+                       max_minutes: float = TRAVEL_MAX_MINUTES,
+                       display_mode: str = TRAVEL_DISPLAY_MODE) -> Dict[str, int]:
+    """
+    计算每条 POI 从各锚点出发的各方式出行时间，写入 travel_anchors 和 poi_travel_time
+    
+    每个 (锚点, 出行方式) 做一次多源 Dijkstra：多源锚点的每条来源 POI 都是起点，
+    结果为从最近来源出发的时间。POI 和起点到路网的吸附段按步行速度计时，
+    超过 max_minutes 的不写入。第一个单点锚点的 display_mode 出行时间格式化后写入 poi.travel_time。
+    返回 {'anchors': 锚点数, 'sources': 吸附到路网的起点数, 'rows': 写入行数}
+    """
+    limit = max_minutes * 60
+    access = 3.6 / TRAVEL_ACCESS_SPEED
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS poi_travel_time')
+    cursor.execute('DROP TABLE IF EXISTS travel_anchors')
+    cursor.execute(TRAVEL_ANCHORS_TABLE_SQL)
+    cursor.execute(POI_TRAVEL_TIME_TABLE_SQL)
+    
+    pois = cursor.execute('SELECT id, lat, lon, sub_category FROM poi ORDER BY id').fetchall()
+    
+    # 各锚点的出发位置 [(来源 POI ID 或 None, lat, lon), ...]
+    origins = []
+    for anchor_id, anchor in enumerate(anchors, start=1):
+        if 'sub_category' in anchor:
+            sub_categories = set(anchor['sub_category'])
+            points = [(poi_id, lat, lon) for poi_id, lat, lon, sub in pois if sub in sub_categories]
+            location = None
+        else:
+            location = (anchor['lat'], anchor['lon'])
+            points = [(None, *location)]
+        origins.append(points)
+        cursor.execute('INSERT INTO travel_anchors (id, name, lat, lon, sources) VALUES (?, ?, ?, ?, ?)',
+                       (anchor_id, anchor['name'], *(location or (None, None)), len(points)))
+    display_anchor = next((i for i, anchor in enumerate(anchors, start=1) if 'sub_category' not in anchor), None)
+    
+    stats = {'anchors': len(anchors), 'sources': 0, 'rows': 0}
+    for mode, graph in graphs.items():
+        snapped = [graph.snap(lat, lon) for _, lat, lon, _ in pois]
+        for anchor_id, points in enumerate(origins, start=1):
+            sources, via = [], []
+            for poi_id, lat, lon in points:
+                hit = graph.snap(lat, lon)
+                if hit:
+                    sources.append((hit[0], hit[1] * access))
+                    via.append(poi_id)
+            stats['sources'] += len(sources)
+            if not sources:
+                continue
+            dist, origin = graph.dijkstra(sources, limit)
+            rows = []
+            for (poi_id, *_), hit in zip(pois, snapped):
+                if hit is None:
+                    continue
+                seconds = dist[hit[0]] + hit[1] * access
+                if seconds <= limit:
+                    rows.append((anchor_id, mode, poi_id, round(seconds), via[origin[hit[0]]]))
+            cursor.executemany('''
+                INSERT INTO poi_travel_time (anchor_id, mode, poi_id, seconds, via) VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            stats['rows'] += len(rows)
+            if mode == display_mode and anchor_id == display_anchor:
+                cursor.executemany('UPDATE poi SET travel_time = ? WHERE id = ?',
+                                   [(format_travel_time(row[3]), row[2]) for row in rows])
+        graph.release_snap_index()
+    
+    cursor.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+        ('travel_modes', ','.join(graphs)),
+        ('travel_display_mode', display_mode),
+        ('travel_max_minutes', f'{max_minutes:g}'),
+    ])
+    return stats
+
+
+# ============================================================================
+# 增量更新
+# 将 OSM 变更文件 (.osc / .osc.gz) 应用到已有的 POI 数据库，
+# 按 (osm_type, osm_id) 插入、更新或删除记录，已有记录的行 ID 保持不变
+# ============================================================================
+
+class POIUpdateHandler(POIHandler):
+    """
+    OSM 变更文件处理器
+    
+    变更文件中的每个对象都要处理（不再是 POI 的对象需要删除），因此不使用预过滤器。
+    路径中心点需要节点坐标：变更文件中的节点会写入坐标索引，其余节点
+    需要使用全量构建时保留的坐标索引文件（见 --index），缺少坐标的路径保持原记录不变。
+    multipolygon 关系无法只凭变更文件重新组装，只更新属性并保留原有位置。
+    """
+    
+    def __init__(self, writer: PoiWriter, rules: CategoryRules = None):
+        super().__init__(writer=writer, rules=rules)
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.skipped = 0
+        self.merged_skipped = 0
+        self.stats = PoiStats()
+        # 全量构建时已合并到其他记录的对象（见 deduplicate_pois）
+        self.merged = load_merged(writer.conn)
+    
+    def _apply(self, osm_type: str, osm_id: int, poi: Optional[Dict]):
+        """写入一个对象的最新状态，poi 为 None 表示对象已删除或不再是 POI"""
+        if (osm_type, osm_id) in self.merged:
+            # 已合并的对象由保留的记录代表，删除时只移除合并记录
+            if poi is None:
+                self.writer.conn.execute('DELETE FROM poi_merged WHERE osm_type = ? AND osm_id = ?',
+                                         (osm_type, osm_id))
+                self.merged.discard((osm_type, osm_id))
+            else:
+                self.merged_skipped += 1
+            return
+        
+        if poi is None:
+            old = self.writer.delete(osm_type, osm_id)
+            if old:
+                self.deleted += 1
+                self.stats.add(*old, -1)
+            return
+        
+        old, new = self.writer.upsert(poi)
+        if old:
+            self.updated += 1
+            self.stats.add(*old, -1)
+        else:
+            self.inserted += 1
+        self.stats.add(*new)
+    
+    def node(self, n):
+        self.node_count += 1
+        if n.deleted or not n.location.valid():
+            self._apply('node', n.id, None)
+            return
+        
+        poi = self._extract_poi_info(n.id, dict(n.tags), n.location.lat, n.location.lon, 'node')
+        self._apply('node', n.id, poi)
+    
+    def way(self, w):
+        self.way_count += 1
+        tags = dict(w.tags)
+        if w.deleted or not self._get_category(tags):
+            self._apply('way', w.id, None)
+            return
+        
+        center = self._way_center(w)
+        if not center:
+            self.skipped += 1
+            return
+        
+        poi = self._extract_poi_info(w.id, tags, center[0], center[1], 'way')
+        self._apply('way', w.id, poi)
+    
+    def relation(self, r):
+        self.relation_count += 1
+        if r.deleted:
+            self._apply('relation', r.id, None)
+            return
+        
+        cursor = self.writer.conn.execute(
+            "SELECT lat, lon FROM poi WHERE osm_type = 'relation' AND osm_id = ?", (r.id,)
+        )
+        existing = cursor.fetchone()
+        if not existing:
+            # 新增的关系缺少成员几何，留待下次全量构建
+            self.skipped += 1
+            return
+        
+        poi = self._extract_poi_info(r.id, dict(r.tags), existing[0], existing[1], 'relation')
+        self._apply('relation', r.id, poi)
+
+
+def apply_changes(db_path: str, change_files: List[str], idx: str = 'flex_mem') -> Dict[str, int]:
+    """
+    将变更文件依次应用到已有的 POI 数据库（单个事务）
+    
+    返回 {'inserted', 'updated', 'deleted', 'skipped', 'merged_skipped', 'poi_count'}
+    """
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT value FROM metadata WHERE key = 'size_profile'").fetchone()
+    if row and row[0] == 'compact':
+        conn.close()
+        raise ValueError('精简输出的数据库不支持增量更新，请更新默认输出的数据库后重新生成')
+    # 旧版本生成的数据库没有 OSM 标识唯一索引，在此补建
+    create_poi_indexes(conn.cursor())
+    # 排行榜在应用全部变更后整体重建，应用过程中不逐条触发刷新（失败回滚时触发器一并恢复）
+    leaderboard = conn.execute("SELECT value FROM metadata WHERE key = 'leaderboard_top_n'").fetchone()
+    if leaderboard:
+        conn.execute('DROP TRIGGER IF EXISTS poi_leaderboard_rating')
+    writer = PoiWriter(conn)
+    handler = POIUpdateHandler(writer)
+    
+    lh = osmium.NodeLocationsForWays(osmium.index.create_map(idx))
+    lh.ignore_errors()
+    try:
+        for change_file in change_files:
+            print(f"  应用变更文件: {change_file}")
+            with osmium.io.Reader(change_file) as reader:
+                osmium.apply(reader, lh, handler)
+        
+        handler.stats.save(conn)
+        
+        # 已构建建议表的数据库按原参数重建
+        suggest = dict(conn.execute(
+            "SELECT key, value FROM metadata WHERE key IN ('suggest_prefix_len', 'suggest_top_k')"
+        ).fetchall())
+        if suggest:
+            build_suggestions(conn, int(suggest['suggest_prefix_len']), int(suggest['suggest_top_k']))
+        if leaderboard:
+            build_leaderboards(conn, int(leaderboard[0]))
+        # 出行时间需要路网，增量更新时不重算：只删除已不存在的 POI 的记录，新增的 POI 没有出行时间
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'poi_travel_time'").fetchone():
+            conn.execute('DELETE FROM poi_travel_time WHERE poi_id NOT IN (SELECT id FROM poi)')
+        
+        poi_count = conn.execute('SELECT COUNT(*) FROM poi').fetchone()[0]
+        conn.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+            ('updated_at', datetime.now().isoformat()),
+            ('last_change_file', os.path.basename(change_files[-1])),
+            ('poi_count', str(poi_count)),
+        ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    return {
+        'inserted': handler.inserted,
+        'updated': handler.updated,
+        'deleted': handler.deleted,
+        'skipped': handler.skipped,
+        'merged_skipped': handler.merged_skipped,
+        'poi_count': poi_count,
+    }
 
 
 def update_metadata(conn: sqlite3.Connection, input_file: str, poi_count: int):
     """
-    更新元数据信息
+    更新元数据信息
+    """
+    cursor = conn.cursor()
+    
+    metadata = [
+        ('version', '1.0'),
+        ('created_at', datetime.now().isoformat()),
+        ('source_file', os.path.basename(input_file)),
+        ('poi_count', str(poi_count)),
+        ('generator', 'extract_poi.py'),
+    ]
+    
+    cursor.executemany(
+        'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
+        metadata
+    )
+    
+    conn.commit()
+
+
+def print_stats(conn: sqlite3.Connection):
+    """
+    打印统计信息
+    """
+    cursor = conn.cursor()
+    
+    print("\n" + "=" * 60)
+    print("POI 分类统计")
+    print("=" * 60)
+    
+    cursor.execute('''
+        SELECT main_category, SUM(count) as total
+        FROM category_stats
+        GROUP BY main_category
+        ORDER BY total DESC
+    ''')
+    
+    for row in cursor.fetchall():
+        print(f"  {row[0]}: {row[1]} 条")
+    
+    cursor.execute('SELECT COUNT(*) FROM poi')
+    total = cursor.fetchone()[0]
+    print(f"\n总计: {total} 条 POI 记录")
+
+
+# ============================================================================
+# 精简输出（--size-profile compact）
+# 随 APK 分发的数据库只保留应用读取的数据：分类名称换成整数 ID，删除应用不用的列、
+# R-Tree 和普通索引，FTS 改为不保存内容的 contentless 表，最后 optimize + VACUUM。
+# 精简后的数据库只用于分发，不支持增量更新。
+# ============================================================================
+
+SIZE_PROFILES = ('default', 'compact')
+
+# 精简输出的 poi 表（应用读取的列，分类为 category_names 中的 ID）
+COMPACT_POI_TABLE_SQL = '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        main_category_id INTEGER NOT NULL,
+        sub_category_id INTEGER,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        address TEXT,
+        phone TEXT,
+        opening_hours TEXT,
+        description TEXT,
+        travel_time TEXT,
+        rating REAL,
+        {grid_columns}
+    )
+'''.replace('{grid_columns}', ', '.join(f'{col} INTEGER' for col in GRID_COLUMNS))
+
+CATEGORY_NAMES_TABLE_SQL = '''
+    CREATE TABLE category_names (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+'''
+
+# 4 KB 页比 1 KB / 2 KB 页的溢出页更少、内部节点更少，比 8 KB 以上的页末尾空闲更少
+COMPACT_PAGE_SIZE = 4096
+
+# FTS 只用于 MATCH 后按 rowid 回表，不读取列值也不按 bm25 排序，
+# 因此不保存内容（content=''）和列长度（columnsize=0）。
+# bigram 查询改为二元组 AND（见 cjk_fts_query），不需要位置信息，使用 detail=none；
+# 其他分词方式的多词查询是短语查询，需要 detail=full
+COMPACT_FTS_DETAIL = {'bigram': 'none', 'unicode61': 'full', 'trigram': 'full'}
+
+
+def object_sizes(conn: sqlite3.Connection) -> Dict[str, int]:
+    """各表和索引占用的字节数（需要 SQLite 编译时启用 dbstat）"""
+    try:
+        return dict(conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def compact_database(conn: sqlite3.Connection) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    把生成的数据库改写为精简输出，返回改写前后各对象的大小
+    
+    POI ID 保持不变（建议表中保存的是 ID）
+    """
+    before = object_sizes(conn)
+    cursor = conn.cursor()
+    metadata = dict(cursor.execute('SELECT key, value FROM metadata'))
+    tokenizer = metadata.get('fts_tokenizer', 'unicode61')
+    fts_cols = fts_columns(cursor)
+    
+    print("  分类名称换成整数 ID...")
+    cursor.execute('DROP TABLE IF EXISTS category_names')
+    cursor.execute(CATEGORY_NAMES_TABLE_SQL)
+    cursor.execute('''
+        INSERT INTO category_names (name)
+        SELECT name FROM (
+            SELECT main_category AS name FROM poi
+            UNION SELECT sub_category FROM poi WHERE sub_category IS NOT NULL
+        )
+        ORDER BY name
+    ''')
+    
+    print("  重建 poi 表...")
+    for trigger in ('poi_ai', 'poi_ad', 'poi_au'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    columns = ('id', 'name', 'lat', 'lon', 'address', 'phone', 'opening_hours',
+               'description', 'travel_time', 'rating', *GRID_COLUMNS)
+    cursor.execute(COMPACT_POI_TABLE_SQL.format(table='poi_compact'))
+    cursor.execute(f'''
+        INSERT INTO poi_compact ({', '.join(columns)}, main_category_id, sub_category_id)
+        SELECT {', '.join(f'p.{col}' for col in columns)}, m.id, s.id
+        FROM poi p
+        JOIN category_names m ON m.name = p.main_category
+        LEFT JOIN category_names s ON s.name = p.sub_category
+        ORDER BY p.id
+    ''')
+    
+    print("  重建 FTS 全文索引...")
+    detail = COMPACT_FTS_DETAIL[tokenizer]
+    cursor.execute('DROP TABLE poi_fts')
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE poi_fts USING fts5(
+            {', '.join(fts_cols)},
+            content='',
+            columnsize=0,
+            detail={detail},
+            tokenize='{'trigram' if tokenizer == 'trigram' else 'unicode61'}'
+        )
+    ''')
+    cursor.execute(f'''
+        INSERT INTO poi_fts (rowid, {', '.join(fts_cols)})
+        SELECT id, {', '.join(f'p.{col}' for col in fts_cols)} FROM poi p
+    ''')
+    cursor.execute("INSERT INTO poi_fts(poi_fts) VALUES('optimize')")
+    
+    cursor.execute('DROP TABLE poi')
+    cursor.execute('ALTER TABLE poi_compact RENAME TO poi')
+    cursor.execute('DROP TABLE IF EXISTS poi_rtree')
+    cursor.execute('DROP TABLE IF EXISTS tag_keys')
+    cursor.execute('DROP TABLE IF EXISTS poi_merged')
+    
+    # 密度直方图的分类换成 ID
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'poi_density'").fetchone():
+        cursor.execute(POI_DENSITY_TABLE_SQL.format(table='poi_density_compact', category='main_category_id',
+                                                    category_type='INTEGER'))
+        cursor.execute('''
+            INSERT INTO poi_density_compact (level, cell, main_category_id, count)
+            SELECT d.level, d.cell, m.id, d.count
+            FROM poi_density d JOIN category_names m ON m.name = d.main_category
+        ''')
+        cursor.execute('DROP TABLE poi_density')
+        cursor.execute('ALTER TABLE poi_density_compact RENAME TO poi_density')
+    
+    # 排行榜的分类同样换成 ID，评分触发器随旧 poi 表删除，在新表上重建
+    if 'leaderboard_top_n' in metadata:
+        cursor.execute(LEADERBOARD_TABLE_SQL.format(table='poi_leaderboard_compact', category='main_category_id',
+                                                    category_type='INTEGER'))
+        cursor.execute('''
+            INSERT INTO poi_leaderboard_compact (main_category_id, metric, cell, score, poi_id)
+            SELECT m.id, l.metric, l.cell, l.score, l.poi_id
+            FROM poi_leaderboard l JOIN category_names m ON m.name = l.main_category
+        ''')
+        cursor.execute('DROP TABLE poi_leaderboard')
+        cursor.execute('ALTER TABLE poi_leaderboard_compact RENAME TO poi_leaderboard')
+        create_leaderboard_trigger(cursor, int(metadata['leaderboard_top_n']), 'main_category_id')
+    
+    # 分类搜索和网格附近搜索使用的索引（网格索引不再带显示列，回表读取）
+    print("  构建索引...")
+    cursor.execute('CREATE INDEX idx_poi_category ON poi(main_category_id)')
+    for column in GRID_COLUMNS:
+        cursor.execute(f'CREATE INDEX idx_poi_{column} ON poi({column}, main_category_id)')
+    
+    cursor.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+        ('size_profile', 'compact'),
+        ('fts_detail', detail),
+    ])
+    conn.commit()
+    
+    print("  VACUUM...")
+    cursor.execute(f'PRAGMA page_size = {COMPACT_PAGE_SIZE}')
+    cursor.execute('PRAGMA journal_mode = DELETE')
+    cursor.execute('VACUUM')
+    cursor.execute('ANALYZE')
+    conn.commit()
+    
+    return before, object_sizes(conn)
+
+
+def print_size_report(before: Dict[str, int], after: Dict[str, int]):
+    """逐个表和索引打印精简前后的大小"""
+    print("\n" + "=" * 60)
+    print("精简前后大小 (MB)")
+    print("=" * 60)
+    for name in sorted(set(before) | set(after), key=lambda n: -before.get(n, after.get(n, 0))):
+        old, new = before.get(name), after.get(name)
+        if max(old or 0, new or 0) < 1024 * 16:
+            continue
+        old_text = f'{old / 1024 / 1024:8.2f}' if old is not None else '       -'
+        new_text = f'{new / 1024 / 1024:8.2f}' if new is not None else '    删除'
+        print(f"  {name:<28} {old_text} → {new_text}")
+    print(f"  {'合计':<28} {sum(before.values()) / 1024 / 1024:8.2f} → "
+          f"{sum(after.values()) / 1024 / 1024:8.2f}")
+
+
+# ============================================================================
+# 二进制 POI 包（--pack）
+# 只读的扁平文件，可直接 mmap 后查询，无需解析、不逐行分配对象。全部为小端序：
+#   文件头     PACK_HEADER
+#   分类表     category_count 个 uint32 字符串偏移，记录中的主分类为其下标
+#   网格目录   rows × cols + 1 个 uint32，第 k 个单元（行优先）的记录为 [dir[k], dir[k+1])
+#   记录       record_count 条定长 PACK_RECORD，按 (网格行, 网格列, Hilbert 序号) 排序
+#   字符串表   每个字符串为 uint16 字节长度 + UTF-8，相同字符串只存一份
+# 网格单元与 grid_cell() 相同（经纬度按 1/2^level 度量化），level 按记录数自动选择，
+# 目录只覆盖数据范围 [row0, row0 + rows) × [col0, col0 + cols)
+# ============================================================================
+
+PACK_MAGIC = b'POIPACK\x00'
+PACK_VERSION = 1
+
+# magic, version, record_size, record_count, category_count, grid_level, row0, col0, rows, cols,
+# 分类表 / 目录 / 记录 / 字符串表的偏移, 字符串表字节数
+PACK_HEADER = struct.Struct('<8sHHIIIiiIIQQQQQ')
+
+# lat, lon（1e-7 度整数）, POI ID, name, address, phone, opening_hours, description,
+# travel_time（字符串偏移）, 主分类下标, rating × 100
+PACK_RECORD = struct.Struct('<iiIIIIIIIHH')
+PACK_COORD_SCALE = 10_000_000
+PACK_NONE = 0xFFFFFFFF
+PACK_NO_RATING = 0xFFFF
+
+# 网格单元平均至少容纳的记录数（决定 level，同时限制目录大小）
+PACK_CELL_TARGET = 4
+PACK_MAX_LEVEL = 16
+
+
+def _pack_align(buf: bytearray, alignment: int = 8):
+    buf.extend(b'\x00' * (-len(buf) % alignment))
+
+
+def _pack_grid_level(min_lat: float, max_lat: float, min_lon: float, max_lon: float, count: int) -> int:
+    """选择单元数不超过 count / PACK_CELL_TARGET 的最细 level"""
+    level = 0
+    while level < PACK_MAX_LEVEL:
+        n = 1 << (level + 1)
+        rows = int((max_lat + 90.0) * n) - int((min_lat + 90.0) * n) + 1
+        cols = int((max_lon + 180.0) * n) - int((min_lon + 180.0) * n) + 1
+        if rows * cols > max(count // PACK_CELL_TARGET, 1):
+            break
+        level += 1
+    return level
+
+
+def write_poi_pack(conn: sqlite3.Connection, path: str) -> Dict[str, int]:
+    """
+    把 poi 表写成二进制 POI 包，返回 {'records', 'cells', 'level', 'size'}
     """
-    cursor = conn.cursor()
+    rows = conn.execute('''
+        SELECT id, name, main_category, lat, lon, address, phone, opening_hours,
+               description, travel_time, rating, hilbert
+        FROM poi
+    ''').fetchall()
+    if rows:
+        level = _pack_grid_level(min(r[3] for r in rows), max(r[3] for r in rows),
+                                 min(r[4] for r in rows), max(r[4] for r in rows), len(rows))
+    else:
+        level = 0
+    n = 1 << level
+    cells = [(int((r[3] + 90.0) * n), int((r[4] + 180.0) * n)) for r in rows]
+    row0 = min((c[0] for c in cells), default=0)
+    col0 = min((c[1] for c in cells), default=0)
+    grid_rows = max((c[0] for c in cells), default=0) - row0 + 1
+    grid_cols = max((c[1] for c in cells), default=0) - col0 + 1
+    order = sorted(range(len(rows)), key=lambda i: (cells[i], rows[i][11] or 0, rows[i][0]))
     
-    metadata = [
-        ('version', '1.0'),
-        ('created_at', datetime.now().isoformat()),
-        ('source_file', os.path.basename(input_file)),
-        ('poi_count', str(poi_count)),
-        ('generator', 'extract_poi.py'),
-    ]
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
     
-    cursor.executemany(
-        'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
-        metadata
+    def string_ref(text: Optional[str]) -> int:
+        if text is None or text == '':
+            return PACK_NONE
+        offset = string_offsets.get(text)
+        if offset is None:
+            data = text.encode('utf-8')[:0xFFFF].decode('utf-8', 'ignore').encode('utf-8')
+            offset = string_offsets[text] = len(strings)
+            strings.extend(struct.pack('<H', len(data)))
+            strings.extend(data)
+        return offset
+    
+    categories: Dict[str, int] = {}
+    for r in rows:
+        categories.setdefault(r[2], len(categories))
+    category_refs = [string_ref(name) for name in categories]
+    
+    directory = [0] * (grid_rows * grid_cols + 1)
+    records = bytearray(PACK_RECORD.size * len(rows))
+    for position, i in enumerate(order):
+        r = rows[i]
+        cell_row, cell_col = cells[i]
+        directory[(cell_row - row0) * grid_cols + (cell_col - col0) + 1] += 1
+        rating = PACK_NO_RATING if r[10] is None else min(max(int(round(r[10] * 100)), 0), PACK_NO_RATING - 1)
+        PACK_RECORD.pack_into(
+            records, position * PACK_RECORD.size,
+            int(round(r[3] * PACK_COORD_SCALE)), int(round(r[4] * PACK_COORD_SCALE)), r[0],
+            string_ref(r[1]), string_ref(r[5]), string_ref(r[6]), string_ref(r[7]),
+            string_ref(r[8]), string_ref(r[9]), categories[r[2]], rating,
+        )
+    # 计数转为前缀和
+    for k in range(1, len(directory)):
+        directory[k] += directory[k - 1]
+    
+    body = bytearray(PACK_HEADER.size)
+    _pack_align(body)
+    categories_off = len(body)
+    body.extend(struct.pack(f'<{len(category_refs)}I', *category_refs))
+    _pack_align(body)
+    directory_off = len(body)
+    body.extend(struct.pack(f'<{len(directory)}I', *directory))
+    _pack_align(body)
+    records_off = len(body)
+    body.extend(records)
+    strings_off = len(body)
+    body.extend(strings)
+    PACK_HEADER.pack_into(
+        body, 0, PACK_MAGIC, PACK_VERSION, PACK_RECORD.size, len(rows), len(categories), level,
+        row0, col0, grid_rows, grid_cols, categories_off, directory_off, records_off, strings_off, len(strings),
     )
     
-    conn.commit()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return {'records': len(rows), 'cells': grid_rows * grid_cols, 'level': level, 'size': len(body)}
 
 
-def print_stats(conn: sqlite3.Connection):
+# ============================================================================
+# 空间分片（--shard）
+# 全省 / 全国数据按瓦片拆成多个数据库，查询只打开覆盖查询范围的分片。
+# 瓦片按经纬度等分四叉树编号：第 z 级把经度 360° 和纬度 180° 各等分为 2^z 份，
+# (x, y) 从西南角起算。fixed 模式使用固定级别，quadtree 模式从第 0 级开始
+# 把 POI 数超过上限的瓦片继续四分。完整数据库照常生成后按瓦片拆分（POI ID 保持不变），
+# 最后写出清单 manifest.json（瓦片范围、行数、文件大小和 SHA-256）。
+# ============================================================================
+
+SHARD_MODES = ('fixed', 'quadtree')
+SHARD_DEFAULT_LEVEL = 8           # 约 1.4° × 0.7°，与一个地级市范围相当
+SHARD_DEFAULT_MAX_POIS = 50000
+SHARD_MAX_LEVEL = 16              # 四分的最深级别（约 0.005° × 0.003°）
+SHARD_MANIFEST = 'manifest.json'
+SHARD_STAGING_DB = 'full_poi.db'  # 拆分前的完整数据库，拆分后删除
+
+
+def tile_of(lat: float, lon: float, level: int) -> Tuple[int, int]:
+    """坐标所在的第 level 级瓦片 (x, y)"""
+    n = 1 << level
+    x = min(int((lon + 180.0) / 360.0 * n), n - 1)
+    y = min(int((lat + 90.0) / 180.0 * n), n - 1)
+    return x, y
+
+
+def tile_bounds(level: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """瓦片范围 (min_lon, min_lat, max_lon, max_lat)"""
+    n = 1 << level
+    return (x * 360.0 / n - 180.0, y * 180.0 / n - 90.0,
+            (x + 1) * 360.0 / n - 180.0, (y + 1) * 180.0 / n - 90.0)
+
+
+def plan_shards(points: List[Tuple[int, float, float]], mode: str,
+                level: int = SHARD_DEFAULT_LEVEL,
+                max_pois: int = SHARD_DEFAULT_MAX_POIS) -> Dict[Tuple[int, int, int], List[int]]:
     """
-    打印统计信息
+    按模式划分瓦片，points 为 (id, lat, lon)，返回 {(z, x, y): [POI ID]}（只含非空瓦片）
     """
-    cursor = conn.cursor()
+    if mode == 'fixed':
+        tiles: Dict[Tuple[int, int, int], List[int]] = {}
+        for poi_id, lat, lon in points:
+            tiles.setdefault((level, *tile_of(lat, lon, level)), []).append(poi_id)
+        return tiles
+    
+    tiles = {}
+    pending = [((0, 0, 0), points)]
+    while pending:
+        tile, members = pending.pop()
+        z = tile[0]
+        if len(members) <= max_pois or z >= SHARD_MAX_LEVEL:
+            tiles[tile] = [poi_id for poi_id, _, _ in members]
+            continue
+        children: Dict[Tuple[int, int, int], List] = {}
+        for member in members:
+            children.setdefault((z + 1, *tile_of(member[1], member[2], z + 1)), []).append(member)
+        pending.extend(children.items())
+    return tiles
+
+
+def shard_file_name(tile: Tuple[int, int, int]) -> str:
+    return 'poi_{}_{}_{}.db'.format(*tile)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_shards(full_db: str, out_dir: str, tiles: Dict[Tuple[int, int, int], List[int]],
+                 input_file: str, suggest: int = 0, suggest_top: int = SUGGEST_TOP_K,
+                 size_profile: str = 'default', leaderboard: int = 0) -> List[Dict]:
+    """
+    把完整数据库按瓦片拆成分片数据库，返回清单中的瓦片列表
+    
+    每个分片与完整数据库结构相同（同样的分词方式、建议表、排行榜和精简选项），
+    POI ID 保持不变，跨分片合并结果时不会重复
+    """
+    src = sqlite3.connect(full_db)
+    tokenizer = (src.execute("SELECT value FROM metadata WHERE key = 'fts_tokenizer'").fetchone()
+                 or ('unicode61',))[0]
+    src.execute('DROP TABLE IF EXISTS shard_tiles')
+    src.execute('CREATE TABLE shard_tiles (tile TEXT NOT NULL, id INTEGER NOT NULL)')
+    src.executemany('INSERT INTO shard_tiles (tile, id) VALUES (?, ?)', (
+        (shard_file_name(tile), poi_id) for tile, ids in tiles.items() for poi_id in ids
+    ))
+    src.execute('CREATE INDEX idx_shard_tiles ON shard_tiles(tile, id)')
+    src.commit()
+    src.close()
+    
+    columns = ', '.join(('id', *POI_COLUMNS))
+    entries = []
+    for tile in sorted(tiles):
+        name = shard_file_name(tile)
+        path = os.path.join(out_dir, name)
+        conn = create_database(path, bulk=True, fts_tokenizer=tokenizer)
+        conn.execute('ATTACH DATABASE ? AS src', (full_db,))
+        # 先复制键名表，写入器重新编码标签时得到与完整数据库相同的键 ID
+        conn.execute(TAG_KEYS_TABLE_SQL)
+        conn.execute('INSERT INTO tag_keys SELECT * FROM src.tag_keys')
+        conn.commit()
+        keys = load_tag_keys(conn)
+        writer = PoiWriter(conn, bulk=True)
+        source = conn.cursor()
+        source.execute(f'''
+            SELECT {columns} FROM src.poi
+            WHERE id IN (SELECT id FROM src.shard_tiles WHERE tile = ?)
+            ORDER BY id
+        ''', (name,))
+        while True:
+            rows = source.fetchmany(10000)
+            if not rows:
+                break
+            # 经 write_rows() 写入，分类计数和密度直方图由 PoiStats 累计
+            writer.write_rows([
+                (*row[1:_TAGS_IDX + 1], decode_tags(row[_TAGS_IDX + 1], keys), *row[_TAGS_IDX + 2:])
+                for row in rows
+            ], ids=[row[0] for row in rows])
+        if conn.execute("SELECT 1 FROM src.sqlite_master WHERE name = 'poi_travel_time'").fetchone():
+            conn.execute(TRAVEL_ANCHORS_TABLE_SQL)
+            conn.execute(POI_TRAVEL_TIME_TABLE_SQL)
+            conn.execute('INSERT INTO travel_anchors SELECT * FROM src.travel_anchors')
+            conn.execute('''
+                INSERT INTO poi_travel_time SELECT * FROM src.poi_travel_time
+                WHERE poi_id IN (SELECT id FROM src.shard_tiles WHERE tile = ?)
+            ''', (name,))
+            conn.execute('''
+                INSERT INTO metadata SELECT * FROM src.metadata WHERE key IN ('travel_modes', 'travel_max_minutes')
+            ''')
+        print(f"  分片 {name}: {len(tiles[tile])} 条")
+        writer.finish()
+        conn.execute('DETACH DATABASE src')
+        
+        if suggest > 0:
+            build_suggestions(conn, suggest, suggest_top)
+        if leaderboard > 0:
+            build_leaderboards(conn, leaderboard)
+        update_metadata(conn, input_file, len(tiles[tile]))
+        bounds = tile_bounds(*tile)
+        conn.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+            ('shard', '{}/{}/{}'.format(*tile)),
+            ('shard_bounds', ','.join(f'{v:.9g}' for v in bounds)),
+        ])
+        conn.commit()
+        if size_profile == 'compact':
+            compact_database(conn)
+        conn.close()
+        
+        entries.append({
+            'tile': '{}/{}/{}'.format(*tile),
+            'file': name,
+            'bounds': [round(v, 9) for v in bounds],
+            'poi_count': len(tiles[tile]),
+            'size': os.path.getsize(path),
+            'sha256': file_sha256(path),
+        })
+    return entries
+
+
+def write_manifest(out_dir: str, entries: List[Dict], mode: str, level: int, max_pois: int,
+                   input_file: str, size_profile: str) -> str:
+    """写出分片清单，返回文件路径"""
+    manifest = {
+        'version': 1,
+        'created_at': datetime.now().isoformat(),
+        'source_file': os.path.basename(input_file),
+        'mode': mode,
+        'level': level if mode == 'fixed' else None,
+        'max_pois': max_pois if mode == 'quadtree' else None,
+        'size_profile': size_profile,
+        'poi_count': sum(entry['poi_count'] for entry in entries),
+        'tiles': entries,
+    }
+    path = os.path.join(out_dir, SHARD_MANIFEST)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# ============================================================================
+# 多城市提取（--cities / --city）
+# 一次读取大范围 PBF（如全国数据），按坐标把每条 POI 写入所有范围包含它的城市数据库，
+# 代替每个城市各自 osmium extract 再完整解析一遍。
+# ============================================================================
+
+_CITY_NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class CityRegion:
+    """
+    城市范围：矩形 (min_lon, min_lat, max_lon, max_lat)，可带多边形（需要 shapely）
+    
+    先做矩形判断，落在矩形内的点再判断是否在多边形内
+    """
+    
+    def __init__(self, name: str, bbox: Tuple[float, float, float, float], polygon=None):
+        if not _CITY_NAME_RE.match(name):
+            raise ValueError(f"城市名称只能包含字母、数字、下划线和连字符: {name}")
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if min_lon >= max_lon or min_lat >= max_lat:
+            raise ValueError(f"城市 {name} 的范围无效: {bbox}")
+        self.name = name
+        self.bbox = bbox
+        self.polygon = polygon
+        if polygon is not None:
+            shapely.prepare(polygon)
+    
+    @classmethod
+    def from_spec(cls, name: str, spec: Dict) -> 'CityRegion':
+        """
+        从配置项创建：{"bbox": [min_lon, min_lat, max_lon, max_lat]}、
+        {"polygon": [[lon, lat], ...]} 或 {"geometry": GeoJSON Polygon / MultiPolygon}
+        """
+        if 'bbox' in spec:
+            return cls(name, tuple(float(v) for v in spec['bbox']))
+        if 'polygon' not in spec and 'geometry' not in spec:
+            raise ValueError(f"城市 {name} 需要 bbox、polygon 或 geometry")
+        if shapely is None:
+            raise ValueError(f"城市 {name} 使用多边形范围，需要安装 shapely（pip install shapely）")
+        if 'polygon' in spec:
+            polygon = shapely.Polygon(spec['polygon'])
+        else:
+            polygon = shapely.geometry.shape(spec['geometry'])
+        if not polygon.is_valid or polygon.is_empty:
+            raise ValueError(f"城市 {name} 的多边形无效")
+        return cls(name, polygon.bounds, polygon)
+    
+    def contains(self, lat: float, lon: float) -> bool:
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        return self.polygon is None or shapely.contains_xy(self.polygon, lon, lat)
+
+
+def load_cities(path: Optional[str], specs: List[str]) -> List[CityRegion]:
+    """
+    读取城市范围：path 为 JSON 文件 {名称: 配置项}（见 CityRegion.from_spec），
+    specs 为命令行的 "名称=min_lon,min_lat,max_lon,max_lat"
+    """
+    cities = []
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for name, spec in json.load(f).items():
+                cities.append(CityRegion.from_spec(name, spec))
+    for spec in specs:
+        name, sep, bbox = spec.partition('=')
+        values = bbox.split(',')
+        if not sep or len(values) != 4:
+            raise ValueError(f"城市格式应为 名称=min_lon,min_lat,max_lon,max_lat: {spec}")
+        cities.append(CityRegion(name.strip(), tuple(float(v) for v in values)))
+    names = [city.name for city in cities]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"城市名称重复: {', '.join(sorted(duplicates))}")
+    return cities
+
+
+class CityRouter:
+    """
+    多城市写入器：接口与 PoiWriter 相同（write / write_rows / finish），
+    每条 POI 交给所有范围包含它的城市的 PoiWriter（范围重叠时写入多个数据库）
+    """
+    
+    def __init__(self, cities: List[CityRegion], writers: Dict[str, PoiWriter]):
+        self.cities = cities
+        self.writers = writers
+        self.count = 0
+        self.unmatched = 0
+    
+    def write(self, pois: List[Dict]) -> int:
+        return self.write_rows([poi_row(poi) for poi in pois])
+    
+    def write_rows(self, rows: List[Tuple]) -> int:
+        routed: Dict[str, List[Tuple]] = {}
+        lat_idx = POI_COLUMNS.index('lat')
+        lon_idx = POI_COLUMNS.index('lon')
+        for row in rows:
+            matched = False
+            for city in self.cities:
+                if city.contains(row[lat_idx], row[lon_idx]):
+                    routed.setdefault(city.name, []).append(row)
+                    matched = True
+            if not matched:
+                self.unmatched += 1
+        for name, city_rows in routed.items():
+            self.count += self.writers[name].write_rows(city_rows)
+        return len(rows)
+    
+    def finish(self):
+        for writer in self.writers.values():
+            writer.finish()
+
+
+def run_update(args):
+    """
+    增量更新模式入口
+    """
+    for path in [args.output, *args.update]:
+        if not os.path.exists(path):
+            print(f"错误: 文件不存在: {path}")
+            sys.exit(1)
+    
+    try:
+        idx, idx_tmp = resolve_location_index(args.index, os.path.dirname(os.path.abspath(args.output)))
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    
+    set_category_rules(CategoryRules.load(args.categories))
     
-    print("\n" + "=" * 60)
-    print("POI 分类统计")
     print("=" * 60)
+    print("POI 增量更新")
+    print("=" * 60)
+    print(f"数据库: {args.output}")
+    print(f"坐标索引: {idx}")
+    print()
     
-    cursor.execute('''
-        SELECT main_category, SUM(count) as total
-        FROM category_stats
-        GROUP BY main_category
-        ORDER BY total DESC
-    ''')
+    start = time.perf_counter()
+    try:
+        stats = apply_changes(args.output, args.update, idx)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    finally:
+        if idx_tmp and os.path.exists(idx_tmp):
+            os.remove(idx_tmp)
     
-    for row in cursor.fetchall():
-        print(f"  {row[0]}: {row[1]} 条")
+    print(f"\n  新增: {stats['inserted']}, 更新: {stats['updated']}, 删除: {stats['deleted']}")
+    if stats['skipped']:
+        print(f"  跳过（缺少几何信息）: {stats['skipped']}")
+    if stats['merged_skipped']:
+        print(f"  跳过（已合并到其他记录）: {stats['merged_skipped']}")
+    print(f"  当前 POI 总数: {stats['poi_count']}")
+    print(f"  耗时 {time.perf_counter() - start:.1f} 秒")
+    print(f"\n✅ POI 数据库更新完成: {args.output}")
+
+
+def finalize_database(conn: sqlite3.Connection, path: str, args, profiler: Optional[Profiler],
+                      city: Optional[CityRegion] = None, road_graphs: Optional[Dict[str, RoadGraph]] = None,
+                      travel_anchors: Optional[List[Dict]] = None):
+    """
+    结束写入之后的收尾：去重、建议表、排行榜、出行时间、分类统计、元数据、精简输出，
+    然后关闭数据库并显示文件大小
+    """
+    if args.dedup > 0:
+        print(f"  合并重复 POI (同名同分类, 半径 {args.dedup:g} 米)...")
+        start = time.perf_counter()
+        group_count, removed = deduplicate_pois(conn, args.dedup)
+        print(f"  合并 {group_count} 组, 删除 {removed} 条重复记录, 耗时 {time.perf_counter() - start:.1f} 秒")
+        if profiler:
+            profiler.stage('dedup', time.perf_counter() - start)
     
+    # 统计实际插入数量
+    cursor = conn.cursor()
     cursor.execute('SELECT COUNT(*) FROM poi')
-    total = cursor.fetchone()[0]
-    print(f"\n总计: {total} 条 POI 记录")
+    inserted = cursor.fetchone()[0]
+    print(f"  共插入: {inserted} 条记录")
+    
+    if args.suggest > 0:
+        print(f"  构建自动补全建议表 (前缀 {args.suggest} 字, 每个前缀 {args.suggest_top} 条)...")
+        start = time.perf_counter()
+        prefix_count = build_suggestions(conn, args.suggest, args.suggest_top)
+        conn.commit()
+        print(f"  建议表: {prefix_count} 个前缀, 耗时 {time.perf_counter() - start:.1f} 秒")
+        if profiler:
+            profiler.stage('suggest', time.perf_counter() - start)
+    
+    # 分片模式在拆分时为每个分片分别构建
+    if args.leaderboard > 0 and not args.shard:
+        print(f"  构建分类排行榜 (每榜 {args.leaderboard} 条)...")
+        start = time.perf_counter()
+        board_count = build_leaderboards(conn, args.leaderboard)
+        conn.commit()
+        print(f"  排行榜: {board_count} 个, 耗时 {time.perf_counter() - start:.1f} 秒")
+        if profiler:
+            profiler.stage('leaderboard', time.perf_counter() - start)
+    
+    if road_graphs:
+        print(f"  预计算出行时间 ({len(travel_anchors)} 个锚点, {args.travel_max_minutes:g} 分钟以内)...")
+        start = time.perf_counter()
+        travel = build_travel_times(conn, road_graphs, travel_anchors, args.travel_max_minutes,
+                                    args.travel_display_mode)
+        conn.commit()
+        print(f"  出行时间: {travel['rows']} 条 (各方式吸附到路网的起点共 {travel['sources']} 个), "
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+        if profiler:
+            profiler.stage('travel_time', time.perf_counter() - start)
+    
+    # 第四步：更新统计和元数据
+    print("\n>>> 步骤 4/4: 更新统计信息...")
+    start = time.perf_counter()
+    # 分类统计和密度直方图已由 PoiWriter.finish() 写入（去重时增量调整）
+    update_metadata(conn, args.input, inserted)
+    if city:
+        conn.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', [
+            ('city', city.name),
+            ('city_bbox', ','.join(f'{v:.7f}' for v in city.bbox)),
+        ])
+        conn.commit()
+    print("  统计信息更新完成")
+    if profiler:
+        profiler.stage('stats', time.perf_counter() - start)
+    
+    # 显示统计
+    print_stats(conn)
+    
+    if args.pack:
+        pack_path = os.path.splitext(path)[0] + '.pack'
+        start = time.perf_counter()
+        info = write_poi_pack(conn, pack_path)
+        print(f"\n二进制包: {pack_path} ({info['size'] / 1024 / 1024:.2f} MB, {info['records']} 条记录, "
+              f"网格 level {info['level']} / {info['cells']} 个单元, 耗时 {time.perf_counter() - start:.1f} 秒)")
+        if profiler:
+            profiler.stage('pack', time.perf_counter() - start)
+    
+    if args.size_profile == 'compact' and not args.shard:
+        print("\n>>> 生成精简输出...")
+        start = time.perf_counter()
+        before, after = compact_database(conn)
+        print(f"  耗时 {time.perf_counter() - start:.1f} 秒")
+        if profiler:
+            profiler.stage('compact', time.perf_counter() - start)
+        print_size_report(before, after)
+    
+    # 关闭数据库
+    conn.close()
+    
+    # 显示文件大小
+    db_size = os.path.getsize(path)
+    db_size_mb = db_size / (1024 * 1024)
+    
+    print(f"\n数据库文件大小: {db_size_mb:.2f} MB")
 
 
 def main():
@@ -715,12 +3707,14 @@ def main():
 示例:
     python3 extract_poi.py --input wuhan.osm.pbf --output wuhan_poi.db
     python3 extract_poi.py -i china.osm.pbf -o china_poi.db --verbose
+    python3 extract_poi.py -i china.osm.pbf -o china_poi.db --workers 8
+    python3 extract_poi.py -o wuhan_poi.db --update 2026-10-16.osc.gz
+    python3 extract_poi.py -i china.osm.pbf -o cities/ --cities cities.json
         '''
     )
     
     parser.add_argument(
         '-i', '--input',
-        required=True,
         help='输入的 OSM PBF 文件路径'
     )
     
@@ -730,6 +3724,201 @@ def main():
         help='输出的 SQLite 数据库文件路径'
     )
     
+    parser.add_argument(
+        '-c', '--categories',
+        default=DEFAULT_CATEGORIES_FILE,
+        help='POI 分类规则配置文件 (默认: 脚本目录下的 poi_categories.json)'
+    )
+    
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='并行解析的进程数 (默认: 1，即单进程串行)'
+    )
+    
+    parser.add_argument(
+        '--fts-tokenizer',
+        choices=FTS_TOKENIZERS,
+        default='unicode61',
+        help='全文索引分词方式 (默认: unicode61)；bigram 预计算汉字二元组，'
+             '任意长度的中文子串都能命中索引'
+    )
+    
+    parser.add_argument(
+        '--dedup',
+        type=float,
+        nargs='?',
+        const=DEDUP_RADIUS_M,
+        default=0,
+        metavar='METERS',
+        help=f'合并重复 POI：同名（归一化后）、同主分类且相距不超过 METERS 米的记录合并为一条 '
+             f'(默认 {DEDUP_RADIUS_M:g} 米)'
+    )
+    
+    parser.add_argument(
+        '--suggest',
+        type=int,
+        nargs='?',
+        const=SUGGEST_PREFIX_LEN,
+        default=0,
+        metavar='N',
+        help=f'构建自动补全建议表：名称前 N 个字的每个前缀对应排名前 K 的 POI (默认 N={SUGGEST_PREFIX_LEN})'
+    )
+    
+    parser.add_argument(
+        '--suggest-top',
+        type=int,
+        default=SUGGEST_TOP_K,
+        metavar='K',
+        help=f'建议表中每个前缀保留的 POI 数 (默认: {SUGGEST_TOP_K})'
+    )
+    
+    parser.add_argument(
+        '--leaderboard',
+        type=int,
+        nargs='?',
+        const=LEADERBOARD_TOP_N,
+        default=0,
+        metavar='N',
+        help=f'构建分类排行榜：每个主分类评分最高、知名度最高的前 N 个 POI，全城和每个网格单元各一份 '
+             f'(默认 N={LEADERBOARD_TOP_N})'
+    )
+    
+    parser.add_argument(
+        '--travel-time',
+        nargs='?',
+        const='',
+        metavar='ANCHORS_JSON',
+        help='出行时间预计算：从同一 PBF 提取步行/骑行/驾车路网，计算每条 POI 从各锚点出发的出行时间；'
+             '锚点为 JSON 列表 (默认: 提取范围的中心和交通枢纽)'
+    )
+    
+    parser.add_argument(
+        '--travel-display-mode',
+        choices=TRAVEL_MODES,
+        default=TRAVEL_DISPLAY_MODE,
+        help=f'写入 poi.travel_time（详情页显示）的出行方式 (默认: {TRAVEL_DISPLAY_MODE})'
+    )
+    
+    parser.add_argument(
+        '--travel-max-minutes',
+        type=float,
+        default=TRAVEL_MAX_MINUTES,
+        metavar='MIN',
+        help=f'出行时间上限，超过的 POI 不写入 (默认: {TRAVEL_MAX_MINUTES})'
+    )
+    
+    parser.add_argument(
+        '--size-profile',
+        choices=SIZE_PROFILES,
+        default='default',
+        help='输出规格：default（完整，可增量更新）或 compact（随应用分发的精简数据库：'
+             '分类 ID 化、只保留应用读取的列和索引、精简 FTS、VACUUM）'
+    )
+    
+    parser.add_argument(
+        '--shard',
+        choices=SHARD_MODES,
+        help='空间分片：-o 为输出目录，按瓦片写出多个数据库和 manifest.json；'
+             'fixed 为固定级别瓦片，quadtree 按 POI 密度自适应四分'
+    )
+    
+    parser.add_argument(
+        '--shard-level',
+        type=int,
+        default=SHARD_DEFAULT_LEVEL,
+        help=f'fixed 分片的瓦片级别（经纬度各 2^N 等分，默认 {SHARD_DEFAULT_LEVEL}）'
+    )
+    
+    parser.add_argument(
+        '--shard-max-pois',
+        type=int,
+        default=SHARD_DEFAULT_MAX_POIS,
+        help=f'quadtree 分片每个瓦片的 POI 上限（默认 {SHARD_DEFAULT_MAX_POIS}）'
+    )
+    
+    parser.add_argument(
+        '--cities',
+        metavar='FILE',
+        help='多城市提取：城市范围 JSON 文件 {名称: {"bbox": [...]} / {"polygon": [...]} / '
+             '{"geometry": GeoJSON}}；-o 为输出目录，一次读取输入文件写出每个城市的 <名称>_poi.db'
+    )
+    
+    parser.add_argument(
+        '--city',
+        action='append',
+        metavar='NAME=BBOX',
+        help='多城市提取：以 "名称=min_lon,min_lat,max_lon,max_lat" 指定一个城市，可重复使用，'
+             '可与 --cities 同时使用'
+    )
+    
+    parser.add_argument(
+        '--pack',
+        action='store_true',
+        help='另外输出只读的二进制 POI 包（<输出文件去掉扩展名>.pack）：定长记录按网格排序，'
+             '可直接 mmap 查询范围和最近点（见 poi_query.PoiPack）'
+    )
+    
+    parser.add_argument(
+        '--spatial-sort',
+        action='store_true',
+        help='按 Hilbert 曲线序号重排记录，空间相邻的 POI 存储在相邻数据页中'
+    )
+    
+    parser.add_argument(
+        '--index',
+        default='flex_mem',
+        help='节点坐标索引类型 (默认: flex_mem)，大区域可用 sparse_file_array / dense_file_array '
+             '/ dense_mmap_array，文件型索引可写作 "sparse_file_array,/path/to/file"'
+    )
+    
+    parser.add_argument(
+        '--two-pass',
+        action='store_true',
+        help='两遍扫描：只为 POI 路径引用的节点缓存坐标，降低内存占用'
+    )
+    
+    parser.add_argument(
+        '-u', '--update',
+        nargs='+',
+        metavar='CHANGE_FILE',
+        help='增量更新模式：将 .osc/.osc.gz 变更文件按顺序应用到已有的输出数据库'
+    )
+    
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help='批量导入模式：单事务写入，索引、R-Tree 和 FTS 在最后一次性构建'
+    )
+    
+    parser.add_argument(
+        '--pipeline',
+        type=int,
+        nargs='?',
+        const=PIPELINE_DEPTH,
+        default=0,
+        metavar='DEPTH',
+        help=f'流水线写入：解析与 SQLite 写入在不同线程中同时进行，最多 DEPTH 批在队列中等待 '
+             f'(默认 {PIPELINE_DEPTH})'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='',
+        metavar='JSONL',
+        help='运行剖析：记录各回调的调用次数和耗时、SQLite 耗时、峰值内存和写入速度，'
+             '进度和汇总写入 JSON Lines 文件 (默认: <输出文件>.profile.jsonl)'
+    )
+    
+    parser.add_argument(
+        '--profile-dump',
+        choices=('cprofile', 'tracemalloc'),
+        help='额外保存 cProfile 统计 (<输出文件>.prof) 或 tracemalloc 内存分配排行 '
+             '(<输出文件>.tracemalloc.txt)'
+    )
+    
     parser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -738,69 +3927,220 @@ def main():
     
     args = parser.parse_args()
     
+    if args.update:
+        run_update(args)
+        return
+    
     # 检查输入文件
+    if not args.input:
+        parser.error('需要指定 --input（或使用 --update 增量更新）')
     if not os.path.exists(args.input):
         print(f"错误: 输入文件不存在: {args.input}")
         sys.exit(1)
     
+    # 加载分类规则
+    try:
+        rules = CategoryRules.load(args.categories)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法加载分类规则 {args.categories}: {e}")
+        sys.exit(1)
+    set_category_rules(rules)
+    
+    if args.pack and args.shard:
+        parser.error('--pack 不能与 --shard 同时使用')
+    
+    # 多城市模式下 -o 为输出目录，每个城市一个数据库
+    cities = None
+    if args.cities or args.city:
+        if args.shard:
+            parser.error('--cities / --city 不能与 --shard 同时使用')
+        try:
+            cities = load_cities(args.cities, args.city or [])
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法加载城市范围: {e}")
+            sys.exit(1)
+        os.makedirs(args.output, exist_ok=True)
+        city_paths = {city.name: os.path.join(args.output, f'{city.name}_poi.db') for city in cities}
+    
+    travel_anchors = None
+    if args.travel_time is not None:
+        try:
+            travel_anchors = load_travel_anchors(args.travel_time)
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法加载出行时间锚点: {e}")
+            sys.exit(1)
+    
+    # 分片模式下 -o 为输出目录，完整数据库先写到目录中，拆分后删除
+    shard_dir = None
+    if args.shard:
+        shard_dir = args.output
+        os.makedirs(shard_dir, exist_ok=True)
+        args.output = os.path.join(shard_dir, SHARD_STAGING_DB)
+    
+    # 校验坐标索引
+    try:
+        index_dir = args.output if cities else os.path.dirname(os.path.abspath(args.output))
+        idx, idx_tmp = resolve_location_index(args.index, index_dir)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    
     print("=" * 60)
     print("POI 提取工具")
     print("=" * 60)
     print(f"输入文件: {args.input}")
-    print(f"输出文件: {args.output}")
+    if cities:
+        print(f"输出目录: {args.output} ({len(cities)} 个城市: {', '.join(city_paths)})")
+    else:
+        print(f"输出文件: {args.output}")
+    print(f"分类规则: {args.categories} ({len(rules.categories)} 条)")
+    print(f"坐标索引: {idx}{' (两遍扫描)' if args.two_pass else ''}")
     print()
     
+    # 运行剖析
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler(args.profile or f'{args.output}.profile.jsonl')
+        print(f"运行剖析: {profiler.path}")
+    if args.profile_dump == 'tracemalloc':
+        tracemalloc.start()
+    elif args.profile_dump == 'cprofile':
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    
     # 第一步：创建数据库（先创建，以便流式写入）
     print(">>> 步骤 1/4: 创建数据库...")
-    conn = create_database(args.output)
-    print("  数据库创建完成")
+    
+    def open_writer(path: str):
+        conn = create_database(path, bulk=args.bulk, fts_tokenizer=args.fts_tokenizer)
+        if args.pipeline:
+            conn.close()
+            return PipelinedWriter(path, bulk=args.bulk, spatial_sort=args.spatial_sort,
+                                   depth=args.pipeline, profiler=profiler)
+        return PoiWriter(conn, bulk=args.bulk, spatial_sort=args.spatial_sort)
+    
+    if cities:
+        writers = {name: open_writer(path) for name, path in city_paths.items()}
+        writer = CityRouter(cities, writers)
+        outputs = [(city, writers[city.name], city_paths[city.name]) for city in cities]
+    else:
+        writer = open_writer(args.output)
+        outputs = [(None, writer, args.output)]
+    print(f"  数据库创建完成{'（流水线写入）' if args.pipeline else ''}")
     
     # 第二步：解析 OSM 数据并流式写入
     print("\n>>> 步骤 2/4: 解析 OSM 数据...")
-    handler = POIHandler(db_conn=conn)
-    handler.apply_file(args.input, locations=True)
+    start = time.perf_counter()
+    try:
+        if args.workers > 1:
+            # 并行模式下回调在子进程中执行，只剖析主进程的写入
+            if profiler:
+                profiler.instrument(None, writer, pipelined=bool(args.pipeline))
+            stats = extract_parallel(writer, args.input, args.workers, rules,
+                                     idx=idx, two_pass=args.two_pass)
+        else:
+            handler = POIHandler(writer=writer)
+            if profiler:
+                profiler.instrument(handler, writer, pipelined=bool(args.pipeline))
+            handler.extract_file(args.input, idx=idx, two_pass=args.two_pass)
+            
+            # 写入剩余的 POI
+            writer.write(handler.pois)
+            
+            stats = {
+                'node_count': handler.node_count,
+                'way_count': handler.way_count,
+                'relation_count': handler.relation_count,
+                'poi_count': handler.poi_count,
+            }
+        
+        parse_seconds = time.perf_counter() - start
+        
+        # 路网只提取一次，多城市模式下各城市共用
+        road_graphs = None
+        if travel_anchors:
+            print("  提取路网 (出行时间预计算)...")
+            road_start = time.perf_counter()
+            road_graphs, road_ways = extract_road_graphs(args.input, idx)
+            print(f"    - 道路路径: {road_ways}")
+            for mode, graph in road_graphs.items():
+                print(f"    - {mode}: {graph.node_count} 个节点 (最大连通分量 {graph.main_node_count}), "
+                      f"{graph.edge_count} 条有向边, "
+                      f"CSR {graph.nbytes / 1024 / 1024:.1f} MB")
+            print(f"    - 耗时 {time.perf_counter() - road_start:.1f} 秒")
+            if profiler:
+                profiler.stage('road_graph', time.perf_counter() - road_start)
+    finally:
+        if idx_tmp and os.path.exists(idx_tmp):
+            os.remove(idx_tmp)
     
-    # 写入剩余的 POI
-    if handler.pois:
-        insert_pois(conn, handler.pois)
+    if profiler:
+        profiler.stage('parse', parse_seconds)
     
     print(f"  处理完成:")
-    print(f"    - 节点数: {handler.node_count}")
-    print(f"    - 路径数: {handler.way_count}")
-    print(f"    - 关系数: {handler.relation_count}")
-    print(f"    - 提取 POI: {handler.poi_count}")
+    print(f"    - 候选节点数: {stats['node_count']}")
+    print(f"    - 候选路径数: {stats['way_count']}")
+    print(f"    - 候选关系数: {stats['relation_count']}")
+    print(f"    - 提取 POI: {stats['poi_count']}")
+    print(f"    - 峰值内存 (RSS): {peak_rss_mb():.1f} MB")
+    if cities:
+        for city in cities:
+            print(f"    - {city.name}: {writer.writers[city.name].count} 条")
+        print(f"    - 不在任何城市范围内: {writer.unmatched} 条")
     
-    if handler.poi_count == 0:
+    if stats['poi_count'] == 0:
         print("\n警告: 未提取到任何 POI 数据")
-        conn.close()
+        writer.finish()
+        for _, output_writer, _ in outputs:
+            output_writer.conn.close()
         sys.exit(0)
     
-    # 第三步：跳过（数据已流式写入）
-    print("\n>>> 步骤 3/4: 数据已流式写入...")
-    
-    # 统计实际插入数量
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM poi')
-    inserted = cursor.fetchone()[0]
-    print(f"  共插入: {inserted} 条记录")
-    
-    # 第四步：更新统计和元数据
-    print("\n>>> 步骤 4/4: 更新统计信息...")
-    update_category_stats(conn)
-    update_metadata(conn, args.input, inserted)
-    print("  统计信息更新完成")
+    # 第三步：结束写入（批量模式下在此构建索引）
+    print("\n>>> 步骤 3/4: 完成数据写入...")
+    start = time.perf_counter()
+    writer.finish()
+    print(f"  耗时 {time.perf_counter() - start:.1f} 秒")
+    if profiler:
+        profiler.stage('finish', time.perf_counter() - start)
     
-    # 显示统计
-    print_stats(conn)
+    for city, output_writer, path in outputs:
+        if city:
+            print(f"\n>>> 城市 {city.name}: {path}")
+        finalize_database(output_writer.conn, path, args, profiler, city, road_graphs, travel_anchors)
     
-    # 关闭数据库
-    conn.close()
+    if shard_dir:
+        print(f"\n>>> 按瓦片拆分 ({args.shard})...")
+        start = time.perf_counter()
+        conn = sqlite3.connect(args.output)
+        points = conn.execute('SELECT id, lat, lon FROM poi').fetchall()
+        conn.close()
+        tiles = plan_shards(points, args.shard, args.shard_level, args.shard_max_pois)
+        entries = write_shards(args.output, shard_dir, tiles, args.input,
+                               args.suggest, args.suggest_top, args.size_profile, args.leaderboard)
+        os.remove(args.output)
+        manifest = write_manifest(shard_dir, entries, args.shard, args.shard_level,
+                                  args.shard_max_pois, args.input, args.size_profile)
+        counts = [entry['poi_count'] for entry in entries]
+        print(f"  {len(entries)} 个分片, 每片 {min(counts)}~{max(counts)} 条 POI, "
+              f"合计 {sum(entry['size'] for entry in entries) / 1024 / 1024:.2f} MB, "
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+        print(f"  清单: {manifest}")
+        if profiler:
+            profiler.stage('shard', time.perf_counter() - start)
+        args.output = shard_dir
     
-    # 显示文件大小
-    db_size = os.path.getsize(args.output)
-    db_size_mb = db_size / (1024 * 1024)
+    if profiler:
+        print_profile(profiler.summary())
+        profiler.close()
+        print(f"\n  剖析记录: {profiler.path}")
+    if args.profile_dump == 'cprofile':
+        cprofiler.disable()
+        cprofiler.dump_stats(f'{args.output}.prof')
+        print(f"  cProfile 统计: {args.output}.prof（python3 -m pstats 查看）")
+    elif args.profile_dump == 'tracemalloc':
+        dump_tracemalloc(f'{args.output}.tracemalloc.txt')
+        print(f"  内存分配排行: {args.output}.tracemalloc.txt")
     
-    print(f"\n数据库文件大小: {db_size_mb:.2f} MB")
     print(f"\n✅ POI 数据库生成完成: {args.output}")
 
 
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成 OSM PBF 生成器
+用 pyosmium 写出指定规模和标签构成的 PBF 文件，供基准测试离线使用（无需下载数据）
+
+生成内容：
+- 节点：随机分布在 bbox 内，按比例带 POI 标签（取自分类规则，名称随机生成）或无关标签
+- 路径：每条路径使用自己的一圈节点（封闭多边形），按比例为 POI 面（公园、商场等）或道路/建筑
+- 关系：multipolygon 关系，外环引用已生成的封闭路径，带 POI 标签
+- 路网（--road-grid N，可选）：N × N 条等距街道，交叉口共用节点，供出行时间预计算测试
+
+--duplicates 改为写出固定的小数据集（DUPLICATE_FIXTURE），含已知的重复 POI、评分和知名度标签，
+供 bench_extract.py --check-stats 按预期值校验去重、分类统计、密度直方图和排行榜。
+
+使用方法：
+    python3 make_synthetic_pbf.py -o temp/synthetic.osm.pbf
+    python3 make_synthetic_pbf.py -o temp/large.osm.pbf --nodes 2000000 --ways 200000 --relations 2000
+    python3 make_synthetic_pbf.py -o temp/mix.osm.pbf --tag-mix my_mix.json
+    python3 make_synthetic_pbf.py -o temp/roads.osm.pbf --road-grid 300
+    python3 make_synthetic_pbf.py -o temp/duplicates.osm.pbf --duplicates
+
+标签构成文件（--tag-mix）格式：
+    {"node": [[权重, {"amenity": "restaurant"}], ...], "way": [...], "relation": [...]}
+值为 "{name}" 的标签会替换为随机生成的中文名称。
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+import osmium
+
+from extract_poi import DEFAULT_CATEGORIES_FILE, CategoryRules
+
+# 武汉主城区附近
+DEFAULT_BBOX = (114.10, 30.45, 114.50, 30.75)
+
+NAME_SYLLABLES = '汉口江滩黄鹤楼光谷街道口楚河汉街中南武昌青山洪山江岸江汉硚口东湖沙湖南湖晴川龟山珞珈'
+NAME_SUFFIXES = ('店', '中心', '广场', '大厦', '公园', '酒店', '超市', '医院', '学校', '银行', '站')
+
+# 无关对象的标签（会被关键字过滤器跳过）
+NOISE_NODE_TAGS = [
+    (4, {'highway': 'crossing'}),
+    (3, {'barrier': 'gate'}),
+    (3, {'natural': 'tree'}),
+    (2, {'power': 'tower', 'ref': '12'}),
+    (1, {'amenity': 'bench'}),
+]
+NOISE_WAY_TAGS = [
+    (5, {'highway': 'residential', 'name': '{name}路'}),
+    (3, {'building': 'yes'}),
+    (2, {'highway': 'footway'}),
+    (1, {'landuse': 'farmland'}),
+]
+POI_WAY_TAGS = [
+    (3, {'leisure': 'park', 'name': '{name}'}),
+    (2, {'shop': 'mall', 'name': '{name}'}),
+    (2, {'amenity': 'school', 'name': '{name}'}),
+    (1, {'amenity': 'hospital', 'name': '{name}', 'phone': '027-12345678'}),
+    (1, {'building': 'office', 'name': '{name}'}),
+]
+POI_RELATION_TAGS = [
+    (2, {'type': 'multipolygon', 'amenity': 'university', 'name': '{name}'}),
+    (2, {'type': 'multipolygon', 'leisure': 'park', 'name': '{name}'}),
+    (1, {'type': 'multipolygon', 'landuse': 'residential', 'name': '{name}'}),
+]
+
+
+def road_grid_tags(i: int) -> Dict[str, str]:
+    """
+    第 i 条街道的标签：每 8 条一条主干道、每 4 条一条次干道，其余每 5 条一条步行道（机动车不可通行），
+    剩下的支路中奇数条为单行道（方向交替）
+    """
+    if i % 8 == 0:
+        return {'highway': 'primary'}
+    if i % 4 == 0:
+        return {'highway': 'secondary'}
+    if i % 5 == 0:
+        return {'highway': 'footway'}
+    tags = {'highway': 'residential'}
+    if i % 2:
+        tags['oneway'] = 'yes' if i % 4 == 1 else '-1'
+    return tags
+
+
+def default_tag_mix(categories_file: str = DEFAULT_CATEGORIES_FILE) -> Dict[str, List]:
+    """
+    默认标签构成：POI 节点取自分类规则（通配符规则取一个常见值），附带地址、电话等标签
+    """
+    rules = CategoryRules.load(categories_file)
+    poi_nodes = []
+    for rule in rules.categories:
+        key, value = rule.split('=', 1)
+        if value == CategoryRules.WILDCARD:
+            value = 'yes'
+        tags = {key: value, 'name': '{name}'}
+        poi_nodes.append((1, tags))
+        poi_nodes.append((1, {**tags, 'addr:street': '{name}路', 'addr:housenumber': '8',
+                              'opening_hours': 'Mo-Su 09:00-21:00'}))
+    return {'node': poi_nodes, 'way': POI_WAY_TAGS, 'relation': POI_RELATION_TAGS}
+
+# 去重校验数据集：(lon, lat, tags)，节点 ID 按顺序从 1 开始。
+# 两个位置 A（114.30, 30.55）和 B（114.45, 30.55）分属不同的 1/8 度和 1/32 度单元。
+# 默认半径 50 米下应合并 2 组、删除 3 条：
+#   - 黄鹤楼餐厅 ×3（相距 11~20 米，第三条名称带全角空格），保留已填字段最多的第一条，
+#     website 从第三条补全
+#   - 光谷银行 ×2（相距约 29 米）
+# 以下不应合并：相距 100 米的江滩咖啡、同名不同主分类的东湖（公园 / 餐厅）、
+# 位置 B 与位置 A 同名的光谷银行
+DUPLICATE_FIXTURE = [
+    (114.3000, 30.5500, {'amenity': 'restaurant', 'name': '黄鹤楼餐厅', 'stars': '4.5',
+                         'phone': '027-88888888', 'opening_hours': 'Mo-Su 10:00-22:00'}),
+    (114.3001, 30.5501, {'amenity': 'restaurant', 'name': '黄鹤楼餐厅'}),
+    (114.3000, 30.5502, {'amenity': 'restaurant', 'name': '黄鹤楼\u3000餐厅', 'website': 'https://example.com'}),
+    (114.3005, 30.5500, {'amenity': 'bank', 'name': '光谷银行'}),
+    (114.3008, 30.5500, {'amenity': 'bank', 'name': '光谷银行'}),
+    (114.3020, 30.5500, {'amenity': 'cafe', 'name': '江滩咖啡'}),
+    (114.3020, 30.5509, {'amenity': 'cafe', 'name': '江滩咖啡'}),
+    (114.3030, 30.5510, {'leisure': 'park', 'name': '东湖'}),
+    (114.3030, 30.5510, {'amenity': 'restaurant', 'name': '东湖'}),
+    (114.3040, 30.5520, {'amenity': 'restaurant', 'name': '楚河餐厅', 'stars': '3'}),
+    (114.3050, 30.5530, {'amenity': 'restaurant', 'name': '汉街餐厅', 'stars': '5', 'brand': '汉街'}),
+    (114.4500, 30.5500, {'amenity': 'bank', 'name': '光谷银行'}),
+    (114.4510, 30.5510, {'amenity': 'restaurant', 'name': '珞珈餐厅', 'stars': '4', 'wikidata': 'Q1'}),
+    (114.4520, 30.5520, {'tourism': 'hotel', 'name': '沙湖酒店', 'stars': '2'}),
+]
+
+
+class TagPicker:
+    """按权重随机选择标签，替换 {name} 占位符"""
+
+    def __init__(self, rng: random.Random, choices: List):
+        self.rng = rng
+        self.tags = [dict(tags) for _, tags in choices]
+        self.weights = [weight for weight, _ in choices]
+
+    def random_name(self) -> str:
+        length = self.rng.randint(2, 4)
+        return ''.join(self.rng.choice(NAME_SYLLABLES) for _ in range(length)) + self.rng.choice(NAME_SUFFIXES)
+
+    def pick(self) -> Dict[str, str]:
+        tags = self.rng.choices(self.tags, self.weights)[0]
+        if any('{name}' in value for value in tags.values()):
+            name = self.random_name()
+            return {k: v.replace('{name}', name) for k, v in tags.items()}
+        return tags
+
+
+def generate(path: str, nodes: int = 200000, ways: int = 20000, relations: int = 200,
+             poi_ratio: float = 0.1, noise_ratio: float = 0.2, poi_way_ratio: float = 0.3,
+             bbox: Tuple[float, float, float, float] = DEFAULT_BBOX, seed: int = 1,
+             tag_mix: Optional[Dict[str, List]] = None, road_grid: int = 0) -> Dict[str, int]:
+    """
+    生成合成 PBF 文件
+
+    nodes 为独立节点数（路径节点另计），poi_ratio / noise_ratio 为带 POI 标签 / 无关标签的
+    节点比例，poi_way_ratio 为 POI 路径比例，road_grid 为路网每个方向的街道数（0 表示不生成）。
+    返回各类对象的数量
+    """
+    rng = random.Random(seed)
+    mix = tag_mix or default_tag_mix()
+    poi_node = TagPicker(rng, mix['node'])
+    poi_way = TagPicker(rng, mix.get('way', POI_WAY_TAGS))
+    poi_relation = TagPicker(rng, mix.get('relation', POI_RELATION_TAGS))
+    noise_node = TagPicker(rng, NOISE_NODE_TAGS)
+    noise_way = TagPicker(rng, NOISE_WAY_TAGS)
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    counts = {'nodes': 0, 'ways': 0, 'relations': 0, 'poi_nodes': 0, 'poi_ways': 0, 'roads': 0}
+
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        # 独立节点
+        for node_id in range(1, nodes + 1):
+            r = rng.random()
+            if r < poi_ratio:
+                tags = poi_node.pick()
+                counts['poi_nodes'] += 1
+            elif r < poi_ratio + noise_ratio:
+                tags = noise_node.pick()
+            else:
+                tags = {}
+            location = (rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat))
+            writer.add_node(osmium.osm.mutable.Node(id=node_id, location=location, tags=tags))
+
+        # 路径节点：每条路径一圈 4~8 个节点
+        rings = []
+        node_id = nodes
+        for _ in range(ways):
+            center_lon = rng.uniform(min_lon, max_lon)
+            center_lat = rng.uniform(min_lat, max_lat)
+            radius = rng.uniform(0.0002, 0.002)
+            size = rng.randint(4, 8)
+            ring = []
+            for i in range(size):
+                angle = 2 * math.pi * i / size
+                node_id += 1
+                location = (center_lon + radius * math.cos(angle), center_lat + radius * math.sin(angle))
+                writer.add_node(osmium.osm.mutable.Node(id=node_id, location=location))
+                ring.append(node_id)
+            rings.append(ring)
+
+        # 路网交叉口：第 r 行第 c 列的节点 ID 为 grid_base + r * road_grid + c + 1
+        grid_base = node_id
+        for r in range(road_grid):
+            lat = min_lat + (max_lat - min_lat) * r / max(road_grid - 1, 1)
+            for c in range(road_grid):
+                node_id += 1
+                lon = min_lon + (max_lon - min_lon) * c / max(road_grid - 1, 1)
+                writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(lon, lat)))
+        counts['nodes'] = node_id
+
+        # 路径（封闭）
+        for way_id, ring in enumerate(rings, start=1):
+            if rng.random() < poi_way_ratio:
+                tags = poi_way.pick()
+                counts['poi_ways'] += 1
+            else:
+                tags = noise_way.pick()
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=ring + [ring[0]], tags=tags))
+        counts['ways'] = ways
+
+        # 路网街道：先东西向，再南北向
+        way_id = ways
+        for horizontal in (True, False):
+            for i in range(road_grid):
+                if horizontal:
+                    refs = [grid_base + i * road_grid + c + 1 for c in range(road_grid)]
+                else:
+                    refs = [grid_base + r * road_grid + i + 1 for r in range(road_grid)]
+                tags = dict(road_grid_tags(i), name=''.join(rng.choice(NAME_SYLLABLES) for _ in range(2)) + '路')
+                way_id += 1
+                writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=refs, tags=tags))
+                counts['roads'] += 1
+
+        # multipolygon 关系：外环引用随机路径
+        for relation_id in range(1, min(relations, ways) + 1):
+            members = [('w', rng.randint(1, ways), 'outer')]
+            writer.add_relation(osmium.osm.mutable.Relation(
+                id=relation_id, members=members, tags=poi_relation.pick()
+            ))
+            counts['relations'] += 1
+    finally:
+        writer.close()
+
+    return counts
+
+
+def generate_duplicates(path: str) -> Dict[str, int]:
+    """写出去重校验数据集 DUPLICATE_FIXTURE，返回节点数"""
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        for node_id, (lon, lat, tags) in enumerate(DUPLICATE_FIXTURE, start=1):
+            writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(lon, lat), tags=tags))
+    finally:
+        writer.close()
+    return {'nodes': len(DUPLICATE_FIXTURE)}
+
+
+def load_tag_mix(path: str) -> Dict[str, List]:
+    with open(path, encoding='utf-8') as f:
+        mix = json.load(f)
+    if 'node' not in mix:
+        raise ValueError('标签构成文件缺少 "node" 项')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成 OSM PBF 文件')
+    parser.add_argument('-o', '--output', required=True, help='输出 PBF 文件')
+    parser.add_argument('--nodes', type=int, default=200000, help='独立节点数 (默认: 200000)')
+    parser.add_argument('--ways', type=int, default=20000, help='路径数 (默认: 20000)')
+    parser.add_argument('--relations', type=int, default=200, help='multipolygon 关系数 (默认: 200)')
+    parser.add_argument('--poi-ratio', type=float, default=0.1, help='带 POI 标签的节点比例 (默认: 0.1)')
+    parser.add_argument('--noise-ratio', type=float, default=0.2, help='带无关标签的节点比例 (默认: 0.2)')
+    parser.add_argument('--poi-way-ratio', type=float, default=0.3, help='POI 路径比例 (默认: 0.3)')
+    parser.add_argument('--tag-mix', help='标签构成 JSON 文件（默认取自分类规则）')
+    parser.add_argument('--road-grid', type=int, default=0, metavar='N',
+                        help='生成 N × N 条街道的路网（默认: 0，不生成）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--duplicates', action='store_true',
+                        help='改为写出固定的去重校验数据集（忽略其他规模参数）')
+    args = parser.parse_args()
+
+    if args.duplicates:
+        counts = generate_duplicates(args.output)
+        print(f"已生成 {args.output}（去重校验数据集, {counts['nodes']} 个节点）")
+        return
+
+    tag_mix = load_tag_mix(args.tag_mix) if args.tag_mix else None
+    counts = generate(args.output, args.nodes, args.ways, args.relations, args.poi_ratio,
+                      args.noise_ratio, args.poi_way_ratio, seed=args.seed, tag_mix=tag_mix,
+                      road_grid=args.road_grid)
+
+    size_mb = os.path.getsize(args.output) / 1024 / 1024
+    print(f"已生成 {args.output} ({size_mb:.1f} MB)")
+    print(f"  节点: {counts['nodes']} (POI {counts['poi_nodes']}), "
+          f"路径: {counts['ways']} (POI {counts['poi_ways']}), 关系: {counts['relations']}"
+          + (f", 街道: {counts['roads']}" if counts['roads'] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+POI 数据库查询库
+extract_poi.py 生成的 *_poi.db 的参考查询实现（与应用 OfflineSearchService 的行为对应），
+供构建服务器上的离线批处理和查询性能测量使用
+
+功能：
+- 关键词搜索（FTS5，bigram 索引时使用二元组短语查询，否则不足时用 LIKE 补充）
+- 附近搜索（网格覆盖索引，旧数据库用 R-Tree）
+- 分类搜索
+- k 近邻搜索（逐圈扩大搜索半径，每圈只读取新增的环形范围，网格覆盖索引优先，旧数据库用 R-Tree；
+  有密度直方图时按密度估算初始半径）
+- 范围内各分类数量（密度直方图，用于筛选项计数）
+- 分类排行（--leaderboard 生成的排行榜：评分 / 知名度前 N 名，全城或中心点所在网格单元）
+- 分片数据库（--shard 输出目录）：只打开与查询范围相交的分片
+- 二进制 POI 包（--pack 输出）：mmap 后直接按网格目录查询附近和 k 近邻，不支持关键词搜索
+
+只读连接放在连接池中复用，SQL 文本固定、参数绑定，由连接的语句缓存复用预编译语句。
+
+使用方法：
+    python3 poi_query.py --db map_data/wuhan_poi.db keyword 江滩
+    python3 poi_query.py --db map_data/wuhan_poi.db nearby 30.5928 114.3055 --radius 1000
+    python3 poi_query.py --db map_data/wuhan_poi.db category 餐饮 --center 30.5928 114.3055
+    python3 poi_query.py --db map_data/wuhan_poi.db knn 30.5928 114.3055 -k 5
+    python3 poi_query.py --db map_data/wuhan_poi.db top 餐饮 --by rating --center 30.5928 114.3055
+    python3 poi_query.py --db map_data/wuhan_poi.db counts 30.55 30.62 114.25 114.35
+    python3 poi_query.py --db map_data/hubei_poi knn 30.5928 114.3055 -k 5   # 分片目录
+    python3 poi_query.py --db map_data/wuhan_poi.pack nearby 30.5928 114.3055   # 二进制包
+
+    from poi_query import PoiDatabase
+    with PoiDatabase('wuhan_poi.db') as db:
+        for poi in db.knn(30.5928, 114.3055, k=5):
+            print(poi.name, poi.distance)
+"""
+
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import queue
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar,
+)
+
+from extract_poi import (
+    GRID_COLUMNS, GRID_LEVELS, GRID_MAX_ROWS, LEADERBOARD_CITY, LEADERBOARD_LEVEL, LEADERBOARD_METRICS,
+    METERS_PER_DEGREE, PACK_COORD_SCALE, PACK_HEADER, PACK_MAGIC, PACK_NO_RATING, PACK_NONE, PACK_RECORD,
+    PACK_VERSION, SHARD_MANIFEST, cjk_fts_query, decode_tags, file_sha256, grid_cell_ranges, grid_nearby_sql,
+    load_tag_keys,
+)
+
+EARTH_RADIUS = 6371000.0
+
+DEFAULT_LIMIT = 20
+DEFAULT_RADIUS_METERS = 5000.0
+MAX_RADIUS_METERS = 50000.0
+
+# k 近邻搜索的初始半径（没有密度直方图时）
+KNN_START_RADIUS = 250.0
+
+# 按密度直方图估算半径时从中心单元向外最多扩 DENSITY_BLOCK 格（5 × 5 个单元），
+# 估算值乘以 KNN_RADIUS_MARGIN，使第一圈通常就能找到 k 个
+DENSITY_BLOCK = 2
+KNN_RADIUS_MARGIN = 1.3
+
+# R-Tree 以 float32 存储坐标，查询矩形向外扩展以免边界点被舍入排除
+RTREE_EPSILON = 1e-5
+
+# 查询返回的列（与 OfflineSearchService 读取的列一致，均包含在网格覆盖索引中）
+POI_SELECT = ('id', 'name', 'main_category', 'lat', 'lon', 'address', 'phone',
+              'opening_hours', 'description', 'travel_time', 'rating')
+_CATEGORY_IDX = POI_SELECT.index('main_category')
+_LAT_IDX = POI_SELECT.index('lat')
+_LON_IDX = POI_SELECT.index('lon')
+
+
+class Poi(NamedTuple):
+    """查询结果"""
+    id: int
+    name: str
+    main_category: str
+    lat: float
+    lon: float
+    address: Optional[str]
+    phone: Optional[str]
+    opening_hours: Optional[str]
+    description: Optional[str]
+    travel_time: Optional[str]
+    rating: Optional[float]
+    distance: Optional[float] = None
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine 距离（米）"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat: float, lon: float, radius: float) -> Tuple[float, float, float, float]:
+    """半径对应的经纬度矩形 (min_lat, max_lat, min_lon, max_lon)"""
+    lat_range = math.degrees(radius / EARTH_RADIUS)
+    lon_range = math.degrees(radius / (EARTH_RADIUS * math.cos(math.radians(lat))))
+    return lat - lat_range, lat + lat_range, lon - lon_range, lon + lon_range
+
+
+def in_box(lat: float, lon: float, box: Tuple[float, float, float, float]) -> bool:
+    """点是否在矩形 (min_lat, max_lat, min_lon, max_lon) 内（含边界）"""
+    return box[0] <= lat <= box[1] and box[2] <= lon <= box[3]
+
+
+def ring_boxes(box: Tuple[float, float, float, float],
+               prev_box: Optional[Tuple[float, float, float, float]]) -> List[Tuple[float, float, float, float]]:
+    """box 去掉其中的 prev_box 后剩下的环形，拆成南、北、西、东四个矩形（prev_box 为 None 时为 box 本身）"""
+    if prev_box is None:
+        return [box]
+    min_lat, max_lat, min_lon, max_lon = box
+    inner_min_lat, inner_max_lat, inner_min_lon, inner_max_lon = prev_box
+    return [
+        (min_lat, inner_min_lat, min_lon, max_lon),
+        (inner_max_lat, max_lat, min_lon, max_lon),
+        (inner_min_lat, inner_max_lat, min_lon, inner_min_lon),
+        (inner_min_lat, inner_max_lat, inner_max_lon, max_lon),
+    ]
+
+
+def ring_cell_ranges(box: Tuple[float, float, float, float],
+                     prev_box: Optional[Tuple[float, float, float, float]]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    box 去掉其中的 prev_box 后剩下的环形对应的网格单元编号区间（格式同 grid_cell_ranges）
+
+    完全落在 prev_box 内的单元上一圈已经读过，从每行的区间中挖掉，这些行拆成左右两段；
+    与 prev_box 边界相交的单元仍然读取，由调用方按坐标跳过 prev_box 内的行
+    """
+    column, ranges = grid_cell_ranges(*box)
+    if prev_box is None:
+        return column, ranges
+
+    n = 1 << GRID_LEVELS[GRID_COLUMNS.index(column)]
+    per_row = 360 * n
+    # 完全在 prev_box 内的行列（两端各让出一格，边界上的浮点误差只会多读不会漏读）
+    inner_row0 = int((prev_box[0] + 90.0) * n) + 1
+    inner_row1 = int((prev_box[1] + 90.0) * n) - 1
+    inner_col0 = int((prev_box[2] + 180.0) * n) + 1
+    inner_col1 = int((prev_box[3] + 180.0) * n) - 1
+    if inner_row0 > inner_row1 or inner_col0 > inner_col1:
+        return column, ranges
+
+    result = []
+    for lo, hi in ranges:
+        row = lo // per_row
+        if not inner_row0 <= row <= inner_row1:
+            result.append((lo, hi))
+            continue
+        start = row * per_row
+        if lo < start + inner_col0:
+            result.append((lo, start + inner_col0 - 1))
+        if hi > start + inner_col1:
+            result.append((start + inner_col1 + 1, hi))
+    return column, result
+
+
+_Hit = TypeVar('_Hit')
+
+
+def knn_rings(fetch: Callable[[Tuple[float, float, float, float], Optional[Tuple[float, float, float, float]]],
+                              List[Tuple[float, _Hit]]],
+              lat: float, lon: float, k: int, radius: float, max_radius: float) -> List[Tuple[float, _Hit]]:
+    """
+    k 近邻的逐圈扩大，返回按距离排序的前 k 个 (距离, 记录)
+
+    fetch(box, prev_box) 返回矩形 box 内、上一圈矩形 prev_box 外（第一圈 prev_box 为 None）的
+    (距离, 记录)，每圈只读取新增的范围，超出当前半径的候选留到下一圈。半径圈内已有 k 个点时
+    圈外的点不可能更近，结果即为精确的前 k 个；不足时按已找到点的密度估算所需半径，至少扩大
+    一倍，达到 max_radius 仍不足 k 个时返回已找到的点
+    """
+    radius = min(radius, max_radius)
+    candidates: List[Tuple[float, _Hit]] = []
+    prev_box = None
+    while True:
+        box = bounding_box(lat, lon, radius)
+        candidates += fetch(box, prev_box)
+        found = [hit for hit in candidates if hit[0] <= radius]
+        if len(found) >= k or radius >= max_radius:
+            return heapq.nsmallest(k, found, key=lambda hit: hit[0])
+
+        # 按面积估算：点数与半径平方成正比
+        growth = math.sqrt(k / len(found)) * 1.2 if found else 4.0
+        radius = min(radius * max(growth, 2.0), max_radius)
+        prev_box = box
+
+
+def density_radius(lat: float, lon: float, k: int, levels: Sequence[int],
+                   cell_count: Callable[[int, int, int, int], int]) -> float:
+    """
+    按网格计数估算以 (lat, lon) 为中心、包含约 k 个 POI 的半径（米），作为 k 近邻的初始半径
+
+    levels 为从粗到细的网格级别，cell_count(level, row, col0, col1) 返回该级别第 row 行
+    col0..col1 单元内的 POI 数。从最细一级的中心单元开始，逐圈扩大到 5 × 5 个单元，再换更粗
+    一级，第一个 POI 数达到 k 的范围按平均密度换算半径，且不小于此前不足 k 个的范围的内切圆半径
+    （中心点附近是江面、湖面等空白区域时平均密度会严重低估半径）；最粗一级仍不足 k 个时
+    返回 MAX_RADIUS_METERS
+    """
+    scale = math.cos(math.radians(lat))
+    lower = 0.0
+    for level in reversed(levels):
+        n = 1 << level
+        row, col = int((lat + 90.0) * n), int((lon + 180.0) * n)
+        for b in range(DENSITY_BLOCK + 1):
+            total = sum(cell_count(level, r, col - b, col + b) for r in range(row - b, row + b + 1))
+            if total >= k:
+                side = (2 * b + 1) / n * METERS_PER_DEGREE
+                radius = math.sqrt(k * side * side * scale / (math.pi * total)) * KNN_RADIUS_MARGIN
+                return max(radius, lower)
+            # 不足 k 个：以中心点为圆心、在该范围内的圆里也不足 k 个，第 k 近的点一定更远
+            lower = max(lower, min(
+                (lat + 90.0) * n - (row - b), row + b + 1 - (lat + 90.0) * n,
+                ((lon + 180.0) * n - (col - b)) * scale, (col + b + 1 - (lon + 180.0) * n) * scale,
+            ) / n * METERS_PER_DEGREE)
+    return MAX_RADIUS_METERS
+
+
+def leaderboard_cells(lat: float, lon: float,
+                      radius: float = 0.0) -> Tuple[List[int], Tuple[float, float, float, float]]:
+    """
+    覆盖中心点半径矩形的排行榜网格单元（radius 为 0 时只有中心点所在单元）
+
+    返回 (单元编号列表, 这些单元合起来的范围 (min_lat, max_lat, min_lon, max_lon))
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius) if radius > 0 else (lat, lat, lon, lon)
+    n = 1 << LEADERBOARD_LEVEL
+    row0, row1 = int((min_lat + 90.0) * n), int((max_lat + 90.0) * n)
+    col0, col1 = int((min_lon + 180.0) * n), int((max_lon + 180.0) * n)
+    cells = [row * 360 * n + col for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+    return cells, (row0 / n - 90.0, (row1 + 1) / n - 90.0, col0 / n - 180.0, (col1 + 1) / n - 180.0)
+
+
+class ConnectionPool:
+    """
+    只读 SQLite 连接池
+
+    连接按需创建，最多 size 个，归还后复用（各自保留语句缓存）；可跨线程使用
+    """
+
+    def __init__(self, path: str, size: int = 4, cached_statements: int = 256):
+        self.path = path
+        self.size = size
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f'file:{self.path}?mode=ro', uri=True,
+            check_same_thread=False, cached_statements=self.cached_statements
+        )
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个连接，用完自动归还"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+class PoiDatabase:
+    """
+    POI 数据库查询接口
+
+    打开时检测数据库特性（bigram 全文索引、网格单元列、精简输出），按可用的索引选择查询方式
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            fts = [row[1] for row in conn.execute('PRAGMA table_info(poi_fts)')]
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(poi)')}
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.tag_keys = load_tag_keys(conn)
+            metadata = dict(conn.execute('SELECT key, value FROM metadata'))
+            self.category_names = (dict(conn.execute('SELECT id, name FROM category_names'))
+                                   if 'category_names' in tables else {})
+
+        self.has_fts = bool(fts)
+        self.bigram = 'search_tokens' in fts
+        self.has_grid = set(GRID_COLUMNS) <= columns
+        self.has_rtree = 'poi_rtree' in tables
+        self.fts_phrase = metadata.get('fts_detail') != 'none'
+        self.leaderboard_top_n = int(metadata.get('leaderboard_top_n', 0))
+        self.has_travel_time = 'poi_travel_time' in tables
+        self.density_levels = (sorted(int(v) for v in metadata['density_levels'].split(','))
+                               if 'poi_density' in tables and metadata.get('density_levels') else [])
+
+        # 精简输出（--size-profile compact）中主分类以 category_names 的 ID 存储
+        self.category_ids = {name: category_id for category_id, name in self.category_names.items()}
+        self.category_column = 'main_category_id' if self.category_names else 'main_category'
+        columns = [self.category_column if col == 'main_category' else col for col in POI_SELECT]
+        self._select = ', '.join(columns)
+        self._p_select = ', '.join(f'p.{col}' for col in columns)
+
+    def __enter__(self) -> 'PoiDatabase':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    # ------------------------------------------------------------------
+    # 关键词搜索
+    # ------------------------------------------------------------------
+
+    def keyword(self, keyword: str, limit: int = DEFAULT_LIMIT,
+                center: Optional[Tuple[float, float]] = None) -> List[Poi]:
+        """
+        关键词搜索：先查 FTS，非 bigram 索引且结果不足时用 LIKE 补充；
+        给出 center 时按距离排序
+        """
+        keyword = keyword.strip()
+        if not keyword:
+            raise ValueError('关键词不能为空')
+
+        with self.pool.connection() as conn:
+            rows = self._keyword_fts(conn, keyword, limit * 2) if self.has_fts else []
+            if not self.bigram and len(rows) < limit:
+                seen = {row[0] for row in rows}
+                pattern = f'%{keyword}%'
+                for row in conn.execute(
+                    f'SELECT {self._select} FROM poi WHERE name LIKE ? OR address LIKE ? LIMIT ?',
+                    (pattern, pattern, limit + len(seen))
+                ):
+                    if row[0] not in seen and len(rows) < limit:
+                        rows.append(row)
+
+        return self._finish(rows, center, limit)
+
+    def _keyword_fts(self, conn: sqlite3.Connection, keyword: str, limit: int) -> List[Tuple]:
+        query = cjk_fts_query(keyword, self.fts_phrase) if self.bigram else f'"{keyword}"*'
+        if not query:
+            return []
+        try:
+            return conn.execute(f'''
+                SELECT {self._p_select} FROM poi_fts f CROSS JOIN poi p ON p.id = f.rowid
+                WHERE poi_fts MATCH ? LIMIT ?
+            ''', (query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            # 关键词中含 FTS5 语法字符时退回 LIKE
+            return []
+
+    # ------------------------------------------------------------------
+    # 附近 / 分类 / k 近邻
+    # ------------------------------------------------------------------
+
+    def nearby(self, lat: float, lon: float, radius: float = DEFAULT_RADIUS_METERS,
+               category: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """半径范围内的 POI，按距离排序"""
+        radius = min(max(radius, 100.0), MAX_RADIUS_METERS)
+        with self.pool.connection() as conn:
+            rows = self._box_rows(conn, bounding_box(lat, lon, radius), category)
+        return self._within(rows, lat, lon, radius)[:limit]
+
+    def category(self, category: str, center: Optional[Tuple[float, float]] = None,
+                 limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """
+        分类搜索：给出 center 时返回该分类中距离最近的 limit 条（k 近邻），
+        否则按 ID 顺序返回
+        """
+        if center is not None:
+            return self.knn(center[0], center[1], limit, category=category)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {self._select} FROM poi WHERE {self.category_column} = ? LIMIT ?',
+                (self._category_arg(category), limit)
+            ).fetchall()
+        return [self._poi(row) for row in rows]
+
+    def knn(self, lat: float, lon: float, k: int = DEFAULT_LIMIT, category: Optional[str] = None,
+            max_radius: float = MAX_RADIUS_METERS) -> List[Poi]:
+        """
+        k 近邻搜索
+
+        初始半径由密度直方图估算（见 estimate_radius，没有直方图时为 KNN_START_RADIUS），
+        逐圈扩大见 knn_rings，每圈由 ring() 只读取新增的环形范围
+        """
+        radius = self.estimate_radius(lat, lon, k, category) or KNN_START_RADIUS
+        hits = knn_rings(lambda box, prev_box: self.ring(lat, lon, box, prev_box, category),
+                         lat, lon, k, radius, max_radius)
+        return [poi for _, poi in hits]
+
+    def ring(self, lat: float, lon: float, box: Tuple[float, float, float, float],
+             prev_box: Optional[Tuple[float, float, float, float]],
+             category: Optional[str] = None) -> List[Tuple[float, Poi]]:
+        """
+        矩形 box 内、prev_box 外的 POI 及其到 (lat, lon) 的距离（k 近邻每圈新增的范围）
+
+        有网格列时在网格覆盖索引上只扫描环形覆盖的单元（ring_cell_ranges），prev_box 内的行在
+        SQL 中跳过；分类过滤也在索引内完成，因此没有按请求改走 R-Tree（R-Tree 的每个候选都要
+        回表取分类，按分类的 k 近邻实测慢约 3.5 倍）。没有网格列的旧数据库把环形拆成四个矩形
+        （ring_boxes），各做一次 R-Tree 范围查询；都没有时扫描整个 box，按坐标跳过 prev_box 内的行
+        """
+        if category:
+            category = self._category_arg(category)
+        with self.pool.connection() as conn:
+            if self.has_grid:
+                column, ranges = ring_cell_ranges(box, prev_box)
+                rows = self._grid_rows(conn, column, ranges, category, exclude=prev_box)
+            elif self.has_rtree:
+                rows = self._rtree_rows(conn, ring_boxes(box, prev_box), category)
+            else:
+                rows = self._box_rows(conn, box, category, converted=True)
+        hits = []
+        for row in rows:
+            row_lat, row_lon = row[_LAT_IDX], row[_LON_IDX]
+            if in_box(row_lat, row_lon, box) and not (prev_box and in_box(row_lat, row_lon, prev_box)):
+                d = distance(lat, lon, row_lat, row_lon)
+                hits.append((d, self._poi(row, d)))
+        return hits
+
+    def estimate_radius(self, lat: float, lon: float, k: int,
+                        category: Optional[str] = None) -> Optional[float]:
+        """按密度直方图估算包含约 k 个 POI 的半径（米，见 density_radius），没有直方图时返回 None"""
+        if not self.density_levels:
+            return None
+        return density_radius(lat, lon, k, self.density_levels,
+                              lambda level, row, col0, col1: self.density_count(level, row, col0, col1, category))
+
+    def density_count(self, level: int, row: int, col0: int, col1: int, category: Optional[str] = None) -> int:
+        """密度直方图中 level 级第 row 行 col0..col1 单元的 POI 数（可按主分类过滤）"""
+        n = 1 << level
+        sql = 'SELECT SUM(count) FROM poi_density WHERE level = ? AND cell BETWEEN ? AND ?'
+        args = [level, row * 360 * n + col0, row * 360 * n + col1]
+        if category:
+            sql += f' AND {self.category_column} = ?'
+            args.append(self._category_arg(category))
+        with self.pool.connection() as conn:
+            return conn.execute(sql, args).fetchone()[0] or 0
+
+    def category_counts(self, box: Tuple[float, float, float, float]) -> Dict[str, int]:
+        """
+        矩形范围 (min_lat, max_lat, min_lon, max_lon) 内各主分类的 POI 数
+
+        有密度直方图时按与范围相交的单元统计（边缘单元整格计入，为近似值），选用覆盖范围
+        不超过 GRID_MAX_ROWS 行的最细一级；没有直方图时按坐标现场统计
+        """
+        min_lat, max_lat, min_lon, max_lon = box
+        with self.pool.connection() as conn:
+            if not self.density_levels:
+                rows = conn.execute(f'''
+                    SELECT {self.category_column}, COUNT(*) FROM poi
+                    WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+                    GROUP BY 1
+                ''', box).fetchall()
+            else:
+                for level in reversed(self.density_levels):
+                    n = 1 << level
+                    row0, row1 = int((min_lat + 90.0) * n), int((max_lat + 90.0) * n)
+                    if row1 - row0 < GRID_MAX_ROWS or level == self.density_levels[0]:
+                        break
+                col0, col1 = int((min_lon + 180.0) * n), int((max_lon + 180.0) * n)
+                rows = []
+                for r in range(row0, row1 + 1):
+                    rows += conn.execute(f'''
+                        SELECT {self.category_column}, SUM(count) FROM poi_density
+                        WHERE level = ? AND cell BETWEEN ? AND ?
+                        GROUP BY 1
+                    ''', (level, r * 360 * n + col0, r * 360 * n + col1)).fetchall()
+        counts = Counter()
+        for category, count in rows:
+            counts[self.category_names.get(category, category)] += count
+        return dict(counts)
+
+    def knn_batch(self, points: Iterable[Tuple[float, float]], k: int = DEFAULT_LIMIT,
+                  category: Optional[str] = None, threads: Optional[int] = None) -> List[List[Poi]]:
+        """
+        批量 k 近邻搜索（离线批处理用），结果与输入顺序一致
+
+        SQLite 执行查询时释放 GIL，多个线程各自从连接池借用连接
+        """
+        threads = threads or self.pool.size
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(lambda p: self.knn(p[0], p[1], k, category), points))
+
+    def get(self, poi_id: int) -> Optional[Poi]:
+        """按 ID 获取 POI"""
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT {self._select} FROM poi WHERE id = ?', (poi_id,)).fetchone()
+        return self._poi(row) if row else None
+
+    def get_many(self, ids: Sequence[int], center: Optional[Tuple[float, float]] = None) -> List[Poi]:
+        """按 ID 批量获取 POI，保持输入顺序；给出 center 时计算距离（不改变顺序）"""
+        if not ids:
+            return []
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {self._select} FROM poi WHERE id IN ({",".join("?" * len(ids))})', list(ids)
+            ).fetchall()
+        by_id = {row[0]: row for row in rows}
+        return [self._poi(by_id[poi_id], None if center is None else
+                          distance(center[0], center[1], by_id[poi_id][_LAT_IDX], by_id[poi_id][_LON_IDX]))
+                for poi_id in ids if poi_id in by_id]
+
+    # ------------------------------------------------------------------
+    # 分类排行
+    # ------------------------------------------------------------------
+
+    def top(self, category: str, by: str = 'rating', center: Optional[Tuple[float, float]] = None,
+            radius: float = 0.0, limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """
+        分类排行：评分（by='rating'）或知名度（by='prominence'）最高的 POI，按排名顺序
+
+        给出 center 时只看覆盖半径矩形的网格单元（level 5，约 3.5 km；radius 为 0 时只有
+        中心点所在单元），否则为全城排行。结果最多为排行榜长度（metadata.leaderboard_top_n）
+        """
+        entries = self.top_entries(category, by, center, radius, limit)
+        return self.get_many([poi_id for _, poi_id in entries], center)
+
+    def top_entries(self, category: str, by: str = 'rating', center: Optional[Tuple[float, float]] = None,
+                    radius: float = 0.0, limit: int = DEFAULT_LIMIT) -> List[Tuple[float, int]]:
+        """
+        排行中的 (分数, POI ID)
+
+        有排行榜表时在主键上按单元各做一次范围扫描；没有时评分排行退回按分类现场排序
+        """
+        if by not in LEADERBOARD_METRICS:
+            raise ValueError(f'未知的排行方式: {by}')
+        cells, box = leaderboard_cells(center[0], center[1], radius) if center else ([LEADERBOARD_CITY], None)
+        with self.pool.connection() as conn:
+            if self.leaderboard_top_n:
+                return conn.execute(f'''
+                    SELECT score, poi_id FROM poi_leaderboard
+                    WHERE {self.category_column} = ? AND metric = ? AND cell IN ({",".join("?" * len(cells))})
+                    ORDER BY score DESC, poi_id LIMIT ?
+                ''', [self._category_arg(category), by, *cells, limit]).fetchall()
+
+            if by != 'rating':
+                raise ValueError('知名度排行需要排行榜表（extract_poi.py --leaderboard）')
+            sql = f'SELECT rating, id FROM poi WHERE {self.category_column} = ? AND rating IS NOT NULL'
+            args = [self._category_arg(category)]
+            if box is not None:
+                sql += ' AND lat >= ? AND lat < ? AND lon >= ? AND lon < ?'
+                args += list(box)
+            return conn.execute(sql + ' ORDER BY rating DESC, id LIMIT ?', args + [limit]).fetchall()
+
+    def travel_times(self, poi_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        预计算的出行时间 {锚点名称: {出行方式: 秒数}}（extract_poi.py --travel-time）
+
+        超过上限（metadata.travel_max_minutes）或不在路网附近的组合不在结果中
+        """
+        if not self.has_travel_time:
+            return {}
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT a.name, t.mode, t.seconds FROM poi_travel_time t
+                JOIN travel_anchors a ON a.id = t.anchor_id
+                WHERE t.poi_id = ?
+                ORDER BY a.id
+            ''', (poi_id,)).fetchall()
+        times: Dict[str, Dict[str, int]] = {}
+        for anchor, mode, seconds in rows:
+            times.setdefault(anchor, {})[mode] = seconds
+        return times
+
+    def tags(self, poi_id: int) -> Dict[str, str]:
+        """按 ID 获取 POI 的原始 OSM 标签（精简输出不保存标签，返回空字典）"""
+        if not self.tag_keys:
+            return {}
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT tags FROM poi WHERE id = ?', (poi_id,)).fetchone()
+        return decode_tags(row[0], self.tag_keys) if row else {}
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+
+    def _category_arg(self, category: str):
+        """分类过滤参数：精简输出中为分类 ID（未知分类用 -1，不匹配任何记录）"""
+        return self.category_ids.get(category, -1) if self.category_names else category
+
+    def _poi(self, row: Sequence, distance: Optional[float] = None) -> Poi:
+        """查询行转换为 Poi，精简输出中把分类 ID 换回名称"""
+        if self.category_names:
+            row = list(row)
+            row[_CATEGORY_IDX] = self.category_names.get(row[_CATEGORY_IDX], row[_CATEGORY_IDX])
+        return Poi(*row, distance=distance)
+
+    def _box_rows(self, conn: sqlite3.Connection, box: Tuple[float, float, float, float],
+                  category: Optional[str], converted: bool = False) -> List[Tuple]:
+        """
+        矩形范围内的 POI 行：优先使用网格覆盖索引，否则用 R-Tree，都没有时扫描主表
+        （converted 为 True 表示 category 已经是 _category_arg() 转换后的参数）
+        """
+        min_lat, max_lat, min_lon, max_lon = box
+
+        if category and not converted:
+            category = self._category_arg(category)
+
+        if self.has_grid:
+            return self._grid_rows(conn, *grid_cell_ranges(*box), category)
+
+        if self.has_rtree:
+            return self._rtree_rows(conn, [box], category)
+
+        sql = f'SELECT {self._select} FROM poi p WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?'
+        args = [min_lat, max_lat, min_lon, max_lon]
+        if category:
+            sql += f' AND p.{self.category_column} = ?'
+            args.append(category)
+        return conn.execute(sql, args).fetchall()
+
+    def _grid_rows(self, conn: sqlite3.Connection, column: str, ranges: Sequence[Tuple[int, int]],
+                   category, exclude: Optional[Tuple[float, float, float, float]] = None) -> List[Tuple]:
+        """
+        网格单元编号区间内的 POI 行（category 为已转换的分类参数），
+        给出 exclude 时在 SQL 中跳过该矩形内的行
+        """
+        if not ranges:
+            return []
+        args = []
+        for lo, hi in ranges:
+            args += (lo, hi, category) if category else (lo, hi)
+            if exclude:
+                args += exclude
+        sql = grid_nearby_sql(column, len(ranges), self._select, category=bool(category),
+                              category_column=self.category_column, exclude_box=bool(exclude))
+        return conn.execute(sql, args).fetchall()
+
+    def _rtree_rows(self, conn: sqlite3.Connection, boxes: Sequence[Tuple[float, float, float, float]],
+                    category) -> List[Tuple]:
+        """
+        若干矩形内的 POI 行（category 为已转换的分类参数）：每个矩形一次 R-Tree 范围查询，
+        UNION 合并并去掉落在相邻矩形边界上的重复行
+        """
+        # CROSS JOIN 固定先查 R-Tree
+        branch = f'''
+            SELECT {self._p_select} FROM poi_rtree r CROSS JOIN poi p ON p.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?'''
+        if category:
+            branch += f' AND p.{self.category_column} = ?'
+        args = []
+        for min_lat, max_lat, min_lon, max_lon in boxes:
+            args += [min_lat - RTREE_EPSILON, max_lat + RTREE_EPSILON,
+                     min_lon - RTREE_EPSILON, max_lon + RTREE_EPSILON]
+            if category:
+                args.append(category)
+        return conn.execute('\nUNION\n'.join([branch] * len(boxes)), args).fetchall()
+
+    def _within(self, rows: Sequence[Tuple], lat: float, lon: float, radius: float) -> List[Poi]:
+        """按半径过滤并按距离排序"""
+        result = []
+        for row in rows:
+            d = distance(lat, lon, row[_LAT_IDX], row[_LON_IDX])
+            if d <= radius:
+                result.append(self._poi(row, d))
+        result.sort(key=lambda poi: poi.distance)
+        return result
+
+    def _finish(self, rows: Sequence[Tuple], center: Optional[Tuple[float, float]], limit: int) -> List[Poi]:
+        """给出中心点时计算距离并排序，截取前 limit 条"""
+        if center is None:
+            return [self._poi(row) for row in rows[:limit]]
+        pois = [self._poi(row, distance(center[0], center[1], row[_LAT_IDX], row[_LON_IDX]))
+                for row in rows]
+        pois.sort(key=lambda poi: poi.distance)
+        return pois[:limit]
+
+
+class ShardedPoiDatabase:
+    """
+    分片数据库（extract_poi.py --shard 的输出目录）查询接口
+
+    按查询范围选出相交的瓦片，只打开这些分片（最近使用的 max_open 个保持打开），
+    内存和 I/O 与查询范围成正比。各分片的 POI ID 取自完整数据库，合并结果时不会重复
+    """
+
+    def __init__(self, path: str, pool_size: int = 2, max_open: int = 16):
+        manifest_path = os.path.join(path, SHARD_MANIFEST) if os.path.isdir(path) else path
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.directory = os.path.dirname(os.path.abspath(manifest_path))
+        self.tiles = self.manifest['tiles']
+        self.pool_size = pool_size
+        self.max_open = max_open
+        self._open: 'OrderedDict[str, PoiDatabase]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'ShardedPoiDatabase':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for db in self._open.values():
+                db.close()
+            self._open.clear()
+
+    def verify(self) -> List[str]:
+        """按清单校验分片文件的大小和 SHA-256，返回不一致的文件名"""
+        bad = []
+        for tile in self.tiles:
+            path = os.path.join(self.directory, tile['file'])
+            if (not os.path.exists(path) or os.path.getsize(path) != tile['size']
+                    or file_sha256(path) != tile['sha256']):
+                bad.append(tile['file'])
+        return bad
+
+    def tiles_for_box(self, box: Optional[Tuple[float, float, float, float]]) -> List[Dict]:
+        """与矩形 (min_lat, max_lat, min_lon, max_lon) 相交的瓦片，box 为 None 时返回全部"""
+        if box is None:
+            return list(self.tiles)
+        min_lat, max_lat, min_lon, max_lon = box
+        return [tile for tile in self.tiles
+                if tile['bounds'][0] <= max_lon and tile['bounds'][2] >= min_lon
+                and tile['bounds'][1] <= max_lat and tile['bounds'][3] >= min_lat]
+
+    def _shard(self, tile: Dict) -> PoiDatabase:
+        with self._lock:
+            db = self._open.pop(tile['file'], None)
+            if db is None:
+                db = PoiDatabase(os.path.join(self.directory, tile['file']), self.pool_size)
+                if len(self._open) >= self.max_open:
+                    _, oldest = self._open.popitem(last=False)
+                    oldest.close()
+            self._open[tile['file']] = db
+            return db
+
+    def keyword(self, keyword: str, limit: int = DEFAULT_LIMIT,
+                center: Optional[Tuple[float, float]] = None,
+                box: Optional[Tuple[float, float, float, float]] = None) -> List[Poi]:
+        """关键词搜索，只查与 box 相交的分片（未给出时查全部分片）"""
+        results = []
+        for tile in self.tiles_for_box(box):
+            results += self._shard(tile).keyword(keyword, limit, center)
+            if center is None and len(results) >= limit:
+                break
+        if center is not None:
+            results.sort(key=lambda poi: poi.distance)
+        return results[:limit]
+
+    def nearby(self, lat: float, lon: float, radius: float = DEFAULT_RADIUS_METERS,
+               category: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """半径范围内的 POI，按距离排序"""
+        radius = min(max(radius, 100.0), MAX_RADIUS_METERS)
+        results = []
+        for tile in self.tiles_for_box(bounding_box(lat, lon, radius)):
+            results += self._shard(tile).nearby(lat, lon, radius, category, limit)
+        results.sort(key=lambda poi: poi.distance)
+        return results[:limit]
+
+    def category(self, category: str, center: Optional[Tuple[float, float]] = None,
+                 limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """分类搜索：给出 center 时为 k 近邻，否则依次从各分片取"""
+        if center is not None:
+            return self.knn(center[0], center[1], limit, category=category)
+        results = []
+        for tile in self.tiles:
+            results += self._shard(tile).category(category, limit=limit - len(results))
+            if len(results) >= limit:
+                break
+        return results
+
+    def category_counts(self, box: Tuple[float, float, float, float]) -> Dict[str, int]:
+        """矩形范围内各主分类的 POI 数：与范围相交的各分片分别统计后相加"""
+        counts = Counter()
+        for tile in self.tiles_for_box(box):
+            counts.update(self._shard(tile).category_counts(box))
+        return dict(counts)
+
+    def knn(self, lat: float, lon: float, k: int = DEFAULT_LIMIT, category: Optional[str] = None,
+            max_radius: float = MAX_RADIUS_METERS) -> List[Poi]:
+        """
+        k 近邻搜索：与 PoiDatabase.knn 相同的逐圈扩大（knn_rings），每圈只查与新增环形相交的分片，
+        各分片只读取自己范围内的环形（分片之间 POI 不重复，合并后即为全局候选）
+        """
+        def fetch(box, prev_box):
+            hits = []
+            for tile in self.tiles_for_box(box):
+                hits += self._shard(tile).ring(lat, lon, box, prev_box, category)
+            return hits
+
+        radius = self.estimate_radius(lat, lon, k, category) or KNN_START_RADIUS
+        return [poi for _, poi in knn_rings(fetch, lat, lon, k, radius, max_radius)]
+
+    def estimate_radius(self, lat: float, lon: float, k: int,
+                        category: Optional[str] = None) -> Optional[float]:
+        """
+        按各分片的密度直方图估算包含约 k 个 POI 的半径（米，见 density_radius），
+        每个单元的计数为与之相交的各分片计数之和；中心点不在任何分片内或分片没有直方图时返回 None
+        """
+        tiles = self.tiles_for_box((lat, lat, lon, lon))
+        levels = self._shard(tiles[0]).density_levels if tiles else None
+        if not levels:
+            return None
+
+        def cell_count(level, row, col0, col1):
+            n = 1 << level
+            box = (row / n - 90.0, (row + 1) / n - 90.0, col0 / n - 180.0, (col1 + 1) / n - 180.0)
+            return sum(self._shard(tile).density_count(level, row, col0, col1, category)
+                       for tile in self.tiles_for_box(box))
+
+        return density_radius(lat, lon, k, levels, cell_count)
+
+    def top(self, category: str, by: str = 'rating', center: Optional[Tuple[float, float]] = None,
+            radius: float = 0.0, limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """
+        分类排行：合并各分片的排行（各分片前 limit 名的并集包含全局前 limit 名）
+
+        给出 center 时只查与所选网格单元相交的分片，否则查全部分片
+        """
+        box = leaderboard_cells(center[0], center[1], radius)[1] if center else None
+        entries = []
+        for tile in self.tiles_for_box(box):
+            entries += [(score, poi_id, tile)
+                        for score, poi_id in self._shard(tile).top_entries(category, by, center, radius, limit)]
+        entries.sort(key=lambda entry: (-entry[0], entry[1]))
+        entries = entries[:limit]
+
+        by_id = {}
+        for tile in {id(entry[2]): entry[2] for entry in entries}.values():
+            ids = [poi_id for _, poi_id, t in entries if t is tile]
+            by_id.update((poi.id, poi) for poi in self._shard(tile).get_many(ids, center))
+        return [by_id[poi_id] for _, poi_id, _ in entries if poi_id in by_id]
+
+
+class PoiPack:
+    """
+    二进制 POI 包（extract_poi.py --pack）的只读查询
+
+    文件整体 mmap，记录区按 int32 / uint32 / uint16 三种方式 cast 为 memoryview，
+    查询时按网格目录定位相交单元的连续记录区间，逐条只读取坐标和分类做过滤，
+    只有命中的记录才解码字符串生成 Poi。打开文件只读取文件头和分类表。
+    记录按小端序存储，memoryview 按本机字节序读取（x86、ARM 均为小端）。
+    包中没有全文索引和排行榜，因此没有 keyword() / top() / category_counts()，命令行对 .pack 输入拒绝这些命令
+    """
+
+    _INTS = PACK_RECORD.size // 4
+    _SHORTS = PACK_RECORD.size // 2
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, record_size, self.count, category_count, self.level, self.row0, self.col0,
+         self.rows, self.cols, categories_off, directory_off, records_off, strings_off,
+         strings_size) = PACK_HEADER.unpack_from(self.mm, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION or record_size != PACK_RECORD.size:
+            self.close()
+            raise ValueError(f'不支持的 POI 包: {path}')
+
+        self.scale = float(1 << self.level)
+        view = memoryview(self.mm)
+        records = view[records_off:records_off + self.count * record_size]
+        self._views = [view, records]
+        self.directory = self._cast(view[directory_off:directory_off + (self.rows * self.cols + 1) * 4], 'I')
+        self.ints = self._cast(records, 'i')
+        self.uints = self._cast(records, 'I')
+        self.shorts = self._cast(records, 'H')
+        self.strings = self._cast(view[strings_off:strings_off + strings_size], 'B')
+        category_refs = self._cast(view[categories_off:categories_off + category_count * 4], 'I')
+        self.categories = [self._string(ref) for ref in category_refs]
+        self.category_ids = {name: i for i, name in enumerate(self.categories)}
+
+    def _cast(self, view: memoryview, fmt: str) -> memoryview:
+        cast = view.cast(fmt)
+        self._views.append(cast)
+        return cast
+
+    def __enter__(self) -> 'PoiPack':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # mmap 关闭前须释放全部 memoryview
+        for view in reversed(getattr(self, '_views', [])):
+            view.release()
+        self._views = []
+        self.mm.close()
+        self.file.close()
+
+    def _string(self, ref: int) -> Optional[str]:
+        if ref == PACK_NONE:
+            return None
+        length = self.strings[ref] | (self.strings[ref + 1] << 8)
+        return str(self.strings[ref + 2:ref + 2 + length], 'utf-8')
+
+    def _poi(self, i: int, distance: Optional[float] = None) -> Poi:
+        u = self.uints
+        base = i * self._INTS
+        rating = self.shorts[i * self._SHORTS + self._SHORTS - 1]
+        return Poi(
+            u[base + 2], self._string(u[base + 3]),
+            self.categories[self.shorts[i * self._SHORTS + self._SHORTS - 2]],
+            self.ints[base] / PACK_COORD_SCALE, self.ints[base + 1] / PACK_COORD_SCALE,
+            self._string(u[base + 4]), self._string(u[base + 5]), self._string(u[base + 6]),
+            self._string(u[base + 7]), self._string(u[base + 8]),
+            None if rating == PACK_NO_RATING else rating / 100, distance=distance,
+        )
+
+    def _box_hits(self, box: Tuple[float, float, float, float], category: Optional[int], lat: float, lon: float,
+                  prev_box: Optional[Tuple[float, float, float, float]] = None) -> List[Tuple[float, int]]:
+        """
+        矩形范围内的 (距离, 记录下标)，未排序；给出 prev_box 时跳过其中的记录
+        （k 近邻上一圈已读取的范围，完全落在其中的单元不再遍历）
+        """
+        min_lat, max_lat, min_lon, max_lon = box
+        r0 = max(int((min_lat + 90.0) * self.scale) - self.row0, 0)
+        r1 = min(int((max_lat + 90.0) * self.scale) - self.row0, self.rows - 1)
+        c0 = max(int((min_lon + 180.0) * self.scale) - self.col0, 0)
+        c1 = min(int((max_lon + 180.0) * self.scale) - self.col0, self.cols - 1)
+        lat_lo, lat_hi = min_lat * PACK_COORD_SCALE, max_lat * PACK_COORD_SCALE
+        lon_lo, lon_hi = min_lon * PACK_COORD_SCALE, max_lon * PACK_COORD_SCALE
+        if prev_box:
+            # 完全在 prev_box 内的单元行列（两端各让出一格，同 ring_cell_ranges）
+            inner_r0 = int((prev_box[0] + 90.0) * self.scale) - self.row0 + 1
+            inner_r1 = int((prev_box[1] + 90.0) * self.scale) - self.row0 - 1
+            inner_c0 = int((prev_box[2] + 180.0) * self.scale) - self.col0 + 1
+            inner_c1 = int((prev_box[3] + 180.0) * self.scale) - self.col0 - 1
+            prev = [v * PACK_COORD_SCALE for v in prev_box]
+        ints, shorts, directory = self.ints, self.shorts, self.directory
+        step, cat_idx = self._INTS, self._SHORTS - 2
+        hits = []
+        for row in range(r0, r1 + 1):
+            cell = row * self.cols
+            if prev_box and inner_r0 <= row <= inner_r1 and inner_c0 <= inner_c1:
+                spans = ((c0, min(c1, inner_c0 - 1)), (max(c0, inner_c1 + 1), c1))
+            else:
+                spans = ((c0, c1),)
+            for span0, span1 in spans:
+                if span0 > span1:
+                    continue
+                for i in range(directory[cell + span0], directory[cell + span1 + 1]):
+                    y = ints[i * step]
+                    if y < lat_lo or y > lat_hi:
+                        continue
+                    x = ints[i * step + 1]
+                    if x < lon_lo or x > lon_hi:
+                        continue
+                    if prev_box and prev[0] <= y <= prev[1] and prev[2] <= x <= prev[3]:
+                        continue
+                    if category is not None and shorts[i * self._SHORTS + cat_idx] != category:
+                        continue
+                    hits.append((distance(lat, lon, y / PACK_COORD_SCALE, x / PACK_COORD_SCALE), i))
+        return hits
+
+    def _category_arg(self, category: Optional[str]) -> Optional[int]:
+        """分类下标，未知分类用 -1（不匹配任何记录）"""
+        if not category:
+            return None
+        return self.category_ids.get(category, -1)
+
+    def nearby(self, lat: float, lon: float, radius: float = DEFAULT_RADIUS_METERS,
+               category: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """半径范围内的 POI，按距离排序"""
+        radius = min(max(radius, 100.0), MAX_RADIUS_METERS)
+        hits = self._box_hits(bounding_box(lat, lon, radius), self._category_arg(category), lat, lon)
+        hits = sorted(hit for hit in hits if hit[0] <= radius)
+        return [self._poi(i, d) for d, i in hits[:limit]]
+
+    def knn(self, lat: float, lon: float, k: int = DEFAULT_LIMIT, category: Optional[str] = None,
+            max_radius: float = MAX_RADIUS_METERS) -> List[Poi]:
+        """k 近邻搜索（逐圈扩大半径见 knn_rings，初始半径见 estimate_radius）"""
+        category_id = self._category_arg(category)
+        hits = knn_rings(lambda box, prev_box: self._box_hits(box, category_id, lat, lon, prev_box),
+                         lat, lon, k, self.estimate_radius(lat, lon, k, category), max_radius)
+        return [self._poi(i, d) for d, i in hits]
+
+    def estimate_radius(self, lat: float, lon: float, k: int, category: Optional[str] = None) -> float:
+        """
+        按网格目录中的单元记录数估算包含约 k 个 POI 的半径（米，见 density_radius）
+
+        包中只有一级网格，较粗的两级（与密度直方图一样每级相差 4 倍）由细单元汇总；
+        不按分类时单元记录数由目录偏移直接相减，按分类时遍历单元内记录的分类
+        """
+        levels = [self.level - shift for shift in (4, 2, 0) if self.level >= shift]
+        category_id = self._category_arg(category)
+        directory, shorts = self.directory, self.shorts
+        cat_idx = self._SHORTS - 2
+
+        def cell_count(level, row, col0, col1):
+            shift = self.level - level
+            r0 = max((row << shift) - self.row0, 0)
+            r1 = min(((row + 1) << shift) - 1 - self.row0, self.rows - 1)
+            c0 = max((col0 << shift) - self.col0, 0)
+            c1 = min(((col1 + 1) << shift) - 1 - self.col0, self.cols - 1)
+            if c0 > c1:
+                return 0
+            total = 0
+            for r in range(r0, r1 + 1):
+                start, end = directory[r * self.cols + c0], directory[r * self.cols + c1 + 1]
+                if category_id is None:
+                    total += end - start
+                else:
+                    total += sum(1 for i in range(start, end) if shorts[i * self._SHORTS + cat_idx] == category_id)
+            return total
+
+        return density_radius(lat, lon, k, levels, cell_count)
+
+    def category(self, category: str, center: Optional[Tuple[float, float]] = None,
+                 limit: int = DEFAULT_LIMIT) -> List[Poi]:
+        """分类搜索：给出 center 时为该分类的 k 近邻，否则按存储顺序返回"""
+        if center is not None:
+            return self.knn(center[0], center[1], limit, category=category)
+        category_id = self._category_arg(category)
+        result = []
+        for i in range(self.count):
+            if self.shorts[i * self._SHORTS + self._SHORTS - 2] == category_id:
+                result.append(self._poi(i))
+                if len(result) >= limit:
+                    break
+        return result
+
+
+def open_database(path: str) -> 'PoiDatabase | ShardedPoiDatabase | PoiPack':
+    """打开单个数据库文件、二进制 POI 包，或分片目录 / manifest.json"""
+    if os.path.isdir(path) or path.endswith('.json'):
+        return ShardedPoiDatabase(path)
+    if path.endswith('.pack'):
+        return PoiPack(path)
+    return PoiDatabase(path)
+
+
+def print_results(pois: List[Poi]):
+    for poi in pois:
+        dist = f"{poi.distance:8.0f} m  " if poi.distance is not None else ''
+        rating = f"  评分 {poi.rating:g}" if poi.rating is not None else ''
+        print(f"  {dist}[{poi.id}] {poi.name} ({poi.main_category}) {poi.lat:.6f}, {poi.lon:.6f}{rating}")
+    print(f"共 {len(pois)} 条")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POI 数据库查询')
+    parser.add_argument('--db', required=True, help='POI 数据库文件、二进制包 (.pack)，或分片目录 / manifest.json')
+    parser.add_argument('-n', '--limit', type=int, default=DEFAULT_LIMIT, help='返回结果数量')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('keyword', help='关键词搜索')
+    p.add_argument('keyword')
+    p.add_argument('--center', type=float, nargs=2, metavar=('LAT', 'LON'))
+
+    p = sub.add_parser('nearby', help='附近搜索')
+    p.add_argument('lat', type=float)
+    p.add_argument('lon', type=float)
+    p.add_argument('--radius', type=float, default=DEFAULT_RADIUS_METERS, help='半径（米）')
+    p.add_argument('--category', help='主分类')
+
+    p = sub.add_parser('category', help='分类搜索')
+    p.add_argument('category')
+    p.add_argument('--center', type=float, nargs=2, metavar=('LAT', 'LON'))
+
+    p = sub.add_parser('knn', help='k 近邻搜索')
+    p.add_argument('lat', type=float)
+    p.add_argument('lon', type=float)
+    p.add_argument('-k', type=int, default=5)
+    p.add_argument('--category', help='主分类')
+
+    p = sub.add_parser('counts', help='范围内各分类数量')
+    p.add_argument('min_lat', type=float)
+    p.add_argument('max_lat', type=float)
+    p.add_argument('min_lon', type=float)
+    p.add_argument('max_lon', type=float)
+
+    p = sub.add_parser('top', help='分类排行（评分 / 知名度）')
+    p.add_argument('category')
+    p.add_argument('--by', choices=LEADERBOARD_METRICS, default='rating', help='排行方式')
+    p.add_argument('--center', type=float, nargs=2, metavar=('LAT', 'LON'), help='只看中心点附近的网格单元')
+    p.add_argument('--radius', type=float, default=0.0, help='覆盖半径（米），默认只看中心点所在单元')
+
+    p = sub.add_parser('travel', help='预计算的出行时间')
+    p.add_argument('poi_id', type=int)
+
+    args = parser.parse_args()
+
+    with open_database(args.db) as db:
+        if args.command == 'travel':
+            if not isinstance(db, PoiDatabase):
+                parser.error('出行时间查询需要单个数据库文件')
+            times = db.travel_times(args.poi_id)
+            for anchor, modes in times.items():
+                print(f"  {anchor}: " + '  '.join(f"{mode} {seconds / 60:.1f} 分钟" for mode, seconds in modes.items()))
+            if not times:
+                print("没有出行时间记录")
+            return
+        if args.command in ('keyword', 'top', 'counts') and isinstance(db, PoiPack):
+            parser.error('二进制 POI 包不支持关键词搜索、分类排行和分类数量统计')
+        if args.command == 'counts':
+            counts = db.category_counts((args.min_lat, args.max_lat, args.min_lon, args.max_lon))
+            for category, count in sorted(counts.items(), key=lambda item: -item[1]):
+                print(f"  {category}: {count}")
+            print(f"共 {sum(counts.values())} 条")
+            return
+        if args.command == 'keyword':
+            pois = db.keyword(args.keyword, args.limit, args.center)
+        elif args.command == 'nearby':
+            pois = db.nearby(args.lat, args.lon, args.radius, args.category, args.limit)
+        elif args.command == 'category':
+            pois = db.category(args.category, args.center, args.limit)
+        elif args.command == 'top':
+            pois = db.top(args.category, args.by, args.center, args.radius, args.limit)
+        else:
+            pois = db.knn(args.lat, args.lon, args.k, args.category)
+
+    print_results(pois)
+
+
+if __name__ == '__main__':
+    main()